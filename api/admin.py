@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, UserProfile, Scan, Appointment, Payment, Notification, Consultation, Doctor, XRayImage, Creator
+from .models import User, UserProfile, Scan, Appointment, Payment, Notification, NotificationArchive, Consultation, Doctor, DoctorLanguage, DoctorReview, DicomInstance, MediaBlob, UploadSession, XRayImage, Creator
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
@@ -29,12 +29,19 @@ class UserProfileAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'user__email', 'phone_number')
     raw_id_fields = ('user',)
 
+class DoctorLanguageInline(admin.TabularInline):
+    model = DoctorLanguage
+    extra = 0
+    readonly_fields = ('language',)
+    can_delete = False
+
 @admin.register(Doctor)
 class DoctorAdmin(admin.ModelAdmin):
-    list_display = ('user', 'specialty', 'years_of_experience', 'gender', 'age', 'rating', 'is_accepting_new_patients')
+    list_display = ('user', 'specialty', 'years_of_experience', 'gender', 'age', 'rating', 'review_count', 'total_consultations', 'is_accepting_new_patients')
     list_filter = ('specialty', 'gender', 'is_accepting_new_patients')
     search_fields = ('user__username', 'user__first_name', 'user__last_name', 'license_number', 'bio', 'education', 'languages')
     raw_id_fields = ('user',)
+    inlines = [DoctorLanguageInline]
 
 @admin.register(Scan)
 class ScanAdmin(admin.ModelAdmin):
@@ -64,6 +71,34 @@ class NotificationAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'title', 'message')
     raw_id_fields = ('user',)
 
+@admin.register(NotificationArchive)
+class NotificationArchiveAdmin(admin.ModelAdmin):
+    list_display = ('user', 'period', 'notification_count', 'created_at')
+    list_filter = ('period',)
+    search_fields = ('user__username', 'user__email')
+    raw_id_fields = ('user',)
+    exclude = ('payload',)
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'ref_count', 'created_at')
+    search_fields = ('name', 'sha256')
+    readonly_fields = ('name', 'sha256', 'size', 'created_at')
+
+@admin.register(DicomInstance)
+class DicomInstanceAdmin(admin.ModelAdmin):
+    list_display = ('patient_name', 'patient_id', 'modality', 'study_date', 'status', 'uploaded_by', 'created_at')
+    list_filter = ('status', 'modality')
+    search_fields = ('patient_name', 'patient_id', 'study_instance_uid', 'sop_instance_uid')
+    raw_id_fields = ('uploaded_by', 'scan')
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'user', 'purpose', 'total_size', 'status', 'created_at', 'expires_at')
+    list_filter = ('status', 'purpose')
+    search_fields = ('filename', 'user__username')
+    raw_id_fields = ('user',)
+
 @admin.register(Consultation)
 class ConsultationAdmin(admin.ModelAdmin):
     list_display = ('patient', 'doctor', 'consultation_type', 'status', 'created_at')
@@ -71,6 +106,13 @@ class ConsultationAdmin(admin.ModelAdmin):
     search_fields = ('patient__username', 'doctor__username', 'notes')
     raw_id_fields = ('patient', 'doctor', 'scan')
 
+@admin.register(DoctorReview)
+class DoctorReviewAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'patient', 'rating', 'created_at')
+    list_filter = ('rating', 'created_at')
+    search_fields = ('doctor__username', 'patient__username', 'comment')
+    raw_id_fields = ('consultation', 'patient', 'doctor')
+
 @admin.register(XRayImage)
 class XRayImageAdmin(admin.ModelAdmin):
     list_display = ('appointment', 'patient', 'assistant', 'upload_date')
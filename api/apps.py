@@ -1,4 +1,8 @@
 from django.apps import AppConfig
+from django.conf import settings
+import logging
+
+logger = logging.getLogger('api')
 
 
 class ApiConfig(AppConfig):
@@ -7,3 +11,9 @@ class ApiConfig(AppConfig):
 
     def ready(self):
         import api.signals
+
+        if settings.CELERY_TASK_ALWAYS_EAGER:
+            logger.warning(
+                "CELERY_TASK_ALWAYS_EAGER is on: image optimization, thumbnails and DICOM "
+                "processing run inside the request that uploads them. Do not use this in production."
+            )
@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count
+from django.utils.http import parse_etags
+from urllib.parse import urlencode
+import hashlib
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+SPECIALTY_COUNTS_KEY = 'doctors:specialties'
+DIRECTORY_VERSION_KEY = 'doctors:directory-version'
+
+def get_specialty_counts():
+    """
+    Return the doctor count per specialty, computed with a single grouped
+    query and served from the cache until the directory is invalidated.
+    """
+    data = cache.get(SPECIALTY_COUNTS_KEY)
+    if data is None:
+        from .models import Doctor
+
+        counts = dict(
+            Doctor.objects.filter(user__is_active=True)
+            .order_by()
+            .values_list('specialty')
+            .annotate(count=Count('id'))
+        )
+        data = {
+            code: {'name': name, 'count': counts.get(code, 0)}
+            for code, name in Doctor.SPECIALTY_CHOICES
+        }
+        cache.set(SPECIALTY_COUNTS_KEY, data, settings.DOCTOR_DIRECTORY_CACHE_TTL)
+    return data
+
+def get_directory_version():
+    """
+    Return the current doctor directory version. Cached directory responses
+    are keyed by this version, so bumping it invalidates all of them at once.
+    """
+    version = cache.get(DIRECTORY_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a version lost to eviction never reuses an old key
+        cache.add(DIRECTORY_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(DIRECTORY_VERSION_KEY)
+    return version
+
+def directory_cache_key(view_name, scope, query_params):
+    """Build a cache key for a directory response from its filter parameters"""
+    query = urlencode(sorted(
+        (key, value) for key in query_params for value in query_params.getlist(key)
+    ))
+    digest = hashlib.md5(query.encode('utf-8')).hexdigest()
+    return f"doctors:directory:{get_directory_version()}:{scope}:{view_name}:{digest}"
+
+def get_cached_directory(key, build):
+    """
+    Return {'data': ..., 'etag': ...} for a directory response, calling
+    build() to produce the serialized data on a cache miss.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        data = build()
+        body = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+        entry = {
+            'data': data,
+            'etag': f'"{hashlib.md5(body.encode("utf-8")).hexdigest()}"',
+        }
+        cache.set(key, entry, settings.DOCTOR_DIRECTORY_CACHE_TTL)
+    return entry
+
+def get_doctor_suggestions(specialties, limit, build):
+    """
+    Return the top `limit` ranked doctor suggestions for a set of specialties,
+    calling build() on a cache miss. Entries follow the directory version and
+    expire after DOCTOR_SUGGESTION_CACHE_TTL so consultation load stays fresh.
+    """
+    key = f"doctors:suggestions:{get_directory_version()}:{','.join(sorted(specialties))}:{limit}"
+    suggestions = cache.get(key)
+    if suggestions is None:
+        suggestions = build()
+        cache.set(key, suggestions, settings.DOCTOR_SUGGESTION_CACHE_TTL)
+    return suggestions
+
+def etag_matches(etag, if_none_match):
+    """Weak comparison of an ETag against an If-None-Match header value"""
+    if not if_none_match:
+        return False
+    candidates = parse_etags(if_none_match)
+    return '*' in candidates or etag in [candidate.removeprefix('W/') for candidate in candidates]
+
+def invalidate_doctor_directory():
+    """Drop cached doctor directory data after a doctor or doctor user changes"""
+    cache.delete(SPECIALTY_COUNTS_KEY)
+    try:
+        cache.incr(DIRECTORY_VERSION_KEY)
+    except ValueError:
+        cache.set(DIRECTORY_VERSION_KEY, time.time_ns(), None)
+    logger.debug("Invalidated doctor directory cache")
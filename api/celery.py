@@ -3,7 +3,7 @@ from celery import Celery
 from django.conf import settings
 
 # Set the default Django settings module for the 'celery' program.
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_new.settings')
 
 app = Celery('api')
 
@@ -28,6 +28,18 @@ app.conf.beat_schedule = {
         'task': 'api.tasks.send_appointment_reminder',
         'schedule': 300.0,  # Run every 5 minutes
     },
+    'archive-read-notifications': {
+        'task': 'api.tasks.archive_read_notifications',
+        'schedule': 86400.0,  # Run once a day
+    },
+    'reconcile-doctor-stats': {
+        'task': 'api.tasks.reconcile_doctor_stats',
+        'schedule': 86400.0,  # Run once a day
+    },
+    'cleanup-upload-sessions': {
+        'task': 'api.tasks.cleanup_upload_sessions',
+        'schedule': 3600.0,  # Run every hour
+    },
 }
 
 # Configure Celery settings
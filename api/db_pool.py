@@ -0,0 +1,35 @@
+"""
+Metrics for the PostgreSQL connection pools configured by DATABASE_POOL.
+Pools are per process, so the numbers describe the worker that reports them.
+"""
+from django.db import connections
+
+
+def pool_stats():
+    """Checkout, wait and connection counters for each pooled database alias"""
+    stats = {}
+    for alias in connections:
+        connection = connections[alias]
+        if connection.vendor != 'postgresql' or not connection.settings_dict['OPTIONS'].get('pool'):
+            continue
+        raw = connection.pool.get_stats()
+        checkouts = raw.get('requests_num', 0)
+        wait_ms = raw.get('requests_wait_ms', 0)
+        stats[alias] = {
+            'min_size': raw.get('pool_min'),
+            'max_size': raw.get('pool_max'),
+            'size': raw.get('pool_size', 0),
+            'available': raw.get('pool_available', 0),
+            'checkouts': checkouts,
+            'waits': raw.get('requests_queued', 0),
+            'waiting': raw.get('requests_waiting', 0),
+            'wait_ms': wait_ms,
+            'avg_wait_ms': round(wait_ms / checkouts, 2) if checkouts else 0,
+            'timeouts': raw.get('requests_errors', 0),
+            'usage_ms': raw.get('usage_ms', 0),
+            'connections_opened': raw.get('connections_num', 0),
+            'connection_errors': raw.get('connections_errors', 0),
+            'connections_lost': raw.get('connections_lost', 0),
+            'returned_bad': raw.get('returns_bad', 0),
+        }
+    return stats
@@ -0,0 +1,99 @@
+"""
+Primary/replica database routing.
+
+Reads go to a healthy replica from DATABASE_REPLICAS and writes to the
+primary ('default'). Only web requests use the replicas: Celery tasks and
+management commands usually act on rows that were just written, so outside
+a request everything stays on the primary. Once a request writes, or opens
+a transaction on the primary, its remaining reads are pinned to the primary
+so it sees its own writes. api.middleware.ReplicaPinningMiddleware also
+pins the same user's following requests for DATABASE_REPLICA_PIN_SECONDS,
+long enough for the replicas to catch up.
+"""
+from contextvars import ContextVar
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger('api')
+
+_pinned = ContextVar('db_pinned_to_primary', default=True)
+
+# alias -> (checked at, healthy), per process
+_replica_health = {}
+
+# Lag of a Postgres standby, or 0 when it has replayed everything received
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def begin_request(pinned=False):
+    """Begin a request that may read from the replicas; returns a token for end_request"""
+    return _pinned.set(pinned)
+
+
+def end_request(token):
+    """Return to the primary-only state outside requests"""
+    _pinned.reset(token)
+
+
+def replica_lag(alias):
+    """Seconds the replica is behind the primary; other backends are only checked for reachability"""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor != 'postgresql':
+            cursor.execute('SELECT 1')
+            return 0
+        cursor.execute(POSTGRES_LAG_SQL)
+        return float(cursor.fetchone()[0] or 0)
+
+
+def replica_is_healthy(alias):
+    """Whether a replica is reachable and within DATABASE_REPLICA_MAX_LAG, checked at most every few seconds"""
+    now = time.monotonic()
+    checked_at, healthy = _replica_health.get(alias, (None, True))
+    if checked_at is not None and now - checked_at < settings.DATABASE_REPLICA_CHECK_INTERVAL:
+        return healthy
+    try:
+        lag = replica_lag(alias)
+        healthy = lag <= settings.DATABASE_REPLICA_MAX_LAG
+        if not healthy:
+            logger.warning(f"Replica {alias} is {lag:.1f}s behind, reading from the primary")
+    except Exception as e:
+        healthy = False
+        logger.warning(f"Replica {alias} is unavailable, reading from the primary: {str(e)}")
+    _replica_health[alias] = (now, healthy)
+    return healthy
+
+
+class PrimaryReplicaRouter:
+    """Send reads to a replica and writes to the primary (see module docstring)"""
+
+    def db_for_read(self, model, **hints):
+        if _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = [alias for alias in settings.DATABASE_REPLICAS if replica_is_healthy(alias)]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        return db not in settings.DATABASE_REPLICAS
+
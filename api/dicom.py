@@ -0,0 +1,179 @@
+from datetime import datetime
+from io import BytesIO
+import logging
+
+import numpy as np
+import pydicom
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from PIL import Image
+from pydicom.errors import InvalidDicomError
+from pydicom.pixel_data_handlers.util import apply_modality_lut, apply_voi_lut
+
+logger = logging.getLogger('api')
+
+# DICOM Part 10 files carry a 128 byte preamble followed by this marker
+DICOM_MAGIC = b'DICM'
+DICOM_MAGIC_OFFSET = 128
+
+
+class DuplicateDicomError(Exception):
+    """The SOP instance has been uploaded before"""
+
+    def __init__(self, instance):
+        super().__init__(f'SOP instance {instance.sop_instance_uid} already uploaded')
+        self.instance = instance
+
+
+def is_dicom(file):
+    """Check the Part 10 marker without reading past the first 132 bytes"""
+    position = file.tell() if hasattr(file, 'tell') else None
+    try:
+        file.seek(0)
+        header = file.read(DICOM_MAGIC_OFFSET + len(DICOM_MAGIC))
+    finally:
+        if position is not None:
+            file.seek(position)
+    return header[DICOM_MAGIC_OFFSET:] == DICOM_MAGIC
+
+
+def _text(dataset, keyword, max_length=None):
+    value = dataset.get(keyword)
+    if value is None or value == '':
+        return ''
+    value = str(value).strip()
+    return value[:max_length] if max_length else value
+
+
+def _number(dataset, keyword):
+    value = dataset.get(keyword)
+    if value is None or value == '':
+        return None
+    # Window values may be multi-valued; the first pair is the default
+    if isinstance(value, pydicom.multival.MultiValue):
+        value = value[0] if len(value) else None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _date(dataset, keyword):
+    value = _text(dataset, keyword)
+    try:
+        return datetime.strptime(value[:8], '%Y%m%d').date() if value else None
+    except ValueError:
+        return None
+
+
+def read_dicom_header(file):
+    """
+    Parse the metadata of a DICOM file, stopping before the pixel data so
+    only the header is read however large the study is. Large non-pixel
+    elements are deferred rather than loaded. Raises InvalidDicomError.
+    """
+    file.seek(0)
+    dataset = pydicom.dcmread(file, stop_before_pixels=True, defer_size='64 KB')
+    if not _text(dataset, 'SOPInstanceUID'):
+        raise InvalidDicomError('DICOM file has no SOP Instance UID')
+
+    transfer_syntax = ''
+    if getattr(dataset, 'file_meta', None) is not None:
+        transfer_syntax = _text(dataset.file_meta, 'TransferSyntaxUID', 64)
+
+    return {
+        'sop_instance_uid': _text(dataset, 'SOPInstanceUID', 64),
+        'study_instance_uid': _text(dataset, 'StudyInstanceUID', 64),
+        'series_instance_uid': _text(dataset, 'SeriesInstanceUID', 64),
+        'patient_id': _text(dataset, 'PatientID', 64),
+        'patient_name': _text(dataset, 'PatientName', 255),
+        'patient_sex': _text(dataset, 'PatientSex', 16),
+        'patient_birth_date': _date(dataset, 'PatientBirthDate'),
+        'study_date': _date(dataset, 'StudyDate'),
+        'study_description': _text(dataset, 'StudyDescription', 255),
+        'modality': _text(dataset, 'Modality', 16),
+        'body_part': _text(dataset, 'BodyPartExamined', 64),
+        'view_position': _text(dataset, 'ViewPosition', 16),
+        'rows': dataset.get('Rows'),
+        'columns': dataset.get('Columns'),
+        'bits_stored': dataset.get('BitsStored'),
+        'photometric_interpretation': _text(dataset, 'PhotometricInterpretation', 16),
+        'window_center': _number(dataset, 'WindowCenter'),
+        'window_width': _number(dataset, 'WindowWidth'),
+        'transfer_syntax': transfer_syntax,
+    }
+
+
+def _to_uint8(dataset):
+    """Apply the modality and VOI (window) LUTs and scale to 8 bits"""
+    pixels = dataset.pixel_array
+    if int(dataset.get('NumberOfFrames', 1) or 1) > 1:
+        # Multi-frame: preview the first frame
+        pixels = pixels[0]
+    if pixels.ndim == 3:
+        # Colour data: nothing to window, hand it over as RGB
+        return Image.fromarray(pixels.astype(np.uint8), 'RGB')
+
+    pixels = apply_modality_lut(pixels, dataset)
+    windowed = 'WindowCenter' in dataset or 'VOILUTSequence' in dataset
+    if windowed:
+        pixels = apply_voi_lut(pixels, dataset)
+    pixels = pixels.astype(np.float64)
+    if windowed:
+        low, high = pixels.min(), pixels.max()
+    else:
+        # No window in the file: clip the extreme tails instead
+        low, high = np.percentile(pixels, (0.5, 99.5))
+    scale = 255.0 / (high - low) if high > low else 0.0
+    pixels = np.clip((pixels - low) * scale, 0, 255).astype(np.uint8)
+    if _text(dataset, 'PhotometricInterpretation') == 'MONOCHROME1':
+        pixels = 255 - pixels
+    return Image.fromarray(pixels, 'L')
+
+
+def render_dicom(file):
+    """
+    Decode a DICOM file into a windowed JPEG preview and an 8-bit PNG
+    rendition for the ML service. Returns (preview_bytes, rendition_bytes).
+    """
+    file.seek(0)
+    dataset = pydicom.dcmread(file)
+    image = _to_uint8(dataset)
+
+    rendition = image.copy()
+    rendition.thumbnail((settings.DICOM_RENDITION_SIZE, settings.DICOM_RENDITION_SIZE), Image.LANCZOS)
+    rendition_buffer = BytesIO()
+    rendition.save(rendition_buffer, format='PNG', optimize=True)
+
+    preview = image.copy()
+    preview.thumbnail((settings.DICOM_PREVIEW_SIZE, settings.DICOM_PREVIEW_SIZE), Image.LANCZOS)
+    preview_buffer = BytesIO()
+    preview.convert('RGB').save(preview_buffer, format='JPEG', quality=85, optimize=True)
+
+    return preview_buffer.getvalue(), rendition_buffer.getvalue()
+
+
+def ingest_dicom(file, user):
+    """
+    Validate and store an uploaded DICOM file with its parsed header, then
+    queue rendering of the preview and ML rendition.
+    """
+    from .models import DicomInstance
+    from .tasks import process_dicom
+
+    if not is_dicom(file):
+        raise InvalidDicomError('File is not a DICOM Part 10 file')
+    header = read_dicom_header(file)
+    existing = DicomInstance.objects.filter(sop_instance_uid=header['sop_instance_uid']).first()
+    if existing is not None:
+        raise DuplicateDicomError(existing)
+    file.seek(0)
+    try:
+        # Savepoint so a losing race also rolls back the stored file's reference
+        with transaction.atomic():
+            instance = DicomInstance.objects.create(uploaded_by=user, file=file, **header)
+    except IntegrityError:
+        # The same instance was uploaded concurrently since the check above
+        raise DuplicateDicomError(DicomInstance.objects.get(sop_instance_uid=header['sop_instance_uid']))
+    transaction.on_commit(lambda: process_dicom.delay(instance.pk), robust=True)
+    return instance
@@ -1,5 +1,9 @@
 from django_filters import rest_framework as filters
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+from rest_framework.filters import SearchFilter
 from .models import Scan, Appointment, Payment
+from .search import doctor_search_index
 
 class ScanFilter(filters.FilterSet):
     start_date = filters.DateFilter(field_name='upload_date', lookup_expr='gte')
@@ -27,4 +31,47 @@ class PaymentFilter(filters.FilterSet):
     
     class Meta:
         model = Payment
-        fields = ['start_date', 'end_date', 'status', 'payment_method'] 
\ No newline at end of file
+        fields = ['start_date', 'end_date', 'status', 'payment_method']
+
+class DoctorSearchFilter(SearchFilter):
+    """
+    Ranked, typo tolerant search over Doctor.search_document.
+
+    On PostgreSQL this uses full-text search plus trigram word similarity,
+    both backed by GIN indexes. Elsewhere it falls back to the in-process
+    inverted index in api.search.
+    """
+    trigram_threshold = 0.3
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        query = ' '.join(search_terms)
+
+        if connection.vendor == 'postgresql':
+            return self.filter_postgres(queryset, query)
+
+        doctor_ids = doctor_search_index.search(query)
+        if not doctor_ids:
+            return queryset.none()
+        ranking = Case(
+            *[When(pk=doctor_id, then=position) for position, doctor_id in enumerate(doctor_ids)],
+            output_field=IntegerField(),
+        )
+        return queryset.filter(pk__in=doctor_ids).annotate(search_position=ranking).order_by('search_position')
+
+    def filter_postgres(self, queryset, query):
+        from django.contrib.postgres.search import (
+            SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+        )
+
+        vector = SearchVector('search_document', config='english')
+        search_query = SearchQuery(query, config='english', search_type='websearch')
+        return queryset.annotate(
+            search=vector,
+            search_rank=SearchRank(vector, search_query),
+            search_similarity=TrigramWordSimilarity(query, 'search_document'),
+        ).filter(
+            Q(search=search_query) | Q(search_document__trigram_word_similar=query)
+        ).order_by('-search_rank', '-search_similarity')
@@ -0,0 +1,491 @@
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified, StreamingHttpResponse
+
+from .cache import etag_matches
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UpstreamError(Exception):
+    """The upstream server answered with something other than an image"""
+
+    def __init__(self, status_code):
+        super().__init__(f'Failed to fetch image, status code: {status_code}')
+        self.status_code = status_code
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, argument = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"')
+    return directives
+
+
+def freshness_lifetime(headers):
+    """
+    Seconds an upstream response may be served without revalidation, or None
+    if it must not be stored by a shared cache at all.
+    """
+    directives = parse_cache_control(headers.get('Cache-Control'))
+    if 'no-store' in directives or 'private' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0
+    for name in ('s-maxage', 'max-age'):
+        if directives.get(name, '').isdigit():
+            return int(directives[name])
+    expires = headers.get('Expires')
+    if expires:
+        try:
+            return max(0, int(parsedate_to_datetime(expires).timestamp() - time.time()))
+        except (TypeError, ValueError):
+            return 0
+    return settings.IMAGE_PROXY_DEFAULT_TTL
+
+
+def guess_content_type(url, content_type):
+    if content_type and content_type.startswith('image/'):
+        return content_type
+    content_type, _ = mimetypes.guess_type(url)
+    if content_type and content_type.startswith('image/'):
+        return content_type
+    return 'image/jpeg'
+
+
+class ImageProxyCache:
+    """
+    Size-capped on-disk LRU cache of proxied images. Each URL maps to a body
+    file and a JSON metadata file; the body's mtime is bumped on every hit so
+    eviction removes the least recently served entries first.
+
+    The directory is shared by every process, but each one keeps its own
+    running total of the cache size: the total from its last scan plus what
+    it has written since. The directory is only walked, and entries evicted,
+    when that total passes the cap or the last scan is older than
+    IMAGE_PROXY_EVICT_INTERVAL, which bounds how far other processes' writes
+    can push the cache over its cap. Eviction frees space down to
+    EVICT_TO of the cap so a full cache isn't rescanned on every write.
+    """
+    EVICT_TO = 0.9
+
+    def __init__(self, directory, max_bytes, max_entry_bytes, evict_interval):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.evict_interval = evict_interval
+        self._evict_lock = threading.Lock()
+        self._size_lock = threading.Lock()
+        self._total = None  # bytes, or None until the first scan
+        self._scanned_at = 0
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key[:2], key)
+        return base + '.img', base + '.json'
+
+    def get(self, url):
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            os.utime(body_path)
+        except (OSError, ValueError):
+            return None
+        meta['path'] = body_path
+        return meta
+
+    def refresh(self, url, meta, lifetime):
+        """Extend an entry after the upstream confirmed it is unchanged"""
+        meta['expires_at'] = time.time() + lifetime
+        self._write_meta(url, meta)
+        return meta
+
+    def _write_meta(self, url, meta):
+        _, meta_path = self._paths(url)
+        meta = {key: value for key, value in meta.items() if key != 'path'}
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(meta_path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f)
+        os.replace(temp_path, meta_path)
+
+    def reserve(self, url):
+        """Open a temp file next to the entry; promoted by commit()"""
+        body_path, _ = self._paths(url)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(body_path), suffix='.part')
+        return os.fdopen(fd, 'wb'), temp_path
+
+    def commit(self, url, temp_path, meta):
+        body_path, _ = self._paths(url)
+        try:
+            replaced = os.stat(body_path).st_size
+        except OSError:
+            replaced = 0
+        os.replace(temp_path, body_path)
+        self._write_meta(url, meta)
+        self._added(meta['size'] - replaced)
+
+    def _added(self, size):
+        with self._size_lock:
+            if self._total is not None:
+                self._total += size
+            due = (
+                self._total is None
+                or self._total > self.max_bytes
+                or time.monotonic() - self._scanned_at > self.evict_interval
+            )
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits its size cap"""
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith('.img'):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+            if total > self.max_bytes:
+                total = self._remove_oldest(entries, total)
+            with self._size_lock:
+                self._total = total
+                self._scanned_at = time.monotonic()
+        finally:
+            self._evict_lock.release()
+
+    def _remove_oldest(self, entries, total):
+        for _, size, path in sorted(entries):
+            for target in (path, path[:-len('.img')] + '.json'):
+                try:
+                    os.remove(target)
+                except OSError:
+                    pass
+            total -= size
+            if total <= self.max_bytes * self.EVICT_TO:
+                break
+        return total
+
+
+image_proxy_cache = ImageProxyCache(
+    settings.IMAGE_PROXY_CACHE_DIR,
+    settings.IMAGE_PROXY_CACHE_MAX_BYTES,
+    settings.IMAGE_PROXY_MAX_IMAGE_BYTES,
+    settings.IMAGE_PROXY_EVICT_INTERVAL,
+)
+
+
+class UpstreamResponse:
+    """A streamed upstream response that gives its host slot back when closed"""
+
+    def __init__(self, response, release):
+        self._response = response
+        self._release = release
+        self.status_code = response.status_code
+        self.headers = response.headers
+
+    def iter_content(self, chunk_size):
+        return self._response.iter_content(chunk_size)
+
+    def close(self):
+        if self._release is None:
+            return
+        try:
+            self._response.close()
+        finally:
+            self._release()
+            self._release = None
+
+
+class UpstreamClient:
+    """
+    Shared pooled HTTP client for the image proxy. Connections are kept alive
+    per host and the number of concurrent fetches from any one host is capped;
+    callers queue for a slot up to IMAGE_PROXY_QUEUE_TIMEOUT seconds. The pool
+    and the caps are per process, so a host sees up to
+    workers x IMAGE_PROXY_MAX_CONNECTIONS_PER_HOST fetches.
+    """
+
+    def __init__(self, max_per_host, pool_hosts, connect_timeout, read_timeout, queue_timeout):
+        self.max_per_host = max_per_host
+        self.timeout = (connect_timeout, read_timeout)
+        self.queue_timeout = queue_timeout
+        self.session = requests.Session()
+        # Never carry one user's upstream cookies over to another
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(
+            pool_connections=pool_hosts,
+            pool_maxsize=max_per_host,
+            max_retries=Retry(total=1, read=0, status=0, backoff_factor=0.2, allowed_methods=['GET']),
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._slots = {}
+        self._slots_lock = threading.Lock()
+
+    def _slot(self, host):
+        with self._slots_lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._slots[host]
+
+    def get(self, url, headers=None):
+        host = urlsplit(url).netloc.lower()
+        slot = self._slot(host)
+        if not slot.acquire(timeout=self.queue_timeout):
+            logger.warning(f"Image proxy gave up waiting for a connection to {host}")
+            raise UpstreamError(503)
+        try:
+            response = self.session.get(url, stream=True, timeout=self.timeout, headers=headers)
+        except Exception:
+            slot.release()
+            raise
+        return UpstreamResponse(response, slot.release)
+
+
+upstream_client = UpstreamClient(
+    settings.IMAGE_PROXY_MAX_CONNECTIONS_PER_HOST,
+    settings.IMAGE_PROXY_POOL_HOSTS,
+    settings.IMAGE_PROXY_CONNECT_TIMEOUT,
+    settings.IMAGE_PROXY_TIMEOUT,
+    settings.IMAGE_PROXY_QUEUE_TIMEOUT,
+)
+
+
+class UpstreamBody:
+    """
+    Response body that relays upstream chunks to the client, optionally
+    teeing them into the cache. Closing it, whether the transfer finished or
+    the client went away, releases the upstream connection and runs on_close.
+    """
+
+    def __init__(self, upstream, cache=None, url=None, meta=None):
+        self.upstream = upstream
+        self.cache = cache
+        self.url = url
+        self.meta = meta
+        self.on_close = None
+        self._writer = self._temp_path = None
+        if cache is not None:
+            self._writer, self._temp_path = cache.reserve(url)
+        self._digest = hashlib.sha256()
+        self._size = 0
+        self._complete = False
+        self._closed = False
+
+    def __iter__(self):
+        for chunk in self.upstream.iter_content(CHUNK_SIZE):
+            self._size += len(chunk)
+            if self._writer is not None and self._size > self.cache.max_entry_bytes:
+                self._discard()
+            if self._writer is not None:
+                self._writer.write(chunk)
+                self._digest.update(chunk)
+            yield chunk
+        self._complete = True
+        self.close()
+
+    def _discard(self):
+        self._writer.close()
+        self._writer = None
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.upstream.close()
+            if self._writer is not None and self._complete:
+                self._writer.close()
+                self.meta['size'] = self._size
+                self.meta['etag'] = self.meta.get('etag') or f'"{self._digest.hexdigest()}"'
+                self.cache.commit(self.url, self._temp_path, self.meta)
+            elif self._writer is not None:
+                self._discard()
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+
+class FetchCoalescer:
+    """
+    Tracks URLs currently being fetched into the cache so that concurrent
+    misses for the same URL wait for the first fetch instead of repeating it.
+    Only requests served by the same process are coalesced; each process
+    makes at most one fetch of a URL at a time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def claim(self, key):
+        """Return (is_leader, event); followers wait on the event"""
+        with self._lock:
+            event = self._inflight.get(key)
+            if event is not None:
+                return False, event
+            event = self._inflight[key] = threading.Event()
+            return True, event
+
+    def release(self, key):
+        with self._lock:
+            event = self._inflight.pop(key, None)
+        if event is not None:
+            event.set()
+
+
+fetch_coalescer = FetchCoalescer()
+
+
+def _client_headers(response, meta):
+    remaining = max(0, int(meta.get('expires_at', 0) - time.time()))
+    if meta.get('etag'):
+        response['ETag'] = meta['etag']
+    if meta.get('last_modified'):
+        response['Last-Modified'] = meta['last_modified']
+    response['Cache-Control'] = f'private, max-age={remaining}'
+    return response
+
+
+def _serve_cached(meta, if_none_match):
+    if meta.get('etag') and etag_matches(meta['etag'], if_none_match):
+        return _client_headers(HttpResponseNotModified(), meta)
+    try:
+        body = open(meta['path'], 'rb')
+    except OSError:
+        # Evicted between the metadata lookup and now
+        return None
+    return _client_headers(FileResponse(body, content_type=meta['content_type']), meta)
+
+
+def _is_fresh(meta):
+    return meta is not None and meta.get('expires_at', 0) > time.time()
+
+
+def proxy_image_response(url, headers=None, if_none_match=None, cacheable=True):
+    """
+    Serve an upstream image, from the on-disk cache when fresh, revalidating
+    stale entries with the upstream validators and streaming misses through
+    to the client in chunks. Concurrent misses for the same URL share a
+    single upstream fetch.
+    """
+    cached = image_proxy_cache.get(url) if cacheable else None
+    if _is_fresh(cached):
+        response = _serve_cached(cached, if_none_match)
+        if response is not None:
+            return response
+
+    if not cacheable:
+        response, _ = _fetch(url, headers, None, if_none_match, cacheable=False)
+        return response
+
+    leader, event = fetch_coalescer.claim(url)
+    if not leader:
+        event.wait(settings.IMAGE_PROXY_TIMEOUT)
+        cached = image_proxy_cache.get(url)
+        if _is_fresh(cached):
+            response = _serve_cached(cached, if_none_match)
+            if response is not None:
+                return response
+        response, _ = _fetch(url, headers, cached, if_none_match)
+        return response
+
+    release = lambda: fetch_coalescer.release(url)
+    try:
+        response, body = _fetch(url, headers, cached, if_none_match)
+    except Exception:
+        release()
+        raise
+    if body is None:
+        release()
+    else:
+        body.on_close = release
+    return response
+
+
+def _fetch(url, headers, cached, if_none_match, cacheable=True):
+    """Fetch from upstream; returns the response and its streaming body, if any"""
+    headers = dict(headers or {})
+    if cached:
+        if cached.get('upstream_etag'):
+            headers['If-None-Match'] = cached['upstream_etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    upstream = upstream_client.get(url, headers=headers)
+
+    if upstream.status_code == 304 and cached:
+        upstream.close()
+        lifetime = freshness_lifetime(upstream.headers)
+        cached = image_proxy_cache.refresh(url, cached, lifetime or 0)
+        response = _serve_cached(cached, if_none_match)
+        if response is not None:
+            return response, None
+        # The entry was evicted meanwhile; fetch it again unconditionally
+        return _fetch(url, {k: v for k, v in headers.items() if not k.startswith('If-')}, None, if_none_match, cacheable)
+
+    if upstream.status_code != 200:
+        upstream.close()
+        raise UpstreamError(upstream.status_code)
+
+    content_type = guess_content_type(url, upstream.headers.get('Content-Type'))
+    upstream_etag = upstream.headers.get('ETag')
+    lifetime = freshness_lifetime(upstream.headers) if cacheable else None
+    meta = {
+        'url': url,
+        'content_type': content_type,
+        'etag': upstream_etag,
+        'upstream_etag': upstream_etag,
+        'last_modified': upstream.headers.get('Last-Modified'),
+        'expires_at': time.time() + (lifetime or 0),
+    }
+
+    if upstream_etag and etag_matches(upstream_etag, if_none_match):
+        upstream.close()
+        return _client_headers(HttpResponseNotModified(), meta), None
+
+    length = upstream.headers.get('Content-Length')
+    too_large = length and length.isdigit() and int(length) > image_proxy_cache.max_entry_bytes
+    if lifetime is None or too_large:
+        body = UpstreamBody(upstream)
+        response = StreamingHttpResponse(body, content_type=content_type)
+        response['Cache-Control'] = 'no-store'
+    else:
+        body = UpstreamBody(upstream, image_proxy_cache, url, meta)
+        response = _client_headers(StreamingHttpResponse(body, content_type=content_type), meta)
+    if length and length.isdigit() and not upstream.headers.get('Content-Encoding'):
+        response['Content-Length'] = length
+    return response, body
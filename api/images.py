@@ -0,0 +1,259 @@
+from io import BytesIO
+import logging
+import os
+import posixpath
+import struct
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, storages
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .media import signed_media_url
+from .storage import media_file_fields, retain_media, release_media, upload_directory
+
+logger = logging.getLogger('api')
+
+# Derivatives live in their own tree so they never collide with uploads
+DERIVATIVES_DIR = 'derivatives'
+
+# JPEG APPn segments kept when stripping metadata: JFIF, the ICC profile and
+# Adobe's (which says how to interpret the colour channels)
+JPEG_KEPT_SEGMENTS = ((0xE0, b'JFIF\x00'), (0xE2, b'ICC_PROFILE\x00'), (0xEE, b'Adobe'))
+
+EXIF_ORIENTATION = 0x0112
+
+# Formats rendered for every size; WebP first since it is the preferred variant
+DERIVATIVE_FORMATS = {
+    'webp': {'extension': 'webp', 'options': {'quality': 80, 'method': 4}},
+    'jpeg': {'extension': 'jpg', 'options': {'quality': 82, 'optimize': True, 'progressive': True}},
+}
+
+
+def get_thumbnail_sizes():
+    return getattr(settings, 'PROFILE_THUMBNAIL_SIZES', {'small': 64, 'medium': 256, 'large': 512})
+
+
+def derivative_name(name, size_label, fmt):
+    """Storage name of a derivative, e.g. derivatives/profile_pictures/a_small.webp"""
+    stem, _ = os.path.splitext(name)
+    extension = DERIVATIVE_FORMATS[fmt]['extension']
+    return f"{DERIVATIVES_DIR}/{stem}_{size_label}.{extension}"
+
+
+def derivative_source_stem(name):
+    """
+    The stem (name without extension) of the upload a derivative was rendered
+    from, or None if the name isn't a derivative of a configured size/format.
+    """
+    prefix = f"{DERIVATIVES_DIR}/"
+    if not name.startswith(prefix):
+        return None
+    stem, extension = os.path.splitext(name[len(prefix):])
+    if extension[1:] not in {spec['extension'] for spec in DERIVATIVE_FORMATS.values()}:
+        return None
+    for size_label in get_thumbnail_sizes():
+        if stem.endswith(f"_{size_label}"):
+            return stem[:-len(size_label) - 1]
+    return None
+
+
+def _completion_marker(name):
+    # The largest JPEG is written last, so its presence means the set is complete
+    sizes = get_thumbnail_sizes()
+    largest = max(sizes, key=sizes.get)
+    return derivative_name(name, largest, 'jpeg')
+
+
+def derivative_storage():
+    # Derivatives keep fixed names, so they bypass the content-addressed default
+    return storages['derivatives']
+
+
+def derivatives_exist(name):
+    return bool(name) and derivative_storage().exists(_completion_marker(name))
+
+
+def _flatten(image):
+    """Convert to RGB, compositing transparency onto white for JPEG output"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert('RGB')
+
+
+def generate_derivatives(name):
+    """Render every configured size and format for a stored image"""
+    with default_storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    image = _flatten(image)
+
+    storage = derivative_storage()
+    created = []
+    sizes = sorted(get_thumbnail_sizes().items(), key=lambda item: item[1])
+    for size_label, size in sizes:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size), Image.LANCZOS)
+        for fmt, spec in DERIVATIVE_FORMATS.items():
+            buffer = BytesIO()
+            thumbnail.save(buffer, format=fmt.upper(), **spec['options'])
+            target = derivative_name(name, size_label, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(buffer.getvalue()))
+            created.append(target)
+    logger.info(f"Generated {len(created)} derivatives for {name}")
+    return created
+
+
+def delete_derivatives(name):
+    """Remove every derivative of an image, e.g. when it is replaced"""
+    if not name:
+        return
+    storage = derivative_storage()
+    for size_label in get_thumbnail_sizes():
+        for fmt in DERIVATIVE_FORMATS:
+            target = derivative_name(name, size_label, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+
+
+def derivative_urls(field_file, request=None):
+    """
+    Map each thumbnail size to signed WebP and JPEG URLs. Until the
+    derivatives have been generated every size points at the original upload.
+    """
+    if not field_file:
+        return None
+
+    sizes = get_thumbnail_sizes()
+    if not derivatives_exist(field_file.name):
+        original = signed_media_url(field_file, request)
+        return {label: {fmt: original for fmt in DERIVATIVE_FORMATS} for label in sizes}
+
+    return {
+        label: {
+            fmt: signed_media_url(derivative_name(field_file.name, label, fmt), request)
+            for fmt in DERIVATIVE_FORMATS
+        }
+        for label in sizes
+    }
+
+
+def strip_jpeg_metadata(data):
+    """
+    Drop EXIF, XMP, comments and other APPn segments from a JPEG by copying
+    the segments it needs, leaving the compressed image data untouched. An
+    EXIF orientation other than upright is carried over on its own, after
+    the JFIF header if there is one, which must come first.
+    """
+    orientation = Image.open(BytesIO(data)).getexif().get(EXIF_ORIENTATION, 1)
+    output = [data[:2]]
+    exif_segment = None
+    if orientation != 1:
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = orientation
+        payload = exif.tobytes()
+        exif_segment = b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # Fill byte
+            position += 1
+            continue
+        if exif_segment and marker != 0xE0:
+            output.append(exif_segment)
+            exif_segment = None
+        if marker == 0xDA:
+            # Start of scan: the rest is entropy-coded data
+            output.append(data[position:])
+            return b''.join(output)
+        length = struct.unpack('>H', data[position + 2:position + 4])[0]
+        segment = data[position:position + 2 + length]
+        metadata = marker == 0xFE or 0xE0 <= marker <= 0xEF
+        if not metadata or any(marker == code and segment[4:4 + len(tag)] == tag for code, tag in JPEG_KEPT_SEGMENTS):
+            output.append(segment)
+        position += 2 + length
+    return None
+
+
+def recompress_png(data):
+    """
+    Re-encode a PNG with maximum compression and without text/EXIF chunks.
+    Returns None if the result would not decode to the same pixels.
+    """
+    image = Image.open(BytesIO(data))
+    if getattr(image, 'is_animated', False):
+        return None
+    image.load()
+    options = {'optimize': True}
+    for key in ('transparency', 'icc_profile', 'dpi'):
+        if key in image.info:
+            options[key] = image.info[key]
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', **options)
+
+    result = Image.open(BytesIO(buffer.getvalue()))
+    if result.mode != image.mode or result.size != image.size or result.tobytes() != image.tobytes():
+        return None
+    return buffer.getvalue()
+
+
+def optimize_image_bytes(data):
+    """Losslessly smaller encoding of a JPEG or PNG, or None if there is none"""
+    if data.startswith(b'\xff\xd8\xff'):
+        optimized = strip_jpeg_metadata(data)
+    elif data.startswith(b'\x89PNG\r\n\x1a\n'):
+        optimized = recompress_png(data)
+    else:
+        return None
+    return optimized if optimized is not None and len(optimized) < len(data) else None
+
+
+def optimize_stored_image(name):
+    """
+    Replace a stored upload by its optimized encoding. The new file is saved
+    alongside, then every row still pointing at the old name is switched
+    over with a compare-and-swap update, so a picture replaced in the
+    meantime is left alone. Returns the name the rows now use, or None if
+    they had all moved on already.
+
+    The old file is released but not deleted: a request still holding the
+    instance can save the old name back, so removing it is left to
+    collect_media_garbage once nothing references it.
+    """
+    with default_storage.open(name, 'rb') as f:
+        data = f.read()
+    optimized = optimize_image_bytes(data)
+    if optimized is None:
+        return name
+
+    extension = os.path.splitext(name)[1]
+    new_name = default_storage.save(
+        posixpath.join(upload_directory(name), f"optimized{extension}"), ContentFile(optimized)
+    )
+    with transaction.atomic():
+        switched = 0
+        for model, field in media_file_fields():
+            switched += model.objects.filter(**{field: name}).update(**{field: new_name})
+
+    if not switched:
+        default_storage.delete(new_name)
+        return None
+    # save() took the first reference to the new file; each switched row
+    # moves one reference from the old file to the new one
+    for _ in range(switched - 1):
+        retain_media(new_name)
+    for _ in range(switched):
+        release_media(name)
+    logger.info(f"Optimized {name} -> {new_name}: {len(data)} -> {len(optimized)} bytes")
+    return new_name
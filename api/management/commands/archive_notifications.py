@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+from api.models import Notification, NotificationArchive
+import logging
+
+logger = logging.getLogger('api')
+
+class Command(BaseCommand):
+    help = 'Moves read notifications past the retention age into compressed archive storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.NOTIFICATION_RETENTION_DAYS,
+            help=f'Archive read notifications older than this many days (default: {settings.NOTIFICATION_RETENTION_DAYS})'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of notifications moved per transaction (default: 500)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many notifications would be archived without moving them'
+        )
+
+    def handle(self, *args, **options):
+        cutoff_date = timezone.now() - timedelta(days=options['days'])
+        self.stdout.write(f"Archiving read notifications created before {cutoff_date}")
+
+        if options['dry_run']:
+            count = Notification.objects.filter(is_read=True, created_at__lt=cutoff_date).count()
+            self.stdout.write(f"Would archive {count} notifications")
+            return
+
+        count = NotificationArchive.archive_read_notifications(cutoff_date, batch_size=options['batch_size'])
+        logger.info(f"Archived {count} read notifications")
+        self.stdout.write(self.style.SUCCESS(f"Archived {count} notifications"))
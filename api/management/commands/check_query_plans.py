@@ -0,0 +1,158 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+from api.views import (
+    AppointmentViewSet,
+    ConsultationViewSet,
+    NotificationViewSet,
+    PaymentViewSet,
+    ScanViewSet,
+    XRayImageViewSet
+)
+import logging
+import re
+import uuid
+
+logger = logging.getLogger('api')
+
+User = get_user_model()
+
+# (endpoint, viewset, action, role of the requesting user, the queryset the
+# action runs). Actions that filter beyond get_queryset() do it in a
+# *_queryset method of the viewset, called both here and by the action;
+# None checks the list queryset.
+CHECKS = [
+    ('GET /api/notifications/', NotificationViewSet, 'list', 'patient', None),
+    ('Notification unread count', NotificationViewSet, 'list', 'patient', lambda view: view.unread_queryset()),
+    ('GET /api/appointments/', AppointmentViewSet, 'list', 'patient', None),
+    ('GET /api/appointments/check-upcoming/', AppointmentViewSet, 'check_upcoming', 'patient',
+     lambda view: view.upcoming_queryset()),
+    ('GET /api/appointments/taken-slots/', AppointmentViewSet, 'taken_slots', 'patient',
+     lambda view: view.taken_slots_queryset(timezone.localdate())),
+    ('GET /api/consultations/ (doctor)', ConsultationViewSet, 'list', 'doctor', None),
+    ('GET /api/consultations/ (patient)', ConsultationViewSet, 'list', 'patient', None),
+    ('GET /api/consultations/upcoming/ (doctor)', ConsultationViewSet, 'upcoming', 'doctor',
+     lambda view: view.upcoming_queryset()),
+    ('GET /api/scans/', ScanViewSet, 'list', 'patient', None),
+    ('GET /api/xray-images/ (patient)', XRayImageViewSet, 'list', 'patient', None),
+    ('GET /api/xray-images/ (assistant)', XRayImageViewSet, 'list', 'assistant', None),
+    ('GET /api/payments/', PaymentViewSet, 'list', 'patient', None),
+]
+
+# A Postgres plan node that reads a table, e.g. "->  Index Scan Backward using idx on api_scan"
+POSTGRES_SCAN_RE = re.compile(r'\b(Seq Scan|Index Only Scan|Index Scan|Bitmap Heap Scan)\b(?: Backward)?(?: using \S+)? on (\w+)')
+
+
+def unindexed_reads(plan, vendor, table):
+    """
+    Tables the plan reads without an index condition narrowing the rows: a
+    full table scan, or a walk of a whole index filtering rows as it goes,
+    which is what an ordering index or the primary key falls back to when
+    no index fits the filter. The queried table itself must be reached
+    through an index condition.
+    """
+    unindexed, indexed = [], set()
+    if vendor == 'postgresql':
+        # [node, table, has Index Cond] for each scan node, with the detail
+        # lines below a node ("Index Cond:", "Filter:") attributed to it
+        scans = []
+        current = None
+        for number, line in enumerate(plan.splitlines()):
+            if number == 0 or '->' in line:
+                match = POSTGRES_SCAN_RE.search(line)
+                current = [match.group(1), match.group(2), False] if match else None
+                if current:
+                    scans.append(current)
+            elif current and line.strip().startswith('Index Cond:'):
+                current[2] = True
+        for node, scanned, has_condition in scans:
+            if node == 'Bitmap Heap Scan' or has_condition:
+                indexed.add(scanned)
+            else:
+                unindexed.append(scanned)
+    else:
+        # SQLite: "SEARCH table USING INDEX idx (col=?)" looks rows up by
+        # key; "SCAN table", with or without "USING INDEX", reads them all
+        for match in re.finditer(r'\b(SCAN|SEARCH) (\w+)', plan):
+            kind, scanned = match.groups()
+            if scanned == 'CONSTANT':
+                continue
+            if kind == 'SEARCH':
+                indexed.add(scanned)
+            else:
+                unindexed.append(scanned)
+    if table not in indexed and table not in unindexed:
+        unindexed.append(table)
+    return list(dict.fromkeys(unindexed))
+
+
+def sorts(plan, vendor):
+    if vendor == 'postgresql':
+        return bool(re.search(r'^\s*(->\s*)?Sort\b', plan, re.MULTILINE))
+    return 'TEMP B-TREE FOR ORDER BY' in plan
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN on the main query of the busiest endpoints and fails if an index does not serve its filter'
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f"Query plan checks support SQLite and PostgreSQL, not {vendor}")
+
+        factory = APIRequestFactory()
+        users = {}
+        failures = 0
+        for endpoint, viewset, action, role, action_queryset in CHECKS:
+            if role not in users:
+                users[role] = User.objects.filter(role=role, is_active=True, is_staff=False).order_by('pk').first()
+            user = users[role]
+            if user is None:
+                self.stdout.write(self.style.WARNING(f"SKIP  {endpoint}: no active {role} user to run it as"))
+                continue
+
+            view = viewset(action_map={'get': action})
+            view.request = view.initialize_request(factory.get('/'))
+            view.request.user = user
+            view.format_kwarg = None
+            view.kwargs = {}
+            if action_queryset is None:
+                queryset = view.filter_queryset(view.get_queryset())
+            else:
+                queryset = action_queryset(view)
+
+            plan = self.explain(queryset, vendor)
+            scanned = unindexed_reads(plan, vendor, queryset.model._meta.db_table)
+            if scanned:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"FAIL  {endpoint}: no index condition on {', '.join(scanned)}"))
+            else:
+                note = ' (sorts in memory)' if sorts(plan, vendor) else ''
+                self.stdout.write(self.style.SUCCESS(f"OK    {endpoint}{note}"))
+            if options['verbosity'] >= 2 or scanned:
+                for line in plan.splitlines():
+                    self.stdout.write(f"        {line}")
+
+        if failures:
+            logger.warning(f"{failures} endpoint queries are not served by an index")
+            raise CommandError(f"{failures} of {len(CHECKS)} queries read a table without an index condition")
+        self.stdout.write(self.style.SUCCESS("Every checked query uses an index"))
+
+    def explain(self, queryset, vendor):
+        if vendor != 'postgresql':
+            # SQLite plans EXPLAIN QUERY PLAN when it is prepared, and sqlite3
+            # reuses prepared statements by their text, so a repeated check
+            # could report a plan from before an index was created or dropped
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql} -- {uuid.uuid4().hex}', params)
+                return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+        # Small tables make sequential scans cheapest; rule them out so the
+        # plan shows whether an index can serve the query at all (without
+        # one, Postgres walks a whole index instead, which still fails)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
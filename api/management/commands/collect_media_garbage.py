@@ -0,0 +1,178 @@
+from collections import Counter
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.models import MediaBlob
+from api.images import derivative_source_stem
+from api.storage import media_file_fields
+import logging
+import os
+import posixpath
+import shutil
+import time
+
+logger = logging.getLogger('api')
+
+
+class Command(BaseCommand):
+    help = 'Deletes (or quarantines) files under MEDIA_ROOT that no database row references'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report orphaned files without removing them'
+        )
+        parser.add_argument(
+            '--quarantine',
+            action='store_true',
+            help=f'Move orphans to MEDIA_QUARANTINE_DIR ({settings.MEDIA_QUARANTINE_DIR}) instead of deleting them'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of orphans removed per batch (default: 500)'
+        )
+        parser.add_argument(
+            '--min-age-hours',
+            type=float,
+            default=settings.MEDIA_GC_MIN_AGE_HOURS,
+            help='Leave files younger than this alone, as their rows may not be committed yet '
+                 f'(default: {settings.MEDIA_GC_MIN_AGE_HOURS})'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        quarantine_dir = settings.MEDIA_QUARANTINE_DIR if options['quarantine'] else None
+        batch_size = options['batch_size']
+        cutoff = time.time() - options['min_age_hours'] * 3600
+
+        # Mark: every name a file field points at, streamed from the database
+        references = Counter()
+        for model, field in media_file_fields():
+            names = (
+                model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .values_list(field, flat=True).iterator(chunk_size=2000)
+            )
+            references.update(names)
+        referenced_stems = {posixpath.splitext(name)[0] for name in references}
+        self.stdout.write(f"{len(references)} files referenced by the database")
+
+        # Sweep: walk MEDIA_ROOT and remove whatever wasn't marked
+        scanned = orphaned = removed = 0
+        orphan_bytes = reclaimed_bytes = 0
+        batch = []
+        for name, path, size, mtime in self.walk(settings.MEDIA_ROOT, skip=quarantine_dir):
+            scanned += 1
+            if name in references:
+                continue
+            stem = derivative_source_stem(name)
+            if stem is not None and stem in referenced_stems:
+                continue
+            if mtime > cutoff:
+                continue
+            orphaned += 1
+            orphan_bytes += size
+            if dry_run:
+                self.stdout.write(f"  {name} ({size} bytes)")
+                continue
+            batch.append((name, path, size))
+            if len(batch) >= batch_size:
+                count, size = self.remove_batch(batch, quarantine_dir)
+                removed += count
+                reclaimed_bytes += size
+                batch = []
+        if batch:
+            count, size = self.remove_batch(batch, quarantine_dir)
+            removed += count
+            reclaimed_bytes += size
+
+        if dry_run:
+            self.stdout.write(
+                f"Scanned {scanned} files: {orphaned} orphaned, "
+                f"{orphan_bytes / (1024 * 1024):.2f} MB would be reclaimed"
+            )
+            return
+
+        fixed = self.reconcile_reference_counts(references)
+        action = f"Quarantined in {quarantine_dir}" if quarantine_dir else "Deleted"
+        logger.info(f"Media garbage collection: {removed} orphans removed, {reclaimed_bytes} bytes reclaimed")
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {scanned} files. {action} {removed} orphans, "
+            f"reclaimed {reclaimed_bytes / (1024 * 1024):.2f} MB; corrected {fixed} reference counts"
+        ))
+
+    def walk(self, root, skip=None):
+        """Yield (name, path, size, mtime) for every file below root, via os.scandir"""
+        skip = os.path.realpath(skip) if skip else None
+        pending = [root]
+        while pending:
+            directory = pending.pop()
+            try:
+                entries = os.scandir(directory)
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if os.path.realpath(entry.path) != skip:
+                            pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        name = os.path.relpath(entry.path, root).replace(os.sep, '/')
+                        yield name, entry.path, stat.st_size, stat.st_mtime
+
+    def remove_batch(self, batch, quarantine_dir):
+        """Delete or quarantine one batch of orphans; returns (count, bytes)"""
+        # Content-addressed uploads reuse an existing file, so an identical
+        # upload since the mark phase may have started referencing one of these
+        names = [name for name, _, _ in batch]
+        still_referenced = set()
+        for model, field in media_file_fields():
+            still_referenced.update(
+                model.objects.filter(**{f'{field}__in': names}).values_list(field, flat=True)
+            )
+
+        removed = []
+        reclaimed = 0
+        for name, path, size in batch:
+            if name in still_referenced:
+                continue
+            try:
+                if quarantine_dir:
+                    target = os.path.join(quarantine_dir, name)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.move(path, target)
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                self.stdout.write(self.style.WARNING(f"Could not remove {name}: {e}"))
+                continue
+            removed.append(name)
+            reclaimed += size
+
+        MediaBlob.objects.filter(name__in=removed).delete()
+        self.stdout.write(f"  removed {len(removed)} orphans ({reclaimed / (1024 * 1024):.2f} MB)")
+        return len(removed), reclaimed
+
+    def reconcile_reference_counts(self, references):
+        """
+        Bring MediaBlob counts in line with the rows found in the mark phase;
+        bulk and cascaded deletes skip the storage and leave them too high.
+        Each update only applies if the count is unchanged since it was read.
+        """
+        fixed = 0
+        for blob in MediaBlob.objects.only('pk', 'name', 'ref_count').iterator(chunk_size=2000):
+            actual = references.get(blob.name, 0)
+            if actual == blob.ref_count:
+                continue
+            if actual == 0:
+                # A file too young to sweep may belong to a row not committed yet
+                if os.path.exists(os.path.join(settings.MEDIA_ROOT, blob.name)):
+                    continue
+                fixed += MediaBlob.objects.filter(pk=blob.pk, ref_count=blob.ref_count).delete()[0]
+            else:
+                fixed += MediaBlob.objects.filter(pk=blob.pk, ref_count=blob.ref_count).update(ref_count=actual)
+        return fixed
@@ -0,0 +1,146 @@
+from collections import defaultdict
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from api.models import MediaBlob
+from api.images import delete_derivatives
+from api.storage import content_addressed_name, is_content_addressed, hash_file, media_file_fields
+import logging
+import os
+import posixpath
+import shutil
+import tempfile
+
+logger = logging.getLogger('api')
+
+
+class Command(BaseCommand):
+    help = 'Moves existing uploads into content-addressed names, merging duplicates and rebuilding reference counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be merged without moving files or updating rows'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        names = set()
+        for model, field in media_file_fields():
+            names.update(
+                model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).values_list(field, flat=True)
+            )
+
+        # Work out the content-addressed name of every referenced file
+        renames = {}
+        digests = {}
+        missing = 0
+        for name in sorted(names):
+            if is_content_addressed(name):
+                continue
+            if not default_storage.exists(name):
+                missing += 1
+                self.stdout.write(self.style.WARNING(f"Missing file for {name}"))
+                continue
+            with default_storage.open(name, 'rb') as f:
+                hexdigest, size = hash_file(f)
+            digests[name] = (hexdigest, size)
+            directory, filename = posixpath.split(name)
+            renames[name] = content_addressed_name(directory, hexdigest, os.path.splitext(filename)[1])
+
+        # Every rename sharing a target is a duplicate; one of them is moved
+        # into place unless the target already exists, the rest are removed
+        groups = defaultdict(list)
+        for name, target in renames.items():
+            groups[target].append(name)
+        merged = saved_bytes = 0
+        for target, sources in groups.items():
+            removed = sources if default_storage.exists(target) else sources[1:]
+            merged += len(removed)
+            saved_bytes += sum(default_storage.size(name) for name in removed)
+
+        self.stdout.write(
+            f"{len(names)} referenced files: {len(renames)} to rename, {merged} duplicates to merge, "
+            f"{saved_bytes / (1024 * 1024):.2f} MB to reclaim, {missing} missing"
+        )
+        if dry_run:
+            for name, target in sorted(renames.items()):
+                self.stdout.write(f"  {name} -> {target}")
+            return
+
+        # Each file is linked into place and its rows switched over and
+        # committed before the old name is removed, so an interrupted run
+        # leaves every row pointing at a file and can simply be repeated
+        for name, target in renames.items():
+            self.link(name, target)
+            with transaction.atomic():
+                switched = 0
+                for model, field in media_file_fields():
+                    switched += model.objects.filter(**{field: name}).update(**{field: target})
+                self.move_references(name, target, switched, digests[name])
+            if not self.still_referenced(name):
+                try:
+                    os.remove(default_storage.path(name))
+                except FileNotFoundError:
+                    pass
+            # Thumbnails are keyed by the source name; generate_thumbnails rebuilds them
+            delete_derivatives(name)
+
+        logger.info(f"Deduplicated media: {len(renames)} files renamed, {merged} duplicates merged")
+        self.stdout.write(self.style.SUCCESS(
+            f"Renamed {len(renames)} files, merged {merged} duplicates, reclaimed {saved_bytes / (1024 * 1024):.2f} MB. "
+            "Run generate_thumbnails to rebuild thumbnails for renamed pictures."
+        ))
+
+    def link(self, name, target):
+        """Give the target name the source file's content, atomically"""
+        source_path = default_storage.path(name)
+        target_path = default_storage.path(target)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        try:
+            os.link(source_path, target_path)
+        except FileExistsError:
+            # Identical content, from an earlier run or a duplicate
+            pass
+        except OSError:
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), suffix='.upload')
+            os.close(fd)
+            try:
+                shutil.copyfile(source_path, temp_path)
+                os.replace(temp_path, target_path)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+    def move_references(self, name, target, count, digest):
+        """
+        Move count references from name's MediaBlob to target's, locking
+        both rows so uploads and deletes running alongside keep their counts
+        """
+        if not count:
+            return
+        blobs = {
+            blob.name: blob
+            for blob in MediaBlob.objects.select_for_update().filter(name__in=[name, target]).order_by('name')
+        }
+        source = blobs.get(name)
+        if source is not None:
+            if source.ref_count > count:
+                MediaBlob.objects.filter(pk=source.pk).update(ref_count=F('ref_count') - count)
+            else:
+                source.delete()
+        if target in blobs:
+            MediaBlob.objects.filter(pk=blobs[target].pk).update(ref_count=F('ref_count') + count)
+        else:
+            hexdigest, size = digest
+            MediaBlob.objects.create(name=target, sha256=hexdigest, size=size, ref_count=count)
+
+    def still_referenced(self, name):
+        """A request holding an instance loaded before the switch can save the old name back"""
+        return any(
+            model.objects.filter(**{field: name}).exists()
+            for model, field in media_file_fields()
+        )
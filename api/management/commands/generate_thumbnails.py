@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from api.models import UserProfile, Doctor
+from api.images import derivatives_exist, generate_derivatives
+import logging
+
+logger = logging.getLogger('api')
+
+class Command(BaseCommand):
+    help = 'Renders missing thumbnail derivatives for existing profile and doctor pictures'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate derivatives even when they already exist'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List the pictures that would be processed without rendering them'
+        )
+
+    def handle(self, *args, **options):
+        names = set()
+        for model in (UserProfile, Doctor):
+            names.update(
+                model.objects.exclude(profile_picture='')
+                .exclude(profile_picture__isnull=True)
+                .values_list('profile_picture', flat=True)
+            )
+
+        pending = sorted(name for name in names if options['force'] or not derivatives_exist(name))
+        self.stdout.write(f"{len(pending)} of {len(names)} pictures need derivatives")
+
+        if options['dry_run']:
+            for name in pending:
+                self.stdout.write(f"  {name}")
+            return
+
+        generated = failed = 0
+        for name in pending:
+            try:
+                generate_derivatives(name)
+                generated += 1
+            except Exception as e:
+                failed += 1
+                logger.error(f"Error generating derivatives for {name}: {str(e)}")
+                self.stdout.write(self.style.WARNING(f"Skipped {name}: {str(e)}"))
+
+        self.stdout.write(self.style.SUCCESS(f"Generated derivatives for {generated} pictures ({failed} failed)"))
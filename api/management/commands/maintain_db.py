@@ -1,7 +1,10 @@
 from django.core.management.base import BaseCommand
+from django.conf import settings
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import timedelta
-from api.models import Scan, Appointment, Payment
+from api.models import Scan, Appointment, Payment, Notification, NotificationArchive
+from api.purge import PurgeState, purge_in_batches
 from rest_framework.authtoken.models import Token
 import logging
 
@@ -22,59 +25,109 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be deleted without actually deleting'
         )
+        parser.add_argument(
+            '--notification-days',
+            type=int,
+            default=settings.NOTIFICATION_RETENTION_DAYS,
+            help=f'Archive read notifications older than this many days (default: {settings.NOTIFICATION_RETENTION_DAYS})'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows deleted per transaction (default: 500)'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.5,
+            help='Seconds to pause between batches so other queries get the locks (default: 0.5)'
+        )
+        parser.add_argument(
+            '--archive',
+            action='store_true',
+            help=f'Save purged scans, appointments and payments to DB_PURGE_ARCHIVE_DIR ({settings.DB_PURGE_ARCHIVE_DIR}) '
+                 'as fixtures that loaddata can restore'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue an interrupted run from its last completed batch, with its original cutoff'
+        )
 
     def handle(self, *args, **options):
         days = options['days']
         dry_run = options['dry_run']
         cutoff_date = timezone.now() - timedelta(days=days)
 
+        state = PurgeState(settings.DB_PURGE_STATE_FILE)
+        if not dry_run:
+            previous = state.load()
+            if options['resume'] and previous.get('cutoff'):
+                cutoff_date = parse_datetime(previous['cutoff'])
+                self.stdout.write("Resuming interrupted maintenance run")
+            else:
+                if previous.get('cutoff'):
+                    self.stdout.write(self.style.WARNING(
+                        "A previous run was interrupted; starting over (use --resume to continue it)"
+                    ))
+                state.start(cutoff_date)
+
         self.stdout.write(f"Starting database maintenance (cutoff date: {cutoff_date})")
 
-        # Clean up old scans
-        old_scans = Scan.objects.filter(upload_date__lt=cutoff_date)
-        if dry_run:
-            self.stdout.write(f"Would delete {old_scans.count()} old scans")
-        else:
-            count = old_scans.count()
-            old_scans.delete()
-            self.stdout.write(f"Deleted {count} old scans")
+        try:
+            # Clean up old scans
+            self.purge(Scan.objects.filter(upload_date__lt=cutoff_date), 'scans', 'old scans', state, options)
 
-        # Clean up completed appointments
-        old_appointments = Appointment.objects.filter(
-            date_time__lt=cutoff_date,
-            status='completed'
-        )
-        if dry_run:
-            self.stdout.write(f"Would delete {old_appointments.count()} completed appointments")
-        else:
-            count = old_appointments.count()
-            old_appointments.delete()
-            self.stdout.write(f"Deleted {count} completed appointments")
+            # Clean up completed appointments
+            self.purge(Appointment.objects.filter(
+                date_time__lt=cutoff_date,
+                status='completed'
+            ), 'appointments', 'completed appointments', state, options)
 
-        # Clean up old payments
-        old_payments = Payment.objects.filter(
-            created_at__lt=cutoff_date,
-            status__in=['completed', 'failed', 'refunded']
-        )
-        if dry_run:
-            self.stdout.write(f"Would delete {old_payments.count()} old payments")
-        else:
-            count = old_payments.count()
-            old_payments.delete()
-            self.stdout.write(f"Deleted {count} old payments")
+            # Clean up old payments
+            self.purge(Payment.objects.filter(
+                created_at__lt=cutoff_date,
+                status__in=['completed', 'failed', 'refunded']
+            ), 'payments', 'old payments', state, options)
 
-        # Clean up expired tokens
-        expired_tokens = Token.objects.filter(
-            created__lt=timezone.now() - timedelta(hours=24)
-        )
-        if dry_run:
-            self.stdout.write(f"Would delete {expired_tokens.count()} expired tokens")
-        else:
-            count = expired_tokens.count()
-            expired_tokens.delete()
-            self.stdout.write(f"Deleted {count} expired tokens")
+            # Move old read notifications into compressed archive storage
+            notification_cutoff = timezone.now() - timedelta(days=options['notification_days'])
+            if dry_run:
+                count = Notification.objects.filter(is_read=True, created_at__lt=notification_cutoff).count()
+                self.stdout.write(f"Would archive {count} read notifications")
+            else:
+                count = NotificationArchive.archive_read_notifications(notification_cutoff)
+                self.stdout.write(f"Archived {count} read notifications")
+
+            # Clean up expired tokens
+            self.purge(Token.objects.filter(
+                created__lt=timezone.now() - timedelta(hours=24)
+            ), 'tokens', 'expired tokens', state, options, archive=False)
+        except KeyboardInterrupt:
+            logger.warning("Database maintenance interrupted")
+            self.stdout.write(self.style.WARNING(
+                "Interrupted; run again with --resume to continue from the last completed batch"
+            ))
+            return
+
+        if not dry_run:
+            state.clear()
 
         if dry_run:
             self.stdout.write("Dry run completed - no changes were made")
         else:
-            self.stdout.write("Database maintenance completed successfully") 
\ No newline at end of file
+            self.stdout.write("Database maintenance completed successfully") 
+
+    def purge(self, queryset, name, label, state, options, archive=True):
+        if options['dry_run']:
+            self.stdout.write(f"Would delete {queryset.count()} {label}")
+            return
+        count = purge_in_batches(
+            queryset, name, state,
+            batch_size=options['batch_size'],
+            sleep=options['sleep'],
+            archive_dir=settings.DB_PURGE_ARCHIVE_DIR if archive and options['archive'] else None,
+            stdout=self.stdout if options['verbosity'] >= 2 else None,
+        )
+        self.stdout.write(f"Deleted {count} {label}")
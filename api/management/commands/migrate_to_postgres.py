@@ -1,95 +1,214 @@
-import os
-import json
-from django.core.management.base import BaseCommand
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
 from django.apps import apps
-from django.db import connections
-from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+import dj_database_url
+import logging
+import time
+
+logger = logging.getLogger('api')
+
+
+def migratable_models():
+    """Every model with its own table, including auto-created many-to-many tables"""
+    return [
+        model for model in apps.get_models(include_auto_created=True)
+        if model._meta.managed and not model._meta.proxy and not model._meta.swapped
+    ]
+
+
+def dependency_levels(models):
+    """
+    Group models so each only references models in earlier groups; models
+    in the same group are independent and can be loaded in parallel. Models
+    in a reference cycle come last, as a single group loaded in one
+    transaction (the foreign keys are deferred until it commits).
+    Returns (levels, cycle).
+    """
+    remaining = {
+        model: {
+            field.related_model for field in model._meta.concrete_fields
+            if field.is_relation and field.related_model in models and field.related_model is not model
+        }
+        for model in models
+    }
+    levels = []
+    loaded = set()
+    while remaining:
+        ready = [model for model, depends_on in remaining.items() if depends_on <= loaded]
+        if not ready:
+            break
+        ready.sort(key=lambda model: model._meta.label)
+        levels.append(ready)
+        loaded.update(ready)
+        for model in ready:
+            del remaining[model]
+    return levels, sorted(remaining, key=lambda model: model._meta.label)
+
+
+@contextmanager
+def original_timestamps(models):
+    """Stop auto_now/auto_now_add fields from overwriting the copied values"""
+    changed = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                changed.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in changed:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
 
 
 class Command(BaseCommand):
     help = 'Migrates data from SQLite to PostgreSQL'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            default='default',
+            help='Database alias to copy from (default: default)'
+        )
+        parser.add_argument(
+            '--target',
+            default='postgres',
+            help='Database alias to copy into, already migrated with "migrate --database" (default: postgres)'
+        )
+        parser.add_argument(
+            '--target-url',
+            help='Database URL for the target, if the alias is not configured in settings'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Rows read and inserted per batch (default: 2000)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Tables loaded in parallel when they do not reference each other (default: 4)'
+        )
+        parser.add_argument(
+            '--no-input',
+            action='store_false',
+            dest='interactive',
+            help='Do not ask for confirmation before replacing the data in the target'
+        )
+
     def handle(self, *args, **options):
-        self.stdout.write(self.style.SUCCESS('Starting data migration from SQLite to PostgreSQL'))
-        
-        # Get all models from all installed apps
-        models = []
-        for app_config in apps.get_app_configs():
-            models.extend(app_config.get_models())
-        
-        # Create data directory if it doesn't exist
-        if not os.path.exists('data_migration'):
-            os.makedirs('data_migration')
-        
-        total_models = len(models)
-        self.stdout.write(f'Found {total_models} models to migrate')
-        
-        # Export data from SQLite
-        self.stdout.write(self.style.WARNING('Step 1: Exporting data from SQLite'))
-        for i, model in enumerate(models, 1):
-            self.stdout.write(f'[{i}/{total_models}] Exporting {model.__name__}')
-            
-            try:
-                # Get all data from SQLite
-                data = list(model.objects.using('default').all().values())
-                
-                # Save to JSON file
-                model_name = f"{model._meta.app_label}.{model.__name__}"
-                with open(f'data_migration/{model_name}.json', 'w') as f:
-                    json.dump(data, f, cls=DjangoJSONEncoder)
-                
-                self.stdout.write(self.style.SUCCESS(f'  - Exported {len(data)} records'))
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'  - Error exporting {model.__name__}: {str(e)}'))
-        
-        # Import data to PostgreSQL
-        self.stdout.write(self.style.WARNING('\nStep 2: Importing data to PostgreSQL'))
-        self.stdout.write('Make sure your PostgreSQL connection is configured in settings.py')
-        
-        proceed = input('Type "yes" to continue with the import: ')
-        if proceed.lower() != 'yes':
-            self.stdout.write(self.style.WARNING('Import cancelled'))
-            return
-        
-        for i, model in enumerate(models, 1):
-            model_name = f"{model._meta.app_label}.{model.__name__}"
-            json_file = f'data_migration/{model_name}.json'
-            
-            if not os.path.exists(json_file):
-                continue
-            
-            self.stdout.write(f'[{i}/{total_models}] Importing {model.__name__}')
-            
-            try:
-                # Load data from JSON file
-                with open(json_file, 'r') as f:
-                    data = json.load(f)
-                
-                if not data:
-                    self.stdout.write('  - No data to import')
-                    continue
-                
-                # Clear existing data in PostgreSQL
-                model.objects.using('postgres').all().delete()
-                
-                # Import data to PostgreSQL
-                for item in data:
-                    # Remove primary key to let Django create a new one if needed
-                    # This prevents PK conflicts
-                    pk_name = model._meta.pk.name
-                    if pk_name in item:
-                        pk_value = item[pk_name]
-                    
-                    # Create objects individually to handle errors better
-                    try:
-                        model.objects.using('postgres').create(**item)
-                    except Exception as e:
-                        self.stdout.write(self.style.WARNING(f'  - Error importing item {pk_value}: {str(e)}'))
-                
-                self.stdout.write(self.style.SUCCESS(f'  - Imported {len(data)} records'))
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'  - Error importing {model.__name__}: {str(e)}'))
-        
-        self.stdout.write(self.style.SUCCESS('\nMigration completed!'))
-        self.stdout.write('To switch to PostgreSQL, update your settings.py and run:')
-        self.stdout.write('python manage.py check') 
\ No newline at end of file
+        source, target = options['source'], options['target']
+        if options['target_url']:
+            config = dj_database_url.parse(options['target_url'])
+            connections.settings[target] = connections.configure_settings({**connections.settings, target: config})[target]
+        if target not in connections.settings:
+            raise CommandError(f'No "{target}" database is configured; pass --target-url')
+        if source == target:
+            raise CommandError('The source and target databases must differ')
+
+        models = migratable_models()
+        levels, cycle = dependency_levels(models)
+        self.chunk_size = options['chunk_size']
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Migrating {len(models)} tables from "{source}" ({connections[source].vendor}) '
+            f'to "{target}" ({connections[target].vendor})'
+        ))
+        if options['interactive']:
+            self.stdout.write(self.style.WARNING(f'Every table in "{target}" will be emptied first.'))
+            proceed = input('Type "yes" to continue with the import: ')
+            if proceed.lower() != 'yes':
+                self.stdout.write(self.style.WARNING('Import cancelled'))
+                return
+
+        target_connection = connections[target]
+        tables = [model._meta.db_table for model in models]
+        target_connection.ops.execute_sql_flush(
+            target_connection.ops.sql_flush(no_style(), tables, allow_cascade=True)
+        )
+
+        # SQLite takes one writer at a time, so only parallelise other targets
+        workers = 1 if target_connection.vendor == 'sqlite' else max(1, options['workers'])
+        started = time.monotonic()
+        results = []
+        with original_timestamps(models):
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for level in levels:
+                    futures = [executor.submit(self.copy_tables, [model], source, target) for model in level]
+                    for future in futures:
+                        results.extend(future.result())
+            if cycle:
+                results.extend(self.copy_tables(cycle, source, target))
+
+        target_connection.ops.execute_sql_flush(
+            target_connection.ops.sequence_reset_sql(no_style(), models)
+        )
+
+        elapsed = time.monotonic() - started
+        total = sum(rows for _, rows, _ in results)
+        mismatched = [
+            (model, rows) for model, rows, _ in results
+            if model._base_manager.using(target).count() != rows
+        ]
+        for model, rows in mismatched:
+            self.stdout.write(self.style.ERROR(
+                f'  - {model._meta.label}: copied {rows} rows but the target has '
+                f'{model._base_manager.using(target).count()}'
+            ))
+        if mismatched:
+            raise CommandError(f'{len(mismatched)} tables do not match the source')
+
+        logger.info(f'Migrated {total} rows to "{target}" in {elapsed:.1f}s')
+        self.stdout.write(self.style.SUCCESS(
+            f'\nMigrated {total} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} rows/s)'
+        ))
+        self.stdout.write('To switch to PostgreSQL, set DATABASE_URL and run:')
+        self.stdout.write('python manage.py check')
+
+    def copy_tables(self, models, source, target):
+        """
+        Stream each table from source into target in primary-key order, in
+        one transaction; returns [(model, rows, seconds)]
+        """
+        results = []
+        try:
+            with transaction.atomic(using=target):
+                for model in models:
+                    started = time.monotonic()
+                    rows = self.copy_table(model, source, target)
+                    seconds = time.monotonic() - started
+                    results.append((model, rows, seconds))
+                    rate = f'{rows / seconds:.0f} rows/s' if rows and seconds else 'empty'
+                    self.stdout.write(f'  - {model._meta.label}: {rows} rows in {seconds:.2f}s ({rate})')
+        except Exception as e:
+            logger.error(f'Error migrating {", ".join(model._meta.label for model in models)}: {str(e)}')
+            raise CommandError(f'Failed to migrate {", ".join(model._meta.label for model in models)}: {str(e)}')
+        finally:
+            # Each worker thread has its own connections
+            connections.close_all()
+        return results
+
+    def copy_table(self, model, source, target):
+        fields = [field.attname for field in model._meta.concrete_fields]
+        rows = (
+            model._base_manager.using(source).order_by('pk')
+            .values_list(*fields).iterator(chunk_size=self.chunk_size)
+        )
+        manager = model._base_manager.using(target)
+        copied = 0
+        batch = []
+        for row in rows:
+            batch.append(model(*row))
+            if len(batch) >= self.chunk_size:
+                manager.bulk_create(batch, batch_size=self.chunk_size)
+                copied += len(batch)
+                batch = []
+        if batch:
+            manager.bulk_create(batch, batch_size=self.chunk_size)
+            copied += len(batch)
+        return copied
@@ -0,0 +1,61 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from api.models import UserProfile, Doctor, Scan, XRayImage
+from api.images import optimize_image_bytes, optimize_stored_image, derivatives_exist, generate_derivatives
+import logging
+
+logger = logging.getLogger('api')
+
+class Command(BaseCommand):
+    help = 'Strips metadata from and losslessly recompresses existing profile pictures, scans and X-rays'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report the savings without replacing any files'
+        )
+
+    def handle(self, *args, **options):
+        names = set()
+        profile_pictures = set()
+        for model, field in ((UserProfile, 'profile_picture'), (Doctor, 'profile_picture'),
+                             (Scan, 'image'), (XRayImage, 'image')):
+            found = set(
+                model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .values_list(field, flat=True)
+            )
+            names.update(found)
+            if field == 'profile_picture':
+                profile_pictures.update(found)
+
+        optimized = failed = saved_bytes = 0
+        for name in sorted(names):
+            try:
+                if not default_storage.exists(name):
+                    continue
+                size = default_storage.size(name)
+                if options['dry_run']:
+                    with default_storage.open(name, 'rb') as f:
+                        result = optimize_image_bytes(f.read())
+                    if result is not None:
+                        optimized += 1
+                        saved_bytes += size - len(result)
+                        self.stdout.write(f"  {name}: {size} -> {len(result)} bytes")
+                    continue
+
+                current = optimize_stored_image(name)
+                if current and current != name:
+                    optimized += 1
+                    saved_bytes += size - default_storage.size(current)
+                    if name in profile_pictures and not derivatives_exist(current):
+                        generate_derivatives(current)
+            except Exception as e:
+                failed += 1
+                logger.error(f"Error optimizing {name}: {str(e)}")
+                self.stdout.write(self.style.WARNING(f"Skipped {name}: {str(e)}"))
+
+        verb = 'Would optimize' if options['dry_run'] else 'Optimized'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {optimized} of {len(names)} images, saving {saved_bytes / (1024 * 1024):.2f} MB ({failed} failed)"
+        ))
@@ -0,0 +1,229 @@
+import mimetypes
+import os
+import posixpath
+import re
+import time
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.db.models import Q
+from django.urls import reverse
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import http_date
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+
+from .cache import etag_matches
+from .models import Scan, XRayImage, DicomInstance
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Pictures shown across the app (doctor directory, team page, avatars)
+SHARED_MEDIA_PREFIXES = ('profile_pictures/', 'doctor_profiles/', 'derivatives/')
+
+
+def is_privileged(user):
+    return user.is_staff or getattr(user, 'role', '') == 'admin'
+
+
+def can_access_media(user, name):
+    """Whether a user may read the media file stored under the given name"""
+    if is_privileged(user) or name.startswith(SHARED_MEDIA_PREFIXES):
+        return True
+    if name.startswith('scans/'):
+        return Scan.objects.filter(image=name).filter(
+            Q(user=user) | Q(consultations__doctor=user)
+        ).exists()
+    if name.startswith(('dicom/', 'dicom_previews/', 'dicom_renditions/')):
+        return DicomInstance.objects.filter(
+            Q(file=name) | Q(preview=name) | Q(rendition=name), uploaded_by=user
+        ).exists()
+    if name.startswith('xray_images/'):
+        return XRayImage.objects.filter(image=name).filter(
+            Q(assistant=user) | Q(appointment__user=user) | XRayImage.doctor_access(user)
+        ).exists()
+    return False
+
+
+def media_signature(name, expires):
+    value = f'{name}:{expires}'
+    return salted_hmac('api.media', value, secret=settings.MEDIA_URL_SIGNING_KEY, algorithm='sha256').hexdigest()
+
+
+def sign_media_name(name):
+    """
+    Expiry and signature for a media name. Expiries are rounded up to the
+    next MEDIA_URL_TTL boundary so the URL for a file stays stable (and
+    browser-cacheable) for a whole window; it is valid for one to two TTLs.
+    """
+    ttl = settings.MEDIA_URL_TTL
+    expires = (int(time.time()) // ttl + 2) * ttl
+    return expires, media_signature(name, expires)
+
+
+def verify_media_signature(name, expires, signature):
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < time.time():
+        return False
+    return constant_time_compare(media_signature(name, expires), signature or '')
+
+
+def signed_media_url(field_file, request=None):
+    """
+    Short-lived URL that needs no Authorization header, for a stored file
+    or a media name
+    """
+    name = getattr(field_file, 'name', field_file)
+    if not name:
+        return None
+    expires, signature = sign_media_name(name)
+    url = f"{reverse('media', kwargs={'path': name})}?{urlencode({'exp': expires, 'sig': signature})}"
+    return request.build_absolute_uri(url) if request else url
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range Range header into inclusive (start, end) offsets.
+    Returns None when the header is absent or not a single byte range, in
+    which case the whole file is served; raises ValueError if unsatisfiable.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('Empty suffix range')
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('Range not satisfiable')
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+class MediaView(APIView):
+    """
+    Authenticated access to files under MEDIA_ROOT. After the permission check
+    the bytes are handed to the front server (X-Accel-Redirect / X-Sendfile)
+    when MEDIA_DELIVERY says one is in place; otherwise they are streamed from
+    here with Range support. Either way responses carry ETag/Last-Modified
+    and private cache headers so browsers can revalidate cheaply.
+
+    Requests carrying a valid exp/sig pair (see signed_media_url) are
+    authorised by the signature alone, without touching the database.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def perform_authentication(self, request):
+        # request.user is resolved lazily, only for unsigned requests
+        pass
+
+    def check_permissions(self, request):
+        name = self._media_name(self.kwargs.get('path', ''))
+        self.signed_expires = None
+        if 'sig' in request.query_params and verify_media_signature(
+            name, request.query_params.get('exp'), request.query_params.get('sig')
+        ):
+            self.signed_expires = int(request.query_params['exp'])
+            return
+        super().check_permissions(request)
+
+    def _media_name(self, path):
+        return posixpath.normpath(path).lstrip('/')
+
+    def get(self, request, path):
+        name = self._media_name(path)
+        if name.startswith('..'):
+            raise Http404
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, name)
+            stat = os.stat(full_path)
+        except (OSError, ValueError):
+            raise Http404
+        if not os.path.isfile(full_path):
+            raise Http404
+
+        if self.signed_expires is None and not can_access_media(request.user, name):
+            # Don't reveal whether the file exists
+            raise Http404
+
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        content_type, encoding = mimetypes.guess_type(full_path)
+        content_type = content_type or 'application/octet-stream'
+
+        if etag_matches(etag, request.META.get('HTTP_IF_NONE_MATCH')):
+            return self._with_cache_headers(HttpResponseNotModified(), etag, stat)
+
+        delivery = settings.MEDIA_DELIVERY
+        if delivery == 'nginx':
+            # nginx serves the internal location itself, including ranges
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(name)
+        elif delivery == 'sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = full_path
+        else:
+            response = self._serve(request, full_path, stat, etag, content_type)
+
+        if encoding:
+            response['Content-Encoding'] = encoding
+        return self._with_cache_headers(response, etag, stat)
+
+    def _serve(self, request, full_path, stat, etag, content_type):
+        size = stat.st_size
+        range_header = request.META.get('HTTP_RANGE')
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if range_header and if_range and if_range != etag:
+            # The client's partial copy is stale; send the whole file
+            range_header = None
+
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        if byte_range is None:
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+            response['Content-Length'] = size
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _read_range(full_path, start, length), status=206, content_type=content_type
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = length
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    def _with_cache_headers(self, response, etag, stat):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        max_age = settings.MEDIA_CACHE_MAX_AGE
+        if self.signed_expires is not None:
+            max_age = max(0, min(max_age, self.signed_expires - int(time.time())))
+        response['Cache-Control'] = f'private, max-age={max_age}'
+        return response
@@ -1,6 +1,11 @@
 from django.utils.deprecation import MiddlewareMixin
 from django.http import JsonResponse
 from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from api.db_router import begin_request, end_request
 import time
 import logging
 import uuid
@@ -148,4 +153,53 @@ class CorsMiddleware:
         response["Access-Control-Allow-Headers"] = "Content-Type, Authorization, X-Requested-With, X-CSRFToken"
         response["Access-Control-Allow-Credentials"] = "true"
         
-        return response 
\ No newline at end of file
+        return response
+
+class ReplicaPinningMiddleware:
+    """
+    Sends unsafe requests to the primary database, and GETs too for a user
+    who wrote in the last DATABASE_REPLICA_PIN_SECONDS, so they read their own
+    writes. The pin is a cache entry keyed by the user rather than a cookie:
+    the frontend is served from another origin and authenticates with a JWT
+    header, so cookies set here never come back on its requests. It sits
+    after AuthenticationMiddleware so session users are known up front;
+    API clients are identified from their bearer token without a query.
+    """
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+    CACHE_KEY = 'db_pin:{}'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.jwt_authentication = JWTAuthentication()
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        writes = request.method not in self.SAFE_METHODS
+        token = begin_request(writes or self.is_pinned(request))
+        try:
+            response = self.get_response(request)
+            # DRF sets request.user once the view has authenticated the client
+            user = getattr(request, 'user', None)
+            if writes and response.status_code < 400 and user is not None and user.is_authenticated:
+                cache.set(self.CACHE_KEY.format(user.pk), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+            return response
+        finally:
+            end_request(token)
+
+    def is_pinned(self, request):
+        user_id = self.user_id(request)
+        return user_id is not None and cache.get(self.CACHE_KEY.format(user_id)) is not None
+
+    def user_id(self, request):
+        header = self.jwt_authentication.get_header(request)
+        raw_token = self.jwt_authentication.get_raw_token(header) if header else None
+        if raw_token is not None:
+            try:
+                validated = self.jwt_authentication.get_validated_token(raw_token)
+            except InvalidToken:
+                return None
+            return validated.get(jwt_settings.USER_ID_CLAIM)
+        user = getattr(request, 'user', None)
+        return user.pk if user is not None and user.is_authenticated else None
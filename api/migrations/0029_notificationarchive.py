@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-19 07:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_remove_doctor_availability_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(help_text='First day of the month the notifications were created in')),
+                ('notification_count', models.PositiveIntegerField(default=0)),
+                ('payload', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_archives', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-period', '-created_at'],
+                'indexes': [models.Index(fields=['user', 'period'], name='api_notific_user_id_7ef9d0_idx')],
+            },
+        ),
+    ]
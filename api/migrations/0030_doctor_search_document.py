@@ -0,0 +1,60 @@
+# Generated by Django 5.2 on 2026-10-19 07:45
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+def backfill_search_documents(apps, schema_editor):
+    Doctor = apps.get_model('api', 'Doctor')
+    for doctor in Doctor.objects.select_related('user').iterator():
+        parts = [
+            doctor.user.first_name,
+            doctor.user.last_name,
+            doctor.specialty,
+            doctor.get_specialty_display(),
+            doctor.bio,
+            doctor.education,
+            doctor.languages,
+        ]
+        doctor.search_document = ' '.join(part for part in parts if part).lower()
+        doctor.save(update_fields=['search_document'])
+
+
+def create_search_indexes(apps, schema_editor):
+    # Full-text and trigram GIN indexes only exist on PostgreSQL; other
+    # backends use the in-process index in api.search instead
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS api_doctor_search_fts_idx ON api_doctor "
+        "USING gin (to_tsvector('english'::regconfig, COALESCE(search_document, '')))"
+    )
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS api_doctor_search_trgm_idx ON api_doctor "
+        "USING gin (search_document gin_trgm_ops)"
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS api_doctor_search_fts_idx")
+    schema_editor.execute("DROP INDEX IF EXISTS api_doctor_search_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0029_notificationarchive'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='doctor',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Denormalized, lowercased text used by the doctor search index'),
+        ),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-19 07:45
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_doctor_languages(apps, schema_editor):
+    Doctor = apps.get_model('api', 'Doctor')
+    DoctorLanguage = apps.get_model('api', 'DoctorLanguage')
+    rows = []
+    for doctor_id, value in Doctor.objects.values_list('id', 'languages').iterator():
+        languages = []
+        for part in re.split(r'[,;/|]', value or ''):
+            language = ' '.join(part.split()).lower()[:50]
+            if language and language not in languages:
+                languages.append(language)
+        rows.extend(DoctorLanguage(doctor_id=doctor_id, language=language) for language in languages)
+    DoctorLanguage.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0030_doctor_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorLanguage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(max_length=50)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spoken_languages', to='api.doctor')),
+            ],
+            options={
+                'ordering': ['language'],
+                'indexes': [models.Index(fields=['language', 'doctor'], name='api_doctorl_languag_7f1663_idx')],
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'language'), name='unique_doctor_language')],
+            },
+        ),
+        migrations.RunPython(backfill_doctor_languages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2 on 2026-10-19 07:47
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_consultation_counts(apps, schema_editor):
+    Doctor = apps.get_model('api', 'Doctor')
+    Consultation = apps.get_model('api', 'Consultation')
+    consultations = Consultation.objects.filter(doctor=OuterRef('user')).order_by().values('doctor')
+    Doctor.objects.update(
+        total_consultations=Coalesce(
+            Subquery(consultations.annotate(count=Count('id')).values('count')), 0
+        ),
+        completed_consultations=Coalesce(
+            Subquery(consultations.filter(status='completed').annotate(count=Count('id')).values('count')), 0
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0031_doctorlanguage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='completed_consultations',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='DoctorReview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)])),
+                ('comment', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('consultation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='review', to='api.consultation')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='doctor_reviews', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='doctor_reviews_given', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.RunPython(backfill_consultation_counts, migrations.RunPython.noop),
+    ]
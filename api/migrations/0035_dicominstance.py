@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-19 08:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0034_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='purpose',
+            field=models.CharField(choices=[('xray', 'X-ray Image'), ('scan', 'Scan'), ('dicom', 'DICOM Image')], max_length=10),
+        ),
+        migrations.CreateModel(
+            name='DicomInstance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='dicom/')),
+                ('preview', models.ImageField(blank=True, null=True, upload_to='dicom_previews/')),
+                ('rendition', models.ImageField(blank=True, null=True, upload_to='dicom_renditions/')),
+                ('sop_instance_uid', models.CharField(max_length=64, unique=True)),
+                ('study_instance_uid', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('series_instance_uid', models.CharField(blank=True, max_length=64)),
+                ('patient_id', models.CharField(blank=True, max_length=64)),
+                ('patient_name', models.CharField(blank=True, max_length=255)),
+                ('patient_sex', models.CharField(blank=True, max_length=16)),
+                ('patient_birth_date', models.DateField(blank=True, null=True)),
+                ('study_date', models.DateField(blank=True, null=True)),
+                ('study_description', models.CharField(blank=True, max_length=255)),
+                ('modality', models.CharField(blank=True, max_length=16)),
+                ('body_part', models.CharField(blank=True, max_length=64)),
+                ('view_position', models.CharField(blank=True, max_length=16)),
+                ('rows', models.PositiveIntegerField(blank=True, null=True)),
+                ('columns', models.PositiveIntegerField(blank=True, null=True)),
+                ('bits_stored', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('photometric_interpretation', models.CharField(blank=True, max_length=16)),
+                ('window_center', models.FloatField(blank=True, null=True)),
+                ('window_width', models.FloatField(blank=True, null=True)),
+                ('transfer_syntax', models.CharField(blank=True, max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=12)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('scan', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='dicom_instance', to='api.scan')),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dicom_instances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['patient_id', 'study_date'], name='api_dicomin_patient_0fc2e0_idx'), models.Index(fields=['uploaded_by', 'created_at'], name='api_dicomin_uploade_04fc5a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-19 08:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0035_dicominstance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['user', 'date_time'], name='api_appoint_user_id_74513f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'date_time'], name='api_appoint_status_39ddf1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['doctor', 'status', 'created_at'], name='api_consult_doctor__b30641_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['patient', 'created_at'], name='api_consult_patient_fbe6d6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', 'created_at'], name='api_notific_user_id_537f5a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at'], name='api_notific_user_id_48bbdc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', 'created_at'], name='api_payment_user_id_a1e894_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scan',
+            index=models.Index(fields=['user', 'upload_date'], name='api_scan_user_id_177f54_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scan',
+            index=models.Index(fields=['upload_date'], name='api_scan_upload__829fde_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='xrayimage',
+            index=models.Index(fields=['patient', 'upload_date'], name='api_xrayima_patient_dd3e4a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='xrayimage',
+            index=models.Index(fields=['assistant', 'upload_date'], name='api_xrayima_assista_f2b021_idx'),
+        ),
+    ]
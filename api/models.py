@@ -1,11 +1,24 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, ExpressionWrapper, Q
+from django.db.models.functions import Cast
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.conf import settings
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from collections import defaultdict
+import hashlib
+import json
+import math
 import os
+import re
+import shutil
+import tempfile
+import uuid
+import zlib
+from .storage import retain_media
 
 # Helper function to clean media paths
 def clean_media_path(instance, filename):
@@ -74,6 +87,18 @@ class User(AbstractUser):
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.username})"
 
+def normalize_languages(value):
+    """
+    Split a free-text language list (e.g. "English, French; Arabic") into
+    unique, lowercased language names in their original order.
+    """
+    languages = []
+    for part in re.split(r'[,;/|]', value or ''):
+        language = ' '.join(part.split()).lower()[:50]
+        if language and language not in languages:
+            languages.append(language)
+    return languages
+
 class Doctor(models.Model):
     SPECIALTY_CHOICES = [
         ('cardiology', 'Cardiology'),
@@ -111,6 +136,10 @@ class Doctor(models.Model):
         validators=[MinValueValidator(0.00), MaxValueValidator(5.00)]
     )
     total_consultations = models.PositiveIntegerField(default=0)
+    completed_consultations = models.PositiveIntegerField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    search_document = models.TextField(blank=True, default='', editable=False,
+                                       help_text="Denormalized, lowercased text used by the doctor search index")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -120,13 +149,98 @@ class Doctor(models.Model):
     class Meta:
         ordering = ['-rating', '-years_of_experience']
 
+    def build_search_document(self):
+        """Collect the searchable text for this doctor into a single lowercased string"""
+        parts = [
+            self.user.first_name,
+            self.user.last_name,
+            self.specialty,
+            self.get_specialty_display(),
+            self.bio,
+            self.education,
+            self.languages,
+        ]
+        return ' '.join(part for part in parts if part).lower()
+
     def save(self, *args, **kwargs):
+        # Keep the search document in step with the fields it is built from;
+        # updated_at is how other processes' search indexes notice the change
+        self.search_document = self.build_search_document()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = list({*update_fields, 'search_document', 'updated_at'})
+
         super().save(*args, **kwargs)
+        if update_fields is None or 'languages' in update_fields:
+            self.sync_languages()
         # If this user also has a UserProfile, sync the profile picture
         if hasattr(self.user, 'profile') and self.profile_picture:
             if self.user.profile.profile_picture != self.profile_picture:
                 self.user.profile.profile_picture = self.profile_picture
                 self.user.profile.save(update_fields=['profile_picture'])
+                retain_media(self.profile_picture.name)
+
+    # Statistics are maintained incrementally with atomic F() updates keyed by
+    # the doctor's user ID (Consultation.doctor points at the User), and
+    # periodically reconciled by api.tasks.reconcile_doctor_stats
+
+    @classmethod
+    def record_consultation_created(cls, doctor_user_id):
+        cls.objects.filter(user_id=doctor_user_id).update(
+            total_consultations=F('total_consultations') + 1
+        )
+
+    @classmethod
+    def record_consultation_completed(cls, doctor_user_id):
+        cls.objects.filter(user_id=doctor_user_id).update(
+            completed_consultations=F('completed_consultations') + 1
+        )
+
+    @classmethod
+    def record_review(cls, doctor_user_id, rating):
+        # Both assignments read the pre-update column values, so the running
+        # average and the count move together in one statement
+        cls.objects.filter(user_id=doctor_user_id).update(
+            rating=ExpressionWrapper(
+                Cast(F('rating') * F('review_count') + rating, models.FloatField()) / (F('review_count') + 1),
+                output_field=models.DecimalField(max_digits=3, decimal_places=2)
+            ),
+            review_count=F('review_count') + 1
+        )
+
+    def sync_languages(self):
+        """Bring the normalized DoctorLanguage rows in line with the languages field"""
+        languages = normalize_languages(self.languages)
+        existing = set(self.spoken_languages.values_list('language', flat=True))
+        stale = existing - set(languages)
+        if stale:
+            self.spoken_languages.filter(language__in=stale).delete()
+        missing = [language for language in languages if language not in existing]
+        if missing:
+            DoctorLanguage.objects.bulk_create(
+                [DoctorLanguage(doctor=self, language=language) for language in missing],
+                ignore_conflicts=True
+            )
+
+class DoctorLanguage(models.Model):
+    """
+    A language spoken by a doctor, normalized out of Doctor.languages so the
+    directory can filter by language with an indexed lookup.
+    """
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='spoken_languages')
+    language = models.CharField(max_length=50)
+
+    class Meta:
+        ordering = ['language']
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'language'], name='unique_doctor_language'),
+        ]
+        indexes = [
+            models.Index(fields=['language', 'doctor']),
+        ]
+
+    def __str__(self):
+        return f"{self.language} ({self.doctor_id})"
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -144,6 +258,7 @@ class UserProfile(models.Model):
             if self.user.doctor_profile.profile_picture != self.profile_picture:
                 self.user.doctor_profile.profile_picture = self.profile_picture
                 self.user.doctor_profile.save(update_fields=['profile_picture'])
+                retain_media(self.profile_picture.name)
 
 # Signal to sync profile picture when UserProfile is created or updated
 @receiver(post_save, sender=Doctor)
@@ -151,12 +266,14 @@ def sync_doctor_profile_picture(sender, instance, created, **kwargs):
     if created and instance.profile_picture and hasattr(instance.user, 'profile'):
         instance.user.profile.profile_picture = instance.profile_picture
         instance.user.profile.save(update_fields=['profile_picture'])
+        retain_media(instance.profile_picture.name)
 
 @receiver(post_save, sender=UserProfile)
 def sync_user_profile_picture(sender, instance, created, **kwargs):
     if created and instance.profile_picture and hasattr(instance.user, 'doctor_profile'):
         instance.user.doctor_profile.profile_picture = instance.profile_picture
         instance.user.doctor_profile.save(update_fields=['profile_picture'])
+        retain_media(instance.profile_picture.name)
 
 class Appointment(models.Model):
     STATUS_CHOICES = [
@@ -173,6 +290,14 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # A user's appointments, newest first, and their upcoming ones
+            models.Index(fields=['user', 'date_time']),
+            # Taken slots and conflict checks by day, upcoming and purge by status
+            models.Index(fields=['status', 'date_time']),
+        ]
+
     def __str__(self):
         return f"Appointment for {self.user.username} on {self.date_time}"
         
@@ -213,9 +338,33 @@ class Scan(models.Model):
     notes = models.TextField(blank=True, null=True)
     requires_consultation = models.BooleanField(default=False)
     
+    # Doctor specialties best placed to follow up on each ML diagnosis
+    DIAGNOSIS_SPECIALTIES = {
+        'Pneumonia': ['pulmonology'],
+        'Lung_Opacity': ['pulmonology', 'radiology'],
+        'Normal': ['general'],
+    }
+    DEFAULT_SPECIALTIES = ['general']
+
+    class Meta:
+        indexes = [
+            # Scan history per user, filtered by ScanFilter's date range
+            models.Index(fields=['user', 'upload_date']),
+            # Retention purge in maintain_db
+            models.Index(fields=['upload_date']),
+        ]
+    
     def __str__(self):
         return f"Scan {self.id} - {self.user.username}"
 
+    def get_diagnosis(self):
+        """Extract the diagnosis from a result such as 'Diagnosis: Pneumonia with 92.5% confidence'"""
+        match = re.match(r'Diagnosis:\s*(\S+)', self.result or '')
+        return match.group(1) if match else None
+
+    def get_relevant_specialties(self):
+        return self.DIAGNOSIS_SPECIALTIES.get(self.get_diagnosis(), self.DEFAULT_SPECIALTIES)
+
 class Consultation(models.Model):
     patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='patient_consultations')
     doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='doctor_consultations')
@@ -235,9 +384,24 @@ class Consultation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # A doctor's consultations, optionally by status, in creation order
+            models.Index(fields=['doctor', 'status', 'created_at']),
+            models.Index(fields=['patient', 'created_at']),
+        ]
+
     def __str__(self):
         return f"Consultation for {self.patient.get_full_name()} with Dr. {self.doctor.get_full_name()}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The status as loaded, so the save signals can tell a status change
+        # without querying for it again (None if the field was deferred)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
     def mark_as_completed(self):
         self.status = 'completed'
         self.save()
@@ -250,6 +414,21 @@ class Consultation(models.Model):
             status='pending'
         )
 
+class DoctorReview(models.Model):
+    """A patient's rating of a doctor after a completed consultation"""
+    consultation = models.OneToOneField(Consultation, on_delete=models.CASCADE, related_name='review')
+    patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='doctor_reviews_given')
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='doctor_reviews')
+    rating = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
+    comment = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.rating}/5 for Dr. {self.doctor.get_full_name()} from {self.patient.username}"
+
 class Payment(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -272,6 +451,11 @@ class Payment(models.Model):
     transaction_id = models.CharField(max_length=100, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+        ]
     
     def __str__(self):
         return f"Payment {self.transaction_id} - {self.user.username}"
@@ -294,10 +478,145 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Unread counts and bulk mark-as-read
+            models.Index(fields=['user', 'is_read', 'created_at']),
+            # The notification list, newest first
+            models.Index(fields=['user', '-created_at']),
+        ]
     
     def __str__(self):
         return f"{self.notification_type} notification for {self.user.username}"
 
+class NotificationArchive(models.Model):
+    """
+    Cold storage for read notifications past the retention window.
+    Each row holds a batch of one user's notifications from a single month
+    as zlib-compressed JSON, so the hot Notification table stays small.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_archives')
+    period = models.DateField(help_text="First day of the month the notifications were created in")
+    notification_count = models.PositiveIntegerField(default=0)
+    payload = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-period', '-created_at']
+        indexes = [
+            models.Index(fields=['user', 'period']),
+        ]
+
+    def __str__(self):
+        return f"{self.notification_count} archived notifications for {self.user.username} ({self.period:%Y-%m})"
+
+    def get_notifications(self):
+        """Decompress and return the archived notifications as a list of dicts"""
+        return json.loads(zlib.decompress(bytes(self.payload)).decode('utf-8'))
+
+    @classmethod
+    def archive_read_notifications(cls, cutoff, batch_size=500):
+        """
+        Move read notifications created before `cutoff` into archive rows.
+        Works in primary-key ordered batches so each transaction stays short.
+        Each batch is locked while it is archived, and rows another run has
+        locked are skipped, so concurrent runs never archive a notification
+        twice. Returns the number of notifications archived.
+        """
+        archived = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+                    .select_for_update(skip_locked=True)
+                    .order_by('pk')
+                    .values('id', 'user_id', 'title', 'message', 'notification_type', 'created_at')[:batch_size]
+                )
+                if not batch:
+                    break
+
+                # Group the batch by user and calendar month
+                groups = defaultdict(list)
+                for row in batch:
+                    period = row['created_at'].date().replace(day=1)
+                    groups[(row['user_id'], period)].append({
+                        'id': row['id'],
+                        'title': row['title'],
+                        'message': row['message'],
+                        'notification_type': row['notification_type'],
+                        'is_read': True,
+                        'created_at': row['created_at'].isoformat(),
+                    })
+
+                cls.objects.bulk_create([
+                    cls(
+                        user_id=user_id,
+                        period=period,
+                        notification_count=len(items),
+                        payload=zlib.compress(json.dumps(items).encode('utf-8'), 9),
+                    )
+                    for (user_id, period), items in groups.items()
+                ])
+                Notification.objects.filter(pk__in=[row['id'] for row in batch]).delete()
+
+            archived += len(batch)
+        return archived
+
+class ArchivedNotifications:
+    """
+    The notifications in a queryset of archive rows as one newest-first
+    sequence that a paginator can count and slice. Counting reads only the
+    per-archive counts; a slice decompresses just the archives it overlaps.
+    """
+
+    def __init__(self, archives):
+        self.archives = archives
+        self._counts = None
+
+    def counts(self):
+        if self._counts is None:
+            self._counts = list(self.archives.values_list('id', 'notification_count'))
+        return self._counts
+
+    def count(self):
+        return sum(count for _, count in self.counts())
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop, _ = index.indices(self.count())
+        wanted = []
+        offset = 0
+        for archive_id, count in self.counts():
+            if offset < stop and offset + count > start:
+                wanted.append((archive_id, offset))
+            offset += count
+        archives = NotificationArchive.objects.in_bulk([archive_id for archive_id, _ in wanted])
+        items = []
+        for archive_id, archive_offset in wanted:
+            notifications = sorted(
+                archives[archive_id].get_notifications(), key=lambda n: n['created_at'], reverse=True
+            )
+            items.extend(notifications[max(0, start - archive_offset):stop - archive_offset])
+        return items
+
+class MediaBlob(models.Model):
+    """
+    Reference count for a stored media file. With content-addressed storage
+    identical uploads share one file, which is removed only once the last
+    reference to it is deleted.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
+
 class XRayImage(models.Model):
     appointment = models.ForeignKey('Appointment', on_delete=models.CASCADE, related_name='xray_images')
     image = models.ImageField(upload_to='xray_images/')
@@ -306,9 +625,197 @@ class XRayImage(models.Model):
     upload_date = models.DateTimeField(default=timezone.now)
     notes = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # X-ray lists for patients and for the assistants who uploaded them
+            models.Index(fields=['patient', 'upload_date']),
+            models.Index(fields=['assistant', 'upload_date']),
+        ]
+
     def __str__(self):
         return f"X-ray for {self.patient.get_full_name()} uploaded by {self.assistant.get_full_name()}"
 
+    @staticmethod
+    def doctor_access(doctor):
+        """X-rays a doctor may see: their own and those of patients they have consultations with"""
+        return Q(patient=doctor) | Q(patient__patient_consultations__doctor=doctor)
+
+class DicomInstance(models.Model):
+    """
+    An uploaded DICOM image. Study and patient attributes are parsed from
+    the header at upload time; the windowed preview and the 8-bit rendition
+    sent to the ML service are rendered asynchronously, after which the
+    rendition is filed as a regular Scan.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='dicom_instances')
+    file = models.FileField(upload_to='dicom/')
+    preview = models.ImageField(upload_to='dicom_previews/', null=True, blank=True)
+    rendition = models.ImageField(upload_to='dicom_renditions/', null=True, blank=True)
+    scan = models.OneToOneField('Scan', on_delete=models.SET_NULL, null=True, blank=True, related_name='dicom_instance')
+
+    sop_instance_uid = models.CharField(max_length=64, unique=True)
+    study_instance_uid = models.CharField(max_length=64, blank=True, db_index=True)
+    series_instance_uid = models.CharField(max_length=64, blank=True)
+    patient_id = models.CharField(max_length=64, blank=True)
+    patient_name = models.CharField(max_length=255, blank=True)
+    patient_sex = models.CharField(max_length=16, blank=True)
+    patient_birth_date = models.DateField(null=True, blank=True)
+    study_date = models.DateField(null=True, blank=True)
+    study_description = models.CharField(max_length=255, blank=True)
+    modality = models.CharField(max_length=16, blank=True)
+    body_part = models.CharField(max_length=64, blank=True)
+    view_position = models.CharField(max_length=16, blank=True)
+    rows = models.PositiveIntegerField(null=True, blank=True)
+    columns = models.PositiveIntegerField(null=True, blank=True)
+    bits_stored = models.PositiveSmallIntegerField(null=True, blank=True)
+    photometric_interpretation = models.CharField(max_length=16, blank=True)
+    window_center = models.FloatField(null=True, blank=True)
+    window_width = models.FloatField(null=True, blank=True)
+    transfer_syntax = models.CharField(max_length=64, blank=True)
+
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['patient_id', 'study_date']),
+            models.Index(fields=['uploaded_by', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.modality or 'DICOM'} {self.study_date or ''} for {self.patient_name or self.patient_id}".strip()
+
+class UploadSession(models.Model):
+    """
+    A resumable chunked upload. Parts are streamed straight to disk under
+    UPLOAD_SESSION_DIR, so a client on a flaky connection only re-sends the
+    parts that are missing; on completion they are concatenated into a temp
+    file, checked against the declared SHA-256 and saved as the target file.
+    """
+    PURPOSE_CHOICES = [
+        ('xray', 'X-ray Image'),
+        ('scan', 'Scan'),
+        ('dicom', 'DICOM Image'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('assembling', 'Assembling'),
+        ('complete', 'Complete'),
+        ('failed', 'Failed'),
+    ]
+    CHUNK_SIZE = 64 * 1024
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    purpose = models.CharField(max_length=10, choices=PURPOSE_CHOICES)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    total_size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+    metadata = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='pending')
+    result_id = models.PositiveBigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.get_status_display()}) by {self.user.username}"
+
+    @property
+    def total_parts(self):
+        return max(1, math.ceil(self.total_size / self.chunk_size))
+
+    def part_size(self, number):
+        """Expected byte length of a 1-based part number"""
+        if number < self.total_parts:
+            return self.chunk_size
+        return self.total_size - self.chunk_size * (self.total_parts - 1)
+
+    @property
+    def part_dir(self):
+        return os.path.join(settings.UPLOAD_SESSION_DIR, str(self.id))
+
+    def part_path(self, number):
+        return os.path.join(self.part_dir, f'{number:06d}.part')
+
+    def received_parts(self):
+        """Part numbers already stored with their full expected size"""
+        received = []
+        try:
+            entries = os.scandir(self.part_dir)
+        except FileNotFoundError:
+            return received
+        with entries:
+            for entry in entries:
+                if not entry.name.endswith('.part'):
+                    continue
+                number = int(entry.name[:-len('.part')])
+                if 1 <= number <= self.total_parts and entry.stat().st_size == self.part_size(number):
+                    received.append(number)
+        return sorted(received)
+
+    def write_part(self, number, stream):
+        """
+        Copy one part from a readable stream to disk. The part is written to a
+        temp file and renamed into place, so a retried part replaces a partial
+        one atomically. Returns the number of bytes written.
+        """
+        expected = self.part_size(number)
+        os.makedirs(self.part_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.part_dir, suffix='.tmp')
+        written = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while written <= expected:
+                    chunk = stream.read(min(self.CHUNK_SIZE, expected + 1 - written))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    written += len(chunk)
+            if written != expected:
+                raise ValueError(f'Part {number} must be {expected} bytes, received {written}')
+            os.replace(temp_path, self.part_path(number))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return written
+
+    def assemble(self):
+        """
+        Concatenate the parts into a named temp file while hashing them.
+        Returns the open file (positioned at the start) and its SHA-256.
+        """
+        digest = hashlib.sha256()
+        assembled = tempfile.NamedTemporaryFile(dir=settings.UPLOAD_SESSION_DIR, suffix='.upload')
+        for number in range(1, self.total_parts + 1):
+            with open(self.part_path(number), 'rb') as part:
+                while True:
+                    chunk = part.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    assembled.write(chunk)
+        assembled.flush()
+        assembled.seek(0)
+        return assembled, digest.hexdigest()
+
+    def discard_parts(self):
+        shutil.rmtree(self.part_dir, ignore_errors=True)
+
 class Creator(models.Model):
     """
     Model to represent creators/team members with their role and contribution information
@@ -0,0 +1,144 @@
+"""
+Batched retention purges for maintain_db.
+
+Rows are deleted in primary-key order, one short transaction per batch, so
+locks are held briefly and Django's delete collector (which follows
+cascades and sends delete signals) only ever holds one batch in memory.
+When archiving, the rows the collector will cascade to are archived with
+the batch, so a restore brings back children as well as parents.
+Progress is checkpointed after every batch so an interrupted run can be
+resumed with the same cutoff.
+"""
+import gzip
+import json
+import os
+import time
+
+from django.core import serializers
+from django.db import transaction
+from django.db.models.deletion import Collector
+from django.utils import timezone
+
+
+class PurgeState:
+    """
+    Checkpoint of a maintain_db run in a JSON file: the cutoff it started
+    with and, per purge, the last primary key deleted or whether it is done.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = {}
+        return self.data
+
+    def start(self, cutoff):
+        self.data = {'cutoff': cutoff.isoformat(), 'purges': {}}
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(self.data, f)
+        os.replace(temporary, self.path)
+
+    def progress(self, name):
+        return self.data.setdefault('purges', {}).get(name, {})
+
+    def record(self, name, last_pk=None, done=False):
+        self.data.setdefault('purges', {})[name] = {'last_pk': last_pk, 'done': done}
+        self.save()
+
+    def clear(self):
+        self.data = {}
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def archive_rows(objects, directory, name):
+    """
+    Append rows to <directory>/<name>.jsonl.gz in Django's serialization
+    format, so they can be restored with loaddata. The file is flushed to
+    disk before the rows are deleted.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.jsonl.gz")
+    with open(path, 'ab') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='ab') as f:
+            f.write(serializers.serialize('jsonl', objects).encode('utf-8'))
+        raw.flush()
+        os.fsync(raw.fileno())
+    return path
+
+
+def cascaded_rows(collector):
+    """
+    Every row a collected delete removes, parents first: the collected
+    instances and the rows of its fast (signal-free) cascade deletes.
+    Auto-created many-to-many rows are left out; they are serialized with
+    the objects that own them.
+    """
+    collector.sort()
+    for model, instances in reversed(collector.data.items()):
+        if not model._meta.auto_created:
+            yield from sorted(instances, key=lambda instance: instance.pk)
+    for queryset in collector.fast_deletes:
+        if not queryset.model._meta.auto_created:
+            yield from queryset.order_by('pk')
+
+
+def purge_in_batches(queryset, name, state, batch_size=500, sleep=0.5, archive_dir=None, stdout=None):
+    """
+    Delete every row of queryset, batch_size rows at a time, in primary-key
+    order, pausing `sleep` seconds between batches. When archive_dir is
+    set each batch is archived first, with the rows it cascades to. Returns
+    the number of rows deleted (cascaded rows not included).
+    """
+    progress = state.progress(name)
+    if progress.get('done'):
+        return 0
+
+    last_pk = progress.get('last_pk')
+    archive_name = f"{name}-{timezone.now():%Y%m%d}"
+    deleted = 0
+    while True:
+        remaining = queryset.order_by('pk')
+        if last_pk is not None:
+            remaining = remaining.filter(pk__gt=last_pk)
+        pks = list(remaining.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+
+        # Bound the delete by the batch's key range; the queryset's own
+        # filter still applies, so rows that stopped matching are kept
+        batch = queryset.filter(pk__gte=pks[0], pk__lte=pks[-1])
+        with transaction.atomic():
+            if archive_dir:
+                # Collect the cascade once so what is archived is what is deleted
+                collector = Collector(using=batch.db, origin=batch)
+                collector.collect(batch)
+                archive_rows(cascaded_rows(collector), archive_dir, archive_name)
+                collector.delete()
+            else:
+                batch.delete()
+        deleted += len(pks)
+        last_pk = pks[-1]
+        state.record(name, last_pk)
+        if stdout:
+            stdout.write(f"  {name}: deleted {deleted} (up to pk {last_pk})")
+        if len(pks) < batch_size:
+            break
+        if sleep:
+            time.sleep(sleep)
+
+    state.record(name, last_pk, done=True)
+    return deleted
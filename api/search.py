@@ -0,0 +1,219 @@
+from bisect import bisect_left, insort
+from collections import defaultdict
+from django.db.models import Count, Max
+import logging
+import math
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Relative weights of the ways a query token can match an indexed token
+EXACT_MATCH_WEIGHT = 1.0
+PREFIX_MATCH_WEIGHT = 0.8
+FUZZY_MATCH_WEIGHT = 0.6
+
+def tokenize(text):
+    """Split text into lowercased word tokens, ignoring single characters"""
+    return [token for token in TOKEN_RE.findall((text or '').lower()) if len(token) > 1]
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance between a and b, giving up once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+def max_typos(token):
+    return 1 if len(token) <= 5 else 2
+
+class DoctorSearchIndex:
+    """
+    In-process inverted index over Doctor.search_document.
+
+    Used where the database has no full-text search (SQLite). The index is
+    built lazily on first use and then updated incrementally from the Doctor
+    post_save/post_delete signals. Changes made by other processes are picked
+    up from the database: before each search the doctor count and latest
+    updated_at are compared with the index's, doctors saved since are
+    re-indexed and a deletion elsewhere triggers a rebuild. Matches are exact, prefix (for search as
+    you type) or within a small edit distance (for typos), and results are
+    ranked by a tf-idf style score.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._postings = defaultdict(dict)  # token -> {doctor_id: term frequency}
+        self._documents = {}  # doctor_id -> {token: term frequency}
+        self._trigrams = defaultdict(set)  # trigram -> tokens containing it
+        self._vocabulary = []  # sorted tokens, for prefix lookups
+        self._version = None  # (doctor count, latest updated_at) when last synced
+        self._built = False
+
+    def _database_version(self):
+        from .models import Doctor
+
+        state = Doctor.objects.order_by().aggregate(count=Count('id'), latest=Max('updated_at'))
+        return state['count'], state['latest']
+
+    def build(self):
+        from .models import Doctor
+
+        with self._lock:
+            self._reset()
+            # Read the version first so a save during the build is seen next time
+            version = self._database_version()
+            rows = Doctor.objects.order_by().values_list('id', 'search_document')
+            for doctor_id, document in rows.iterator():
+                self._add(doctor_id, document)
+            self._version = version
+            self._built = True
+        logger.info(f"Built doctor search index with {len(self._documents)} documents")
+
+    def _ensure_current(self):
+        from .models import Doctor
+
+        if not self._built:
+            self.build()
+            return
+        version = self._database_version()
+        if version == self._version:
+            return
+        count, latest = version
+        synced_latest = self._version[1]
+        if synced_latest is not None and latest is not None:
+            # Re-index doctors saved since the last sync, by any process
+            changed = (
+                Doctor.objects.order_by().filter(updated_at__gte=synced_latest)
+                .values_list('id', 'search_document')
+            )
+            for doctor_id, document in changed.iterator():
+                self._remove(doctor_id)
+                self._add(doctor_id, document)
+            if len(self._documents) == count:
+                self._version = version
+                return
+        # Doctors were deleted elsewhere; only a rebuild finds which
+        self.build()
+
+    def _add(self, doctor_id, document):
+        frequencies = defaultdict(int)
+        for token in tokenize(document):
+            frequencies[token] += 1
+        self._documents[doctor_id] = dict(frequencies)
+        for token, frequency in frequencies.items():
+            if token not in self._postings:
+                insort(self._vocabulary, token)
+                for gram in trigrams(token):
+                    self._trigrams[gram].add(token)
+            self._postings[token][doctor_id] = frequency
+
+    def _remove(self, doctor_id):
+        for token in self._documents.pop(doctor_id, {}):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(doctor_id, None)
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+                for gram in trigrams(token):
+                    self._trigrams[gram].discard(token)
+                    if not self._trigrams[gram]:
+                        del self._trigrams[gram]
+
+    def update(self, doctor_id, document):
+        """Re-index a single doctor after it has been saved"""
+        with self._lock:
+            if not self._built:
+                return
+            self._remove(doctor_id)
+            self._add(doctor_id, document)
+
+    def remove(self, doctor_id):
+        """Drop a deleted doctor from the index"""
+        with self._lock:
+            if not self._built:
+                return
+            self._remove(doctor_id)
+
+    def _candidates(self, query_token):
+        """Return {indexed token: match weight} for a single query token"""
+        candidates = {}
+        if query_token in self._postings:
+            candidates[query_token] = EXACT_MATCH_WEIGHT
+
+        position = bisect_left(self._vocabulary, query_token)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(query_token):
+            token = self._vocabulary[position]
+            candidates.setdefault(token, PREFIX_MATCH_WEIGHT)
+            position += 1
+
+        if len(query_token) >= 3:
+            limit = max_typos(query_token)
+            shared = defaultdict(int)
+            for gram in trigrams(query_token):
+                for token in self._trigrams.get(gram, ()):
+                    shared[token] += 1
+            for token, count in shared.items():
+                if token in candidates or count < 2:
+                    continue
+                distance = edit_distance(query_token, token, limit)
+                if distance <= limit:
+                    candidates[token] = FUZZY_MATCH_WEIGHT * (1 - distance / (len(query_token) + 1))
+        return candidates
+
+    def search(self, query):
+        """
+        Return doctor IDs matching every token in the query, best match first.
+        """
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+
+        with self._lock:
+            self._ensure_current()
+            total_documents = max(len(self._documents), 1)
+            scores = None
+            for query_token in query_tokens:
+                token_scores = defaultdict(float)
+                for token, weight in self._candidates(query_token).items():
+                    postings = self._postings[token]
+                    idf = math.log(1 + total_documents / len(postings))
+                    for doctor_id, frequency in postings.items():
+                        score = weight * idf * (1 + math.log(frequency))
+                        token_scores[doctor_id] = max(token_scores[doctor_id], score)
+                if scores is None:
+                    scores = dict(token_scores)
+                else:
+                    scores = {
+                        doctor_id: score + token_scores[doctor_id]
+                        for doctor_id, score in scores.items()
+                        if doctor_id in token_scores
+                    }
+                if not scores:
+                    return []
+
+        return [doctor_id for doctor_id, _ in sorted(scores.items(), key=lambda item: (-item[1], item[0]))]
+
+doctor_search_index = DoctorSearchIndex()
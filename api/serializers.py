@@ -1,7 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import UserProfile, Scan, Appointment, Payment, Consultation, Doctor, Notification, XRayImage, Creator
+from .models import UserProfile, Scan, Appointment, Payment, Consultation, Doctor, DoctorReview, Notification, XRayImage, Creator, UploadSession, DicomInstance
+from .images import derivative_urls
+from .media import signed_media_url
+from .validators import UploadedFileField, PROFILE_PICTURE_TYPES
 import logging
+import re
+from django.conf import settings
 from django.utils import timezone
 import pytz
 
@@ -23,11 +28,19 @@ class UserSerializer(serializers.ModelSerializer):
 class UserProfileSerializer(serializers.ModelSerializer):
     # Add nested user serializer to include user data
     user_data = serializers.SerializerMethodField()
+    profile_picture = UploadedFileField(
+        types=PROFILE_PICTURE_TYPES, max_size_setting='PROFILE_PICTURE_MAX_SIZE',
+        required=False, allow_null=True, write_only=True
+    )
+    profile_picture_url = serializers.SerializerMethodField()
     
     class Meta:
         model = UserProfile
-        fields = ['id', 'user', 'user_data', 'phone_number', 'address', 'profile_picture']
+        fields = ['id', 'user', 'user_data', 'phone_number', 'address', 'profile_picture', 'profile_picture_url']
         read_only_fields = ['id', 'user']
+
+    def get_profile_picture_url(self, obj):
+        return signed_media_url(obj.profile_picture, self.context.get('request'))
     
     def get_user_data(self, obj):
         # Return serialized user data
@@ -106,11 +119,18 @@ class AdminConsultationSerializer(serializers.ModelSerializer):
         return None
 
 class ScanSerializer(serializers.ModelSerializer):
+    # Read through the signed image_url; the stored URL needs authorization
+    image = UploadedFileField(write_only=True)
+    image_url = serializers.SerializerMethodField()
+
     class Meta:
         model = Scan
-        fields = ['id', 'user', 'image', 'upload_date', 'status', 'result', 'confidence_score', 'notes']
+        fields = ['id', 'user', 'image', 'image_url', 'upload_date', 'status', 'result', 'confidence_score', 'notes']
         read_only_fields = ['id', 'user', 'upload_date']
 
+    def get_image_url(self, obj):
+        return signed_media_url(obj.image, self.context.get('request'))
+
 class AppointmentSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     
@@ -245,6 +265,11 @@ class DoctorSerializer(serializers.ModelSerializer):
     full_name = serializers.SerializerMethodField()
     specialty_display = serializers.SerializerMethodField()
     profile_picture_url = serializers.SerializerMethodField()
+    profile_picture_thumbnails = serializers.SerializerMethodField()
+    profile_picture = UploadedFileField(
+        types=PROFILE_PICTURE_TYPES, max_size_setting='PROFILE_PICTURE_MAX_SIZE',
+        required=False, allow_null=True, write_only=True
+    )
     gender_display = serializers.SerializerMethodField()
     user_id = serializers.IntegerField(write_only=True, source='user.id', required=False)
     
@@ -253,12 +278,12 @@ class DoctorSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'user', 'user_id', 'full_name', 'specialty', 'specialty_display',
             'years_of_experience', 'age', 'gender', 'gender_display',
-            'license_number', 'profile_picture', 'profile_picture_url', 
+            'license_number', 'profile_picture', 'profile_picture_url', 'profile_picture_thumbnails',
             'bio', 'education', 'awards', 'languages',
-            'consultation_fee', 'rating', 'total_consultations', 
-            'is_accepting_new_patients'
+            'consultation_fee', 'rating', 'review_count', 'total_consultations',
+            'completed_consultations', 'is_accepting_new_patients'
         ]
-        read_only_fields = ['id', 'rating', 'total_consultations']
+        read_only_fields = ['id', 'rating', 'review_count', 'total_consultations', 'completed_consultations']
     
     def get_full_name(self, obj):
         return obj.user.get_full_name()
@@ -270,9 +295,10 @@ class DoctorSerializer(serializers.ModelSerializer):
         return obj.get_gender_display() if obj.gender else None
     
     def get_profile_picture_url(self, obj):
-        if obj.profile_picture:
-            return obj.profile_picture.url
-        return None
+        return signed_media_url(obj.profile_picture, self.context.get('request'))
+
+    def get_profile_picture_thumbnails(self, obj):
+        return derivative_urls(obj.profile_picture, self.context.get('request'))
         
     def create(self, validated_data):
         """Custom create method to handle user relationship properly"""
@@ -329,6 +355,83 @@ class DoctorSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
+class DoctorReviewSerializer(serializers.ModelSerializer):
+    patient_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DoctorReview
+        fields = ['id', 'consultation', 'patient', 'patient_name', 'doctor', 'rating', 'comment', 'created_at']
+        read_only_fields = ['id', 'consultation', 'patient', 'doctor', 'created_at']
+
+    def get_patient_name(self, obj):
+        return obj.patient.get_full_name()
+
+class DicomInstanceSerializer(serializers.ModelSerializer):
+    file_url = serializers.SerializerMethodField()
+    preview_url = serializers.SerializerMethodField()
+    rendition_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DicomInstance
+        fields = [
+            'id', 'uploaded_by', 'scan', 'file_url', 'preview_url', 'rendition_url',
+            'sop_instance_uid', 'study_instance_uid', 'series_instance_uid',
+            'patient_id', 'patient_name', 'patient_sex', 'patient_birth_date',
+            'study_date', 'study_description', 'modality', 'body_part', 'view_position',
+            'rows', 'columns', 'bits_stored', 'photometric_interpretation',
+            'window_center', 'window_width', 'transfer_syntax',
+            'status', 'error', 'created_at'
+        ]
+        read_only_fields = fields
+
+    def get_file_url(self, obj):
+        return signed_media_url(obj.file, self.context.get('request'))
+
+    def get_preview_url(self, obj):
+        return signed_media_url(obj.preview, self.context.get('request'))
+
+    def get_rendition_url(self, obj):
+        return signed_media_url(obj.rendition, self.context.get('request'))
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    total_parts = serializers.IntegerField(read_only=True)
+    received_parts = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'purpose', 'filename', 'content_type', 'total_size', 'sha256', 'metadata',
+            'chunk_size', 'total_parts', 'received_parts', 'status', 'result_id',
+            'created_at', 'expires_at', 'completed_at'
+        ]
+        read_only_fields = ['id', 'chunk_size', 'status', 'result_id', 'created_at', 'expires_at', 'completed_at']
+
+    def get_received_parts(self, obj):
+        return obj.received_parts()
+
+    def validate_total_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Upload size must be positive")
+        if value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Upload size must not exceed {settings.UPLOAD_MAX_SIZE} bytes")
+        return value
+
+    def validate_sha256(self, value):
+        value = value.lower()
+        if not re.fullmatch(r'[0-9a-f]{64}', value):
+            raise serializers.ValidationError("Expected a hex encoded SHA-256 digest")
+        return value
+
+    def validate(self, attrs):
+        if attrs.get('purpose') == 'xray':
+            metadata = attrs.get('metadata') or {}
+            missing = [key for key in ('appointment', 'patient', 'assistant') if not metadata.get(key)]
+            if missing:
+                raise serializers.ValidationError({'metadata': f"X-ray uploads require {', '.join(missing)}"})
+            if not Appointment.objects.filter(id=metadata['appointment']).exists():
+                raise serializers.ValidationError({'metadata': "Appointment not found"})
+        return attrs
+
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
@@ -367,11 +470,16 @@ class NotificationSerializer(serializers.ModelSerializer):
 class XRayImageSerializer(serializers.ModelSerializer):
     patient = UserSerializer(read_only=True)
     assistant = UserSerializer(read_only=True)
+    image = UploadedFileField(write_only=True)
+    image_url = serializers.SerializerMethodField()
     
     class Meta:
         model = XRayImage
-        fields = ['id', 'appointment', 'image', 'patient', 'assistant', 'upload_date', 'notes']
+        fields = ['id', 'appointment', 'image', 'image_url', 'patient', 'assistant', 'upload_date', 'notes']
         read_only_fields = ['id', 'upload_date']
+
+    def get_image_url(self, obj):
+        return signed_media_url(obj.image, self.context.get('request'))
     
     def create(self, validated_data):
         """
@@ -428,17 +536,20 @@ class CreatorSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(source='user.email', read_only=True)
     phone_number = serializers.CharField(source='user.profile.phone_number', read_only=True)
     profile_picture = serializers.SerializerMethodField()
+    profile_picture_thumbnails = serializers.SerializerMethodField()
     
     class Meta:
         model = Creator
         fields = ['id', 'first_name', 'last_name', 'email', 'phone_number', 
                   'job_title', 'role', 'contribution', 'is_active', 
-                  'profile_picture', 'created_at', 'updated_at']
+                  'profile_picture', 'profile_picture_thumbnails', 'created_at', 'updated_at']
     
     def get_profile_picture(self, obj):
-        request = self.context.get('request')
         if hasattr(obj.user, 'profile') and obj.user.profile.profile_picture:
-            if request:
-                return request.build_absolute_uri(obj.user.profile.profile_picture.url)
-            return obj.user.profile.profile_picture.url
-        return None 
\ No newline at end of file
+            return signed_media_url(obj.user.profile.profile_picture, self.context.get('request'))
+        return None
+
+    def get_profile_picture_thumbnails(self, obj):
+        if hasattr(obj.user, 'profile') and obj.user.profile.profile_picture:
+            return derivative_urls(obj.user.profile.profile_picture, self.context.get('request'))
+        return None
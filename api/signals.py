@@ -1,7 +1,12 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import UserProfile
+from .models import UserProfile, Doctor, Consultation, Scan, XRayImage
+from .cache import invalidate_doctor_directory
+from .search import doctor_search_index
+from .images import derivatives_exist
+from .tasks import optimize_uploaded_image
 import logging
 
 logger = logging.getLogger(__name__)
@@ -25,4 +30,108 @@ def save_user_profile(sender, instance, created, **kwargs):
                 instance.profile.save()
                 logger.info(f"Saved user profile for {instance.username}")
         except Exception as e:
-            logger.error(f"Error saving profile for {instance.username}: {str(e)}") 
\ No newline at end of file
+            logger.error(f"Error saving profile for {instance.username}: {str(e)}")
+
+# User and profile fields that feed into cached or indexed doctor directory
+# data (DoctorSerializer embeds UserSerializer, which adds the phone number)
+DIRECTORY_USER_FIELDS = (
+    'is_active', 'first_name', 'last_name', 'username', 'email', 'role', 'subscription_type'
+)
+DIRECTORY_PROFILE_FIELDS = ('phone_number',)
+
+def changed_fields(instance, fields, update_fields=None):
+    """Which of fields differ from the stored row, read before the save"""
+    if not instance.pk:
+        return set()
+    if update_fields is not None:
+        fields = tuple(field for field in fields if field in update_fields)
+        if not fields:
+            return set()
+    previous = type(instance).objects.filter(pk=instance.pk).values(*fields).first()
+    if previous is None:
+        return set()
+    return {field for field in fields if previous[field] != getattr(instance, field)}
+
+@receiver(pre_save, sender=User)
+def track_user_directory_changes(sender, instance, update_fields=None, **kwargs):
+    # Remember which directory-relevant fields are changing so the doctor
+    # caches and search index can be refreshed once the save goes through;
+    # saves that only touch other fields (last_login) cost nothing
+    instance._changed_directory_fields = changed_fields(instance, DIRECTORY_USER_FIELDS, update_fields)
+
+@receiver(pre_save, sender=UserProfile)
+def track_profile_directory_changes(sender, instance, update_fields=None, **kwargs):
+    instance._changed_directory_fields = changed_fields(instance, DIRECTORY_PROFILE_FIELDS, update_fields)
+
+@receiver(post_save, sender=User)
+def invalidate_directory_on_user_change(sender, instance, created, **kwargs):
+    changed = getattr(instance, '_changed_directory_fields', set())
+    if not changed or not Doctor.objects.filter(user_id=instance.pk).exists():
+        return
+    if changed & {'first_name', 'last_name'}:
+        # Re-saving the doctor rebuilds its search document and re-indexes
+        # it, which also invalidates the directory
+        for doctor in Doctor.objects.filter(user=instance):
+            doctor.user = instance
+            doctor.save(update_fields=['search_document'])
+    else:
+        transaction.on_commit(invalidate_doctor_directory)
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_directory_on_profile_change(sender, instance, created, **kwargs):
+    if getattr(instance, '_changed_directory_fields', set()) and Doctor.objects.filter(user_id=instance.user_id).exists():
+        transaction.on_commit(invalidate_doctor_directory)
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def invalidate_directory_on_doctor_change(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_doctor_directory)
+
+@receiver(post_save, sender=Doctor)
+def update_doctor_search_index(sender, instance, **kwargs):
+    doctor_id, document = instance.pk, instance.search_document
+    transaction.on_commit(lambda: doctor_search_index.update(doctor_id, document))
+
+@receiver(post_delete, sender=Doctor)
+def remove_doctor_from_search_index(sender, instance, **kwargs):
+    doctor_id = instance.pk
+    transaction.on_commit(lambda: doctor_search_index.remove(doctor_id))
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=Doctor)
+def schedule_profile_picture_derivatives(sender, instance, **kwargs):
+    # The upload is optimized and its thumbnails rendered off the request once
+    # it is committed; afterwards the thumbnails exist and nothing is queued.
+    # A broker outage is logged (robust) rather than failing the saved upload
+    name = instance.profile_picture.name if instance.profile_picture else None
+    if name and not derivatives_exist(name):
+        transaction.on_commit(lambda: optimize_uploaded_image.delay(name, derivatives=True), robust=True)
+
+@receiver(post_save, sender=Scan)
+@receiver(post_save, sender=XRayImage)
+def schedule_image_optimization(sender, instance, created, **kwargs):
+    name = instance.image.name if instance.image else None
+    if created and name:
+        transaction.on_commit(lambda: optimize_uploaded_image.delay(name), robust=True)
+
+@receiver(pre_save, sender=Consultation)
+def track_consultation_status_change(sender, instance, **kwargs):
+    # Completing an existing consultation claims the change with a conditional
+    # update, so two requests completing it at once count it only once. Other
+    # saves, and saves of one already loaded as completed, add no query
+    instance._completed_now = False
+    if instance.pk is None or instance.status != 'completed':
+        return
+    if getattr(instance, '_loaded_status', None) == 'completed':
+        return
+    instance._completed_now = bool(
+        Consultation.objects.filter(pk=instance.pk).exclude(status='completed').update(status='completed')
+    )
+
+@receiver(post_save, sender=Consultation)
+def update_doctor_consultation_stats(sender, instance, created, **kwargs):
+    if created:
+        Doctor.record_consultation_created(instance.doctor_id)
+    if instance._completed_now or (created and instance.status == 'completed'):
+        Doctor.record_consultation_completed(instance.doctor_id)
+    instance._loaded_status = instance.status
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+
+# <upload_to dir>/<first two hex digits>/<sha256><ext>
+CONTENT_ADDRESSED_NAME_RE = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.[^/]*)?$')
+
+
+def content_addressed_name(directory, hexdigest, extension):
+    return posixpath.join(directory, hexdigest[:2], hexdigest + extension.lower())
+
+
+def is_content_addressed(name):
+    return bool(CONTENT_ADDRESSED_NAME_RE.search(name or ''))
+
+
+def upload_directory(name):
+    """The upload_to directory of a stored name, without the hash fan-out"""
+    directory = posixpath.dirname(name)
+    return posixpath.dirname(directory) if is_content_addressed(name) else directory
+
+
+def media_file_fields():
+    """(model, field name) for every FileField/ImageField in the api app"""
+    for model in apps.get_app_config('api').get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, models.FileField):
+                yield model, field.name
+
+
+def hash_file(file):
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in file.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Filesystem storage that names every upload by the SHA-256 of its content,
+    inside the directory chosen by the field's upload_to. Identical uploads
+    share a single file and MediaBlob rows count the references to it, so a
+    file is only removed from disk when its last reference is deleted.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from the content in _save, never suffixed
+        return name
+
+    def _save(self, name, content):
+        hexdigest, size = hash_file(content)
+        directory, filename = posixpath.split(name)
+        target = content_addressed_name(directory, hexdigest, os.path.splitext(filename)[1])
+        if not self.exists(target):
+            self._write(target, content)
+        self._retain(target, hexdigest, size)
+        return target
+
+    def _write(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            # Identical content, so a concurrent writer racing us is harmless
+            os.replace(temp_path, full_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+    def _retain(self, name, sha256, size):
+        from .models import MediaBlob
+
+        if MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1):
+            return
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(name=name, sha256=sha256, size=size, ref_count=1)
+        except IntegrityError:
+            MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+
+    def retain(self, name):
+        """Record an extra reference to an already stored file"""
+        if not name or not self.exists(name):
+            return
+        stem = os.path.splitext(posixpath.basename(name))[0]
+        sha256 = stem if is_content_addressed(name) else ''
+        self._retain(name, sha256, self.size(name))
+
+    def release(self, name):
+        """Drop a reference but keep the file; collect_media_garbage removes it once unreferenced"""
+        from .models import MediaBlob
+
+        MediaBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+    def delete(self, name):
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is not None and blob.ref_count > 1:
+                MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+                return
+            if blob is not None:
+                blob.delete()
+        super().delete(name)
+
+
+def retain_media(name):
+    """Count a copied file reference when the default storage tracks them"""
+    if hasattr(default_storage, 'retain'):
+        default_storage.retain(name)
+
+
+def release_media(name):
+    """Count a dropped file reference without deleting the file"""
+    if hasattr(default_storage, 'release'):
+        default_storage.release(name)
@@ -1,7 +1,7 @@
 from celery import shared_task
 from django.core.mail import send_mail
 from django.conf import settings
-from .models import Scan, Appointment, Payment
+from .models import Scan, Appointment, Payment, NotificationArchive, Doctor, Consultation, DoctorReview, UploadSession, DicomInstance
 import logging
 
 logger = logging.getLogger('api')
@@ -110,4 +110,141 @@ def send_notification(user_id, title, message):
         return True
     except Exception as e:
         logger.error(f"Error sending notification to user {user_id}: {str(e)}")
-        return False 
\ No newline at end of file
+        return False 
+
+@shared_task
+def archive_read_notifications(days=None):
+    try:
+        from django.utils import timezone
+        from datetime import timedelta
+
+        days = days if days is not None else settings.NOTIFICATION_RETENTION_DAYS
+        cutoff = timezone.now() - timedelta(days=days)
+        count = NotificationArchive.archive_read_notifications(cutoff)
+
+        logger.info(f"Archived {count} read notifications older than {days} days")
+        return count
+    except Exception as e:
+        logger.error(f"Error archiving notifications: {str(e)}")
+        return 0
+
+@shared_task
+def reconcile_doctor_stats():
+    """
+    Recompute doctor statistics from the source rows, correcting any drift in
+    the incrementally maintained counters (e.g. after deletes).
+    """
+    try:
+        from django.db.models import Avg, Count, DecimalField, OuterRef, Subquery
+        from django.db.models.functions import Coalesce
+        from .cache import invalidate_doctor_directory
+
+        consultations = Consultation.objects.filter(doctor=OuterRef('user')).order_by().values('doctor')
+        reviews = DoctorReview.objects.filter(doctor=OuterRef('user')).order_by().values('doctor')
+
+        updated = Doctor.objects.update(
+            total_consultations=Coalesce(
+                Subquery(consultations.annotate(count=Count('id')).values('count')), 0
+            ),
+            completed_consultations=Coalesce(
+                Subquery(consultations.filter(status='completed').annotate(count=Count('id')).values('count')), 0
+            ),
+            review_count=Coalesce(
+                Subquery(reviews.annotate(count=Count('id')).values('count')), 0
+            ),
+        )
+        # Doctors without reviews keep their existing rating
+        Doctor.objects.filter(review_count__gt=0).update(
+            rating=Subquery(
+                reviews.annotate(average=Avg('rating')).values('average'),
+                output_field=DecimalField(max_digits=3, decimal_places=2)
+            )
+        )
+        invalidate_doctor_directory()
+
+        logger.info(f"Reconciled statistics for {updated} doctors")
+        return updated
+    except Exception as e:
+        logger.error(f"Error reconciling doctor statistics: {str(e)}")
+        return 0
+
+
+@shared_task
+def optimize_uploaded_image(name, derivatives=False):
+    """
+    Strip metadata from a stored JPEG/PNG upload and recompress it losslessly,
+    then render its thumbnails if asked to (they follow the optimized file)
+    """
+    from .images import optimize_stored_image, derivatives_exist, generate_derivatives
+
+    current = name
+    if settings.IMAGE_OPTIMIZE_UPLOADS:
+        try:
+            current = optimize_stored_image(name)
+        except Exception as e:
+            logger.error(f"Error optimizing {name}: {str(e)}")
+
+    if derivatives and current and not derivatives_exist(current):
+        try:
+            generate_derivatives(current)
+        except Exception as e:
+            logger.error(f"Error generating derivatives for {current}: {str(e)}")
+    return current
+
+
+@shared_task
+def cleanup_upload_sessions():
+    """Drop staged parts of abandoned and expired resumable uploads"""
+    try:
+        from django.utils import timezone
+
+        expired = UploadSession.objects.filter(expires_at__lt=timezone.now()).exclude(status='assembling')
+        count = 0
+        for session in expired.iterator():
+            session.discard_parts()
+            session.delete()
+            count += 1
+
+        logger.info(f"Removed {count} expired upload sessions")
+        return count
+    except Exception as e:
+        logger.error(f"Error cleaning up upload sessions: {str(e)}")
+        return 0
+
+
+@shared_task
+def process_dicom(instance_id):
+    """Render the preview and ML rendition of a DICOM upload and file it as a Scan"""
+    try:
+        from django.core.files.base import ContentFile
+        from .dicom import render_dicom
+        from .storage import retain_media
+
+        instance = DicomInstance.objects.get(id=instance_id)
+        instance.status = 'processing'
+        instance.save(update_fields=['status'])
+
+        with instance.file.open('rb') as f:
+            preview, rendition = render_dicom(f)
+        stem = instance.sop_instance_uid
+        instance.preview.save(f'{stem}.jpg', ContentFile(preview), save=False)
+        instance.rendition.save(f'{stem}.png', ContentFile(rendition), save=False)
+
+        if instance.scan_id is None:
+            description = ' '.join(filter(None, [instance.modality, instance.body_part, instance.study_description]))
+            instance.scan = Scan.objects.create(
+                user=instance.uploaded_by,
+                image=instance.rendition.name,
+                notes=f"DICOM study {instance.study_date or ''} {description}".strip()
+            )
+            retain_media(instance.rendition.name)
+
+        instance.status = 'ready'
+        instance.error = ''
+        instance.save(update_fields=['preview', 'rendition', 'scan', 'status', 'error'])
+        logger.info(f"Processed DICOM instance {instance_id}")
+        return True
+    except Exception as e:
+        logger.error(f"Error processing DICOM instance {instance_id}: {str(e)}")
+        DicomInstance.objects.filter(id=instance_id).update(status='failed', error=str(e))
+        return False
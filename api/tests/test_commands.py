@@ -0,0 +1,307 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+import dj_database_url
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from api.images import derivative_name, get_thumbnail_sizes
+from api.management.commands.check_query_plans import unindexed_reads
+from api.models import Appointment, Doctor, MediaBlob, Scan, XRayImage
+from api.tests.utils import TemporaryMediaMixin, make_user
+
+
+class MaintainDbTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        purge_settings = override_settings(
+            DB_PURGE_ARCHIVE_DIR=os.path.join(self.directory, 'archive'),
+            DB_PURGE_STATE_FILE=os.path.join(self.directory, 'state.json'),
+        )
+        purge_settings.enable()
+        self.addCleanup(purge_settings.disable)
+        self.patient = make_user('patient')
+        self.assistant = make_user('assistant', role='assistant')
+        old = timezone.now() - timedelta(days=90)
+        self.old = [
+            Appointment.objects.create(user=self.patient, date_time=old + timedelta(hours=i), status='completed')
+            for i in range(5)
+        ]
+        self.recent = Appointment.objects.create(user=self.patient, date_time=timezone.now(), status='completed')
+        self.xray = XRayImage.objects.create(
+            appointment=self.old[0], image='xray_images/old.jpg', patient=self.patient, assistant=self.assistant
+        )
+
+    def maintain(self, *args):
+        call_command('maintain_db', '--sleep=0', *args, stdout=StringIO())
+
+    def archived(self):
+        rows = []
+        for name in os.listdir(os.path.join(self.directory, 'archive')):
+            with gzip.open(os.path.join(self.directory, 'archive', name), 'rt') as f:
+                rows.extend(json.loads(line) for line in f if line.strip())
+        return rows
+
+    def test_purges_old_rows_in_batches(self):
+        self.maintain('--batch-size=2')
+        self.assertEqual(list(Appointment.objects.all()), [self.recent])
+        self.assertFalse(XRayImage.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'state.json')))
+
+    def test_archive_includes_cascaded_rows(self):
+        self.maintain('--batch-size=2', '--archive')
+        archived = self.archived()
+        self.assertEqual(
+            sorted(row['pk'] for row in archived if row['model'] == 'api.appointment'),
+            sorted(appointment.pk for appointment in self.old)
+        )
+        self.assertEqual([row['pk'] for row in archived if row['model'] == 'api.xrayimage'], [self.xray.pk])
+
+        # The archive restores the children along with their parents
+        archive_dir = os.path.join(self.directory, 'archive')
+        for name in os.listdir(archive_dir):
+            call_command('loaddata', os.path.join(archive_dir, name), verbosity=0)
+        self.assertEqual(Appointment.objects.count(), 6)
+        self.assertTrue(XRayImage.objects.filter(pk=self.xray.pk, appointment=self.old[0]).exists())
+
+    def test_resume_continues_with_the_original_cutoff(self):
+        state = {'cutoff': (timezone.now() - timedelta(days=200)).isoformat(), 'purges': {}}
+        with open(os.path.join(self.directory, 'state.json'), 'w') as f:
+            json.dump(state, f)
+        self.maintain('--resume')
+        # Nothing is older than the interrupted run's cutoff
+        self.assertEqual(Appointment.objects.count(), 6)
+
+    def test_dry_run_deletes_nothing(self):
+        self.maintain('--dry-run')
+        self.assertEqual(Appointment.objects.count(), 6)
+
+
+class CollectMediaGarbageTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        patient = make_user('patient')
+        size_label = next(iter(get_thumbnail_sizes()))
+        self.kept = self.store('scans/kept.jpg')
+        Scan.objects.create(user=patient, image=self.kept)
+        self.derivative = self.store(derivative_name(self.kept, size_label, 'webp'))
+        self.orphan = self.store('scans/orphan.jpg')
+        MediaBlob.objects.create(name=self.orphan, ref_count=1)
+        self.orphan_derivative = self.store(derivative_name(self.orphan, size_label, 'webp'))
+        self.recent = self.store('scans/recent.jpg', age_hours=1)
+
+    def store(self, name, age_hours=48):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'image')
+        modified = time.time() - age_hours * 3600
+        os.utime(path, (modified, modified))
+        return name
+
+    def remaining(self):
+        return {
+            os.path.relpath(os.path.join(directory, name), self.media_root).replace(os.sep, '/')
+            for directory, _, names in os.walk(self.media_root) for name in names
+        }
+
+    def test_removes_old_orphans_only(self):
+        call_command('collect_media_garbage', stdout=StringIO())
+        self.assertEqual(self.remaining(), {self.kept, self.derivative, self.recent})
+        self.assertFalse(MediaBlob.objects.filter(name=self.orphan).exists())
+
+    def test_quarantines_orphans(self):
+        quarantine = os.path.join(self.media_root, 'quarantine')
+        with override_settings(MEDIA_QUARANTINE_DIR=quarantine):
+            call_command('collect_media_garbage', '--quarantine', stdout=StringIO())
+        self.assertEqual(self.remaining(), {
+            self.kept, self.derivative, self.recent,
+            f'quarantine/{self.orphan}', f'quarantine/{self.orphan_derivative}',
+        })
+
+    def test_dry_run_removes_nothing(self):
+        before = self.remaining()
+        output = StringIO()
+        call_command('collect_media_garbage', '--dry-run', stdout=output)
+        self.assertEqual(self.remaining(), before)
+        self.assertIn(self.orphan, output.getvalue())
+
+
+class DedupeMediaTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.patient = make_user('patient')
+        self.first = self.scan('scans/first.jpg', b'same image')
+        self.second = self.scan('scans/second.jpg', b'same image')
+        self.other = self.scan('scans/other.jpg', b'other image')
+        MediaBlob.objects.create(name='scans/first.jpg', ref_count=1)
+        # Counts kept up by uploads running alongside must survive the run
+        MediaBlob.objects.create(name='scans/ab/' + 'ab' * 32 + '.jpg', ref_count=3)
+
+    def scan(self, name, content):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return Scan.objects.create(user=self.patient, image=name)
+
+    def dedupe(self):
+        call_command('dedupe_media', stdout=StringIO())
+        for scan in (self.first, self.second, self.other):
+            scan.refresh_from_db()
+
+    def counts(self):
+        return dict(MediaBlob.objects.values_list('name', 'ref_count'))
+
+    def test_merges_duplicates_and_moves_references(self):
+        self.dedupe()
+        merged = self.first.image.name
+        self.assertEqual(self.second.image.name, merged)
+        self.assertNotEqual(self.other.image.name, merged)
+        self.assertEqual(self.counts(), {
+            merged: 2, self.other.image.name: 1, 'scans/ab/' + 'ab' * 32 + '.jpg': 3,
+        })
+        for name in ('first.jpg', 'second.jpg', 'other.jpg'):
+            self.assertFalse(os.path.exists(os.path.join(self.media_root, 'scans', name)))
+        with self.first.image.open('rb') as f:
+            self.assertEqual(f.read(), b'same image')
+
+        counts = self.counts()
+        self.dedupe()
+        self.assertEqual(self.counts(), counts)
+
+    def test_interrupted_run_leaves_rows_on_existing_files(self):
+        from api.management.commands.dedupe_media import Command
+
+        with mock.patch.object(Command, 'move_references', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                call_command('dedupe_media', stdout=StringIO())
+        for scan in (self.first, self.second, self.other):
+            scan.refresh_from_db()
+            self.assertTrue(os.path.exists(scan.image.path))
+
+        self.dedupe()
+        self.assertEqual(self.first.image.name, self.second.image.name)
+        self.assertEqual(self.counts()[self.first.image.name], 2)
+
+
+class MigrateToPostgresTests(TransactionTestCase):
+    """Copies into a scratch SQLite database, which takes the same code path"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.target_url = f"sqlite:///{os.path.join(cls.directory, 'target.sqlite3')}"
+        config = dj_database_url.parse(cls.target_url)
+        connections.settings['migration_target'] = connections.configure_settings(
+            {**connections.settings, 'migration_target': config}
+        )['migration_target']
+        call_command('migrate', database='migration_target', verbosity=0)
+        # Set here rather than on the class: the runner only sets up configured aliases
+        cls.databases = {'default', 'migration_target'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['migration_target'].close()
+        del connections['migration_target']
+        del connections.settings['migration_target']
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def test_copies_every_table(self):
+        patient = make_user('patient')
+        doctor_user = make_user('house', role='doctor', first_name='Gregory')
+        doctor = Doctor.objects.create(user=doctor_user, specialty='neurology', license_number='LIC-1')
+        appointment = Appointment.objects.create(
+            user=patient, date_time=timezone.now(), status='completed',
+            created_at=timezone.now() - timedelta(days=3)
+        )
+        Scan.objects.create(user=patient, image='scans/scan.jpg')
+
+        output = StringIO()
+        call_command(
+            'migrate_to_postgres', '--target=migration_target', f'--target-url={self.target_url}',
+            '--no-input', '--chunk-size=1', stdout=output
+        )
+
+        def target(model):
+            return model._base_manager.using('migration_target')
+
+        copied = target(Appointment).get()
+        self.assertEqual(copied.created_at, appointment.created_at)
+        self.assertEqual(copied.updated_at, appointment.updated_at)
+        self.assertEqual(target(Doctor).get().search_document, doctor.search_document)
+        self.assertEqual(target(Scan).count(), 1)
+        self.assertEqual(
+            target(type(patient)).order_by('pk').values_list('username', flat=True).first(), 'patient'
+        )
+        # Sequences continue after the copied rows
+        self.assertGreater(target(Scan).create(user_id=patient.pk, image='scans/new.jpg').pk, 1)
+
+
+class CheckQueryPlansTests(TestCase):
+    def setUp(self):
+        for role in ('patient', 'doctor', 'assistant'):
+            make_user(role, role=role)
+
+    def test_every_endpoint_query_uses_an_index(self):
+        output = StringIO()
+        call_command('check_query_plans', stdout=output)
+        self.assertNotIn('SKIP', output.getvalue())
+        self.assertIn('Every checked query uses an index', output.getvalue())
+
+    def test_fails_without_the_index_for_a_filter(self):
+        index = next(index for index in Appointment._meta.indexes if index.fields == ['status', 'date_time'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+        output = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('check_query_plans', stdout=output)
+        self.assertIn('FAIL  GET /api/appointments/taken-slots/', output.getvalue())
+
+
+class UnindexedReadsTests(SimpleTestCase):
+    def test_postgres_index_condition_passes(self):
+        plan = """Sort  (cost=8.17..8.18 rows=1 width=72)
+  Sort Key: date_time
+  ->  Index Scan using api_appoint_status_39ddf1_idx on api_appointment  (cost=0.14..8.16 rows=1 width=72)
+        Index Cond: (((status)::text = 'pending'::text) AND (date_time >= '2026-10-19'))"""
+        self.assertEqual(unindexed_reads(plan, 'postgresql', 'api_appointment'), [])
+
+    def test_postgres_bitmap_scan_passes(self):
+        plan = """Bitmap Heap Scan on api_xrayimage  (cost=8.30..12.31 rows=1 width=72)
+  Recheck Cond: ((patient_id = 1) OR (assistant_id = 1))
+  ->  BitmapOr  (cost=8.30..8.30 rows=1 width=0)
+        ->  Bitmap Index Scan on api_xrayima_patient_dd3e4a_idx  (cost=0.00..4.15 rows=1 width=0)
+              Index Cond: (patient_id = 1)"""
+        self.assertEqual(unindexed_reads(plan, 'postgresql', 'api_xrayimage'), [])
+
+    def test_postgres_full_index_walk_fails(self):
+        plan = """Index Scan using api_appointment_pkey on api_appointment  (cost=0.15..24.40 rows=1 width=72)
+  Filter: (((status)::text = 'pending'::text) AND (date_time >= '2026-10-19'))"""
+        self.assertEqual(unindexed_reads(plan, 'postgresql', 'api_appointment'), ['api_appointment'])
+
+    def test_postgres_seq_scan_of_a_joined_table_fails(self):
+        plan = """Nested Loop  (cost=0.29..16.34 rows=1 width=72)
+  ->  Index Scan using api_consultation_doctor_id on api_consultation  (cost=0.14..8.16 rows=1 width=72)
+        Index Cond: (doctor_id = 1)
+  ->  Seq Scan on api_user  (cost=0.00..8.17 rows=1 width=72)
+        Filter: (id = api_consultation.patient_id)"""
+        self.assertEqual(unindexed_reads(plan, 'postgresql', 'api_consultation'), ['api_user'])
+
+    def test_sqlite_scan_using_index_fails(self):
+        plan = '3 0 0 SCAN api_appointment USING INDEX api_appoint_user_id_74513f_idx'
+        self.assertEqual(unindexed_reads(plan, 'sqlite', 'api_appointment'), ['api_appointment'])
+        plan = '3 0 0 SEARCH api_appointment USING INDEX api_appoint_status_39ddf1_idx (status=? AND date_time>?)'
+        self.assertEqual(unindexed_reads(plan, 'sqlite', 'api_appointment'), [])
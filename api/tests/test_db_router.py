@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import SimpleTestCase, override_settings
+from django.test.client import RequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import db_router
+from api.middleware import ReplicaPinningMiddleware
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], DATABASE_REPLICA_PIN_SECONDS=15)
+class ReplicaPinningMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.pinned = []
+        self.status = 200
+        self.user = SimpleNamespace(pk=7, id=7, is_active=True, is_authenticated=True)
+        self.middleware = ReplicaPinningMiddleware(self.view)
+
+    def view(self, request):
+        self.pinned.append(db_router._pinned.get())
+        if request.META.get('HTTP_AUTHORIZATION', '').startswith('Bearer ey'):
+            # As DRF does once it has authenticated the bearer token
+            request.user = self.user
+        return HttpResponse(status=self.status)
+
+    def request(self, method, user=None, **extra):
+        if user is not None:
+            extra['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(user)}'
+        request = getattr(self.factory, method)('/api/appointments/', **extra)
+        request.user = AnonymousUser()
+        return self.middleware(request)
+
+    def test_reads_use_replicas(self):
+        self.request('get', self.user)
+        self.assertEqual(self.pinned, [False])
+        # Outside a request everything is back on the primary
+        self.assertTrue(db_router._pinned.get())
+
+    def test_write_pins_the_users_following_reads(self):
+        response = self.request('post', self.user)
+        self.assertEqual(response.cookies, {})
+        # A cross-origin follow-up carries only the Authorization header
+        self.request('get', self.user, HTTP_ORIGIN='https://app.example.com')
+        self.assertEqual(self.pinned, [True, True])
+
+    def test_other_users_are_not_pinned(self):
+        self.request('post', self.user)
+        self.request('get', SimpleNamespace(pk=8, id=8, is_active=True, is_authenticated=True))
+        self.request('get')
+        self.assertEqual(self.pinned, [True, False, False])
+
+    def test_failed_write_does_not_pin(self):
+        self.status = 400
+        self.request('post', self.user)
+        self.request('get', self.user)
+        self.assertEqual(self.pinned, [True, False])
+
+    def test_session_user_is_pinned(self):
+        request = self.factory.post('/api/appointments/')
+        request.user = self.user
+        self.middleware(request)
+        request = self.factory.get('/api/appointments/')
+        request.user = self.user
+        self.middleware(request)
+        self.assertEqual(self.pinned, [True, True])
+
+    def test_invalid_token_is_not_pinned(self):
+        self.request('post', self.user)
+        self.middleware(self.factory.get('/api/appointments/', HTTP_AUTHORIZATION='Bearer forged'))
+        self.assertEqual(self.pinned, [True, False])
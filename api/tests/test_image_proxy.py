@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api.image_proxy import ImageProxyCache
+
+
+class ImageProxyCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.cache = ImageProxyCache(self.directory, max_bytes=3000, max_entry_bytes=1000, evict_interval=300)
+
+    def store(self, url, size=300):
+        writer, temp_path = self.cache.reserve(url)
+        with writer:
+            writer.write(b'x' * size)
+        self.cache.commit(url, temp_path, {'url': url, 'size': size, 'content_type': 'image/png'})
+
+    def entries(self):
+        return sum(1 for _, _, files in os.walk(self.directory) for name in files if name.endswith('.img'))
+
+    def test_stays_under_its_cap(self):
+        for i in range(40):
+            self.store(f'https://example.com/{i}.png')
+        self.assertLessEqual(self.entries() * 300, 3000)
+        self.assertIsNotNone(self.cache.get('https://example.com/39.png'))
+        self.assertIsNone(self.cache.get('https://example.com/0.png'))
+
+    def test_only_scans_when_the_running_total_passes_the_cap(self):
+        with mock.patch.object(self.cache, 'evict', wraps=self.cache.evict) as evict:
+            for i in range(10):
+                self.store(f'https://example.com/{i}.png')
+        # The first write scans to learn the size; the next nine fit under the cap
+        self.assertEqual(evict.call_count, 1)
+
+    def test_replacing_an_entry_does_not_grow_the_total(self):
+        self.store('https://example.com/a.png')
+        self.store('https://example.com/a.png', size=500)
+        self.assertEqual(self.cache._total, 500)
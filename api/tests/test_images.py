@@ -0,0 +1,41 @@
+import io
+import struct
+
+from django.test import SimpleTestCase
+from PIL import Image
+
+from api.images import EXIF_ORIENTATION, strip_jpeg_metadata
+
+
+def jpeg_markers(data):
+    """The markers of a JPEG's header segments, up to the start of scan"""
+    markers = []
+    position = 2
+    while data[position + 1] != 0xDA:
+        length = struct.unpack('>H', data[position + 2:position + 4])[0]
+        markers.append((data[position + 1], data[position + 4:position + 8]))
+        position += 2 + length
+    return markers
+
+
+class StripJpegMetadataTests(SimpleTestCase):
+    def jpeg(self, orientation):
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = orientation
+        buffer = io.BytesIO()
+        Image.new('RGB', (16, 16), (200, 30, 30)).save(
+            buffer, format='JPEG', exif=exif.tobytes(), comment=b'taken at home'
+        )
+        return buffer.getvalue()
+
+    def test_keeps_orientation_after_the_jfif_header(self):
+        stripped = strip_jpeg_metadata(self.jpeg(orientation=6))
+        markers = jpeg_markers(stripped)
+        self.assertEqual(markers[:2], [(0xE0, b'JFIF'), (0xE1, b'Exif')])
+        self.assertNotIn(0xFE, [marker for marker, _ in markers])
+        self.assertEqual(Image.open(io.BytesIO(stripped)).getexif()[EXIF_ORIENTATION], 6)
+
+    def test_drops_upright_exif(self):
+        stripped = strip_jpeg_metadata(self.jpeg(orientation=1))
+        self.assertEqual([marker for marker, _ in jpeg_markers(stripped)][:1], [0xE0])
+        self.assertNotIn(0xE1, [marker for marker, _ in jpeg_markers(stripped)])
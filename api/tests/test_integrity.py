@@ -0,0 +1,108 @@
+import io
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import QuerySet
+from django.test import TestCase
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian
+from rest_framework.test import APIClient
+
+from api.models import Consultation, DicomInstance, Doctor, DoctorReview, MediaBlob
+from api.tests.utils import TemporaryMediaMixin, make_user
+
+
+class ReviewRaceTests(TestCase):
+    def setUp(self):
+        self.patient = make_user('patient')
+        self.doctor_user = make_user('house', role='doctor')
+        self.doctor = Doctor.objects.create(user=self.doctor_user, license_number='LIC-1')
+        self.consultation = Consultation.objects.create(
+            patient=self.patient, doctor=self.doctor_user, status='completed'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def review(self):
+        return self.client.post(
+            f'/api/consultations/{self.consultation.pk}/review/', {'rating': 4, 'comment': 'Thorough'}, format='json'
+        )
+
+    def test_second_review_is_refused(self):
+        self.assertEqual(self.review().status_code, 201)
+        self.assertEqual(self.review().status_code, 400)
+
+    def test_review_racing_past_the_check_is_refused(self):
+        DoctorReview.objects.create(
+            consultation=self.consultation, patient=self.patient, doctor=self.doctor_user, rating=5
+        )
+        # As if the other request committed between the check and the insert
+        with mock.patch.object(QuerySet, 'exists', return_value=False):
+            response = self.review()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(DoctorReview.objects.count(), 1)
+        self.doctor.refresh_from_db()
+        self.assertEqual(self.doctor.review_count, 0)
+
+
+def dicom_bytes(sop_instance_uid='1.2.826.0.1.3680043.8.498.1'):
+    dataset = Dataset()
+    dataset.SOPClassUID = '1.2.840.10008.5.1.4.1.1.1.1'
+    dataset.SOPInstanceUID = sop_instance_uid
+    dataset.StudyInstanceUID = '1.2.826.0.1.3680043.8.498.2'
+    dataset.SeriesInstanceUID = '1.2.826.0.1.3680043.8.498.3'
+    dataset.Modality = 'DX'
+    dataset.PatientID = 'P-1'
+    dataset.file_meta = FileMetaDataset()
+    dataset.file_meta.MediaStorageSOPClassUID = dataset.SOPClassUID
+    dataset.file_meta.MediaStorageSOPInstanceUID = sop_instance_uid
+    dataset.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    buffer = io.BytesIO()
+    dataset.save_as(buffer, write_like_original=False)
+    return buffer.getvalue()
+
+
+class DicomRaceTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('assistant', role='assistant')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self):
+        return self.client.post(
+            '/api/dicom/', {'file': SimpleUploadedFile('image.dcm', dicom_bytes())}, format='multipart'
+        )
+
+    def test_duplicate_is_a_conflict(self):
+        first = self.upload()
+        self.assertEqual(first.status_code, 201)
+        second = self.upload()
+        self.assertEqual(second.status_code, 409)
+        self.assertEqual(second.data['id'], first.data['id'])
+
+    def test_duplicate_racing_past_the_check_is_a_conflict(self):
+        first = self.upload()
+        with mock.patch.object(QuerySet, 'first', return_value=None):
+            response = self.upload()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['id'], first.data['id'])
+        self.assertEqual(DicomInstance.objects.count(), 1)
+        # The losing upload's file reference was rolled back
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+
+    def test_study_date_filters(self):
+        self.upload()
+        DicomInstance.objects.update(study_date='2026-03-01')
+        response = self.client.get('/api/dicom/', {'study_date_after': '2026-02-01', 'study_date_before': '2026-03-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        response = self.client.get('/api/dicom/', {'study_date_after': '2026-03-02'})
+        self.assertEqual(len(response.data), 0)
+
+    def test_malformed_study_date_is_a_bad_request(self):
+        for value in ('garbage', '2024-13-40'):
+            for param in ('study_date_after', 'study_date_before'):
+                with self.subTest(param=param, value=value):
+                    response = self.client.get('/api/dicom/', {param: value})
+                    self.assertEqual(response.status_code, 400)
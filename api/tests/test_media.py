@@ -0,0 +1,122 @@
+import os
+import time
+from urllib.parse import urlencode
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.media import media_signature, signed_media_url
+from api.models import Appointment, Consultation, Scan, XRayImage
+from api.tests.utils import TemporaryMediaMixin, image_bytes, make_user
+
+
+class MediaAccessTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.patient = make_user('patient')
+        self.other = make_user('other')
+        self.doctor = make_user('doctor', role='doctor')
+        self.assistant = make_user('assistant', role='assistant')
+        self.content = image_bytes()
+        self.scan_name = self.store('scans/scan.jpg')
+        self.xray_name = self.store('xray_images/xray.jpg')
+        Scan.objects.create(user=self.patient, image=self.scan_name)
+        appointment = Appointment.objects.create(user=self.patient, date_time='2026-01-05T10:00:00Z')
+        self.xray = XRayImage.objects.create(
+            appointment=appointment, image=self.xray_name, patient=self.patient, assistant=self.assistant
+        )
+        self.client = APIClient()
+
+    def store(self, name):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(self.content)
+        return name
+
+    def get(self, name, user=None, **extra):
+        self.client.force_authenticate(user)
+        return self.client.get(f'/api/media/{name}', **extra)
+
+    def test_media_url_is_not_served_without_authorization(self):
+        response = self.client.get(f'/media/{self.scan_name}')
+        self.assertEqual(response.status_code, 404)
+
+    def test_anonymous_request_is_rejected(self):
+        self.assertEqual(self.get(self.scan_name).status_code, 401)
+
+    def test_owner_can_read_scan(self):
+        response = self.get(self.scan_name, self.patient)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_other_patient_gets_not_found(self):
+        self.assertEqual(self.get(self.scan_name, self.other).status_code, 404)
+
+    def test_consulting_doctor_can_read_patient_xray(self):
+        self.assertEqual(self.get(self.xray_name, self.doctor).status_code, 404)
+        Consultation.objects.create(patient=self.patient, doctor=self.doctor)
+        self.assertEqual(self.get(self.xray_name, self.doctor).status_code, 200)
+
+    def test_consulting_doctor_can_list_patient_xrays(self):
+        Consultation.objects.create(patient=self.patient, doctor=self.doctor)
+        self.client.force_authenticate(self.doctor)
+        response = self.client.get('/api/xrayimage/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data], [self.xray.pk])
+
+    def test_unrelated_doctor_does_not_list_patient_xrays(self):
+        stranger = make_user('stranger', role='doctor')
+        Consultation.objects.create(patient=self.other, doctor=stranger)
+        self.client.force_authenticate(stranger)
+        response = self.client.get('/api/xrayimage/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+    def test_range_request_returns_partial_content(self):
+        response = self.get(self.scan_name, self.patient, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 0-9/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[:10])
+
+    def test_signed_url_needs_no_authorization(self):
+        scan = Scan.objects.get(image=self.scan_name)
+        response = self.client.get(signed_media_url(scan.image))
+        self.assertEqual(response.status_code, 200)
+
+    def test_tampered_or_expired_signature_is_rejected(self):
+        expires = int(time.time()) + 600
+        tampered = urlencode({'exp': expires, 'sig': media_signature(self.xray_name, expires)})
+        self.assertEqual(self.client.get(f'/api/media/{self.scan_name}?{tampered}').status_code, 401)
+        expired = int(time.time()) - 1
+        query = urlencode({'exp': expired, 'sig': media_signature(self.scan_name, expired)})
+        self.assertEqual(self.client.get(f'/api/media/{self.scan_name}?{query}').status_code, 401)
+
+
+class SignedUrlOutputTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.patient = make_user('patient')
+        path = os.path.join(self.media_root, 'scans', 'scan.jpg')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(image_bytes())
+        self.scan = Scan.objects.create(user=self.patient, image='scans/scan.jpg')
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def test_scan_output_has_only_the_signed_url(self):
+        response = self.client.get(f'/api/scans/{self.scan.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('image', response.data)
+        self.assertIn('sig=', response.data['image_url'])
+        anonymous = APIClient().get(response.data['image_url'])
+        self.assertEqual(anonymous.status_code, 200)
+
+    def test_derivative_urls_are_signed(self):
+        from api.images import derivative_urls
+        urls = derivative_urls(self.scan.image)
+        for formats in urls.values():
+            for url in formats.values():
+                self.assertIn('/api/media/scans/scan.jpg?', url)
+                self.assertIn('sig=', url)
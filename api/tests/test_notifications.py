@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import Notification, NotificationArchive
+from api.tests.utils import make_user
+
+
+class NotificationArchiveTests(TestCase):
+    def setUp(self):
+        self.user = make_user('patient')
+        self.other = make_user('other')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def notify(self, user, created_at, is_read=True, title='Reminder'):
+        notification = Notification.objects.create(
+            user=user, title=title, message='Your appointment is tomorrow', is_read=is_read
+        )
+        Notification.objects.filter(pk=notification.pk).update(created_at=created_at)
+        return notification
+
+    def test_archives_old_read_notifications(self):
+        old = datetime(2026, 1, 10, tzinfo=dt_timezone.utc)
+        for day in range(3):
+            self.notify(self.user, old + timedelta(days=day))
+        self.notify(self.user, old, is_read=False)
+        recent = self.notify(self.user, timezone.now())
+
+        archived = NotificationArchive.archive_read_notifications(timezone.now() - timedelta(days=30), batch_size=2)
+
+        self.assertEqual(archived, 3)
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 2)
+        self.assertTrue(Notification.objects.filter(pk=recent.pk).exists())
+        self.assertEqual(
+            sum(NotificationArchive.objects.values_list('notification_count', flat=True)), 3
+        )
+
+    def test_archived_endpoint_is_paginated_newest_first(self):
+        january = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        february = datetime(2026, 2, 1, tzinfo=dt_timezone.utc)
+        for day in range(4):
+            self.notify(self.user, january + timedelta(days=day), title=f'jan-{day}')
+            self.notify(self.user, february + timedelta(days=day), title=f'feb-{day}')
+        self.notify(self.other, january, title='someone else')
+        NotificationArchive.archive_read_notifications(timezone.now(), batch_size=3)
+
+        titles = []
+        page = 1
+        while page:
+            response = self.client.get('/api/notifications/archived/', {'page': page, 'page_size': 3})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], 8)
+            self.assertLessEqual(len(response.data['results']), 3)
+            titles.extend(notification['title'] for notification in response.data['results'])
+            page = page + 1 if response.data['links']['next'] else None
+
+        self.assertEqual(titles, [f'feb-{day}' for day in range(3, -1, -1)] + [f'jan-{day}' for day in range(3, -1, -1)])
+
+    def test_archived_endpoint_filters_by_period(self):
+        self.notify(self.user, datetime(2026, 1, 5, tzinfo=dt_timezone.utc), title='jan')
+        self.notify(self.user, datetime(2026, 2, 5, tzinfo=dt_timezone.utc), title='feb')
+        NotificationArchive.archive_read_notifications(timezone.now())
+
+        response = self.client.get('/api/notifications/archived/', {'period': '2026-01'})
+        self.assertEqual([n['title'] for n in response.data['results']], ['jan'])
+        response = self.client.get('/api/notifications/archived/', {'period': 'January'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkMarkReadTests(TestCase):
+    def setUp(self):
+        self.user = make_user('patient')
+        self.other = make_user('other')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.scan = self.notify('scan', datetime(2026, 3, 1, tzinfo=dt_timezone.utc))
+        self.payment = self.notify('payment', datetime(2026, 3, 10, tzinfo=dt_timezone.utc))
+        self.system = self.notify('system', datetime(2026, 3, 20, tzinfo=dt_timezone.utc))
+        self.others = Notification.objects.create(user=self.other, title='Other', message='Not yours')
+
+    def notify(self, notification_type, created_at):
+        notification = Notification.objects.create(
+            user=self.user, title=notification_type, message='Update', notification_type=notification_type
+        )
+        Notification.objects.filter(pk=notification.pk).update(created_at=created_at)
+        return notification
+
+    def bulk_read(self, data):
+        return self.client.post('/api/notifications/bulk-read/', data, format='json')
+
+    def unread(self):
+        return set(Notification.objects.filter(is_read=False).values_list('pk', flat=True))
+
+    def test_marks_ids(self):
+        response = self.bulk_read({'ids': [self.scan.pk, self.payment.pk, self.others.pk]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(response.data['unread_count'], 1)
+        # Another user's notification is left alone
+        self.assertEqual(self.unread(), {self.system.pk, self.others.pk})
+
+    def test_marks_by_type_and_date(self):
+        response = self.bulk_read({'notification_type': 'payment'})
+        self.assertEqual(response.data['updated'], 1)
+        response = self.bulk_read({'before': '2026-03-15', 'after': '2026-03-01T00:00:00Z'})
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(self.unread(), {self.system.pk, self.others.pk})
+
+    def test_rejects_invalid_filters(self):
+        for data in ({}, {'ids': 'all'}, {'ids': ['x']}, {'notification_type': 'spam'}, {'before': 'yesterday'}):
+            with self.subTest(data=data):
+                self.assertEqual(self.bulk_read(data).status_code, 400)
+        self.assertEqual(len(self.unread()), 4)
@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import Doctor
+from api.search import DoctorSearchIndex
+from api.tests.utils import make_user
+
+
+class DoctorSearchIndexTests(TestCase):
+    """Changes made by another process reach the index through the database"""
+
+    def setUp(self):
+        self.house = self.make_doctor('house', 'Gregory', 'House', 'neurology')
+        self.grey = self.make_doctor('grey', 'Meredith', 'Grey', 'cardiology')
+        self.index = DoctorSearchIndex()
+
+    def make_doctor(self, username, first_name, last_name, specialty):
+        user = make_user(username, role='doctor', first_name=first_name, last_name=last_name)
+        return Doctor.objects.create(user=user, specialty=specialty, license_number=f'LIC-{username}')
+
+    def test_finds_doctors(self):
+        self.assertEqual(self.index.search('neuro'), [self.house.pk])
+        self.assertEqual(self.index.search('meredth'), [self.grey.pk])
+
+    def test_sees_doctors_saved_elsewhere(self):
+        self.index.search('house')
+        # A queryset update stands in for a save in another process, which
+        # this index gets no signal for
+        Doctor.objects.filter(pk=self.grey.pk).update(
+            search_document='meredith grey dermatology',
+            updated_at=timezone.now() + timedelta(seconds=1),
+        )
+        self.assertEqual(self.index.search('dermatology'), [self.grey.pk])
+        self.assertEqual(self.index.search('cardiology'), [])
+
+    def test_sees_doctors_added_elsewhere(self):
+        self.index.search('house')
+        wilson = self.make_doctor('wilson', 'James', 'Wilson', 'general')
+        self.assertEqual(self.index.search('wilson'), [wilson.pk])
+
+    def test_sees_doctors_deleted_elsewhere(self):
+        self.index.search('house')
+        Doctor.objects.filter(pk=self.house.pk).delete()
+        self.assertEqual(self.index.search('house'), [])
+
+    def test_partial_save_bumps_updated_at(self):
+        before = self.house.updated_at
+        self.house.bio = 'Diagnostician'
+        self.house.save(update_fields=['bio'])
+        self.house.refresh_from_db()
+        self.assertGreater(self.house.updated_at, before)
+        self.assertIn('diagnostician', self.house.search_document)
+
+
+class DoctorLanguageFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.house = self.make_doctor('house', 'English, French')
+        self.grey = self.make_doctor('grey', 'english; ARABIC')
+        self.wilson = self.make_doctor('wilson', 'French')
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('patient'))
+
+    def make_doctor(self, username, languages):
+        user = make_user(username, role='doctor')
+        return Doctor.objects.create(
+            user=user, specialty='general', license_number=f'LIC-{username}', languages=languages
+        )
+
+    def available(self, query):
+        response = self.client.get(f'/api/doctors/available/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [doctor['id'] for doctor in response.data]
+
+    def test_matches_any_language_without_duplicates(self):
+        ids = self.available('language=english,french')
+        self.assertEqual(sorted(ids), sorted([self.house.pk, self.grey.pk, self.wilson.pk]))
+
+    def test_matches_all_languages(self):
+        self.assertEqual(self.available('language=english,french&language_match=all'), [self.house.pk])
+
+    def test_repeated_parameters_combine(self):
+        ids = self.available('language=arabic&language=french')
+        self.assertEqual(sorted(ids), sorted([self.grey.pk, self.house.pk, self.wilson.pk]))
+        ids = self.available('language=english&language=arabic&language_match=all')
+        self.assertEqual(ids, [self.grey.pk])
+
+    def test_normalizes_names(self):
+        self.assertEqual(sorted(self.available('language=%20ENGLISH%20;')), sorted([self.house.pk, self.grey.pk]))
+        # A name repeated with different spelling is only required once
+        ids = self.available('language=French,french&language_match=all')
+        self.assertEqual(sorted(ids), sorted([self.house.pk, self.wilson.pk]))
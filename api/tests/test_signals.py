@@ -0,0 +1,103 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.cache import get_directory_version
+from api.models import Consultation, Doctor
+from api.tasks import reconcile_doctor_stats
+from api.tests.utils import make_user
+
+
+class DirectoryInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('house', role='doctor', first_name='Gregory', last_name='House')
+        self.doctor = Doctor.objects.create(user=self.user, specialty='neurology', license_number='LIC-1')
+        self.patient = make_user('patient')
+
+    def assertInvalidates(self, change, expected=True):
+        version = get_directory_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertEqual(get_directory_version() != version, expected)
+
+    def test_login_does_not_invalidate(self):
+        self.user.last_login = timezone.now()
+        self.assertInvalidates(lambda: self.user.save(update_fields=['last_login']), expected=False)
+        self.assertInvalidates(self.user.save, expected=False)
+
+    def test_serialized_user_field_invalidates(self):
+        self.user.email = 'house@example.org'
+        self.assertInvalidates(self.user.save)
+
+    def test_name_change_rebuilds_search_document(self):
+        self.user.last_name = 'Wilson'
+        self.assertInvalidates(self.user.save)
+        self.doctor.refresh_from_db()
+        self.assertIn('wilson', self.doctor.search_document)
+
+    def test_phone_number_invalidates(self):
+        profile = self.user.profile
+        profile.phone_number = '555-0100'
+        self.assertInvalidates(profile.save)
+
+    def test_other_profile_fields_do_not_invalidate(self):
+        profile = self.user.profile
+        profile.address = '221B Baker Street'
+        self.assertInvalidates(profile.save, expected=False)
+
+    def test_patient_changes_do_not_invalidate(self):
+        self.patient.first_name = 'Pat'
+        self.assertInvalidates(self.patient.save, expected=False)
+        profile = self.patient.profile
+        profile.phone_number = '555-0101'
+        self.assertInvalidates(profile.save, expected=False)
+
+
+class ConsultationStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = make_user('patient')
+        self.doctor_user = make_user('house', role='doctor')
+        self.doctor = Doctor.objects.create(user=self.doctor_user, license_number='LIC-1')
+        self.consultation = Consultation.objects.create(patient=self.patient, doctor=self.doctor_user)
+
+    def assertStats(self, total, completed, reviews):
+        for _ in range(2):
+            self.doctor.refresh_from_db()
+            self.assertEqual(
+                (self.doctor.total_consultations, self.doctor.completed_consultations, self.doctor.review_count),
+                (total, completed, reviews)
+            )
+            # The incremental counts agree with a rebuild from the rows
+            reconcile_doctor_stats()
+
+    def test_save_without_completing_adds_no_query(self):
+        consultation = Consultation.objects.get(pk=self.consultation.pk)
+        consultation.notes = 'Follow up in a week'
+        with self.assertNumQueries(1):
+            consultation.save()
+
+    def test_concurrent_completions_count_once(self):
+        first = Consultation.objects.get(pk=self.consultation.pk)
+        second = Consultation.objects.get(pk=self.consultation.pk)
+        for consultation in (first, second):
+            consultation.status = 'completed'
+            consultation.save()
+        first.save()
+        self.assertStats(total=1, completed=1, reviews=0)
+
+    def test_counts_through_the_api(self):
+        Consultation.objects.create(patient=self.patient, doctor=self.doctor_user, status='completed')
+        doctor_client = APIClient()
+        doctor_client.force_authenticate(self.doctor_user)
+        response = doctor_client.post(f'/api/consultations/{self.consultation.pk}/complete/')
+        self.assertEqual(response.status_code, 200)
+        patient_client = APIClient()
+        patient_client.force_authenticate(self.patient)
+        response = patient_client.post(
+            f'/api/consultations/{self.consultation.pk}/review/', {'rating': 5}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertStats(total=2, completed=2, reviews=1)
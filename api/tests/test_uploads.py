@@ -0,0 +1,181 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from PIL import Image
+
+from api.models import Appointment, Scan, UploadSession, XRayImage
+from api.tests.utils import TemporaryMediaMixin, image_bytes, make_user
+
+
+class UploadValidationTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('patient')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload_scan(self, content, name='scan.jpg'):
+        return self.client.post(
+            '/api/scans/', {'image': SimpleUploadedFile(name, content)}, format='multipart'
+        )
+
+    def test_accepts_image(self):
+        response = self.upload_scan(image_bytes())
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('image', response.data)
+        self.assertTrue(response.data['image_url'])
+
+    def test_rejects_wrong_type(self):
+        response = self.upload_scan(b'%PDF-1.4 not an image' * 10, name='scan.pdf')
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(Scan.objects.exists())
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=1024)
+    def test_rejects_oversized_file(self):
+        response = self.upload_scan(noisy_png(), name='scan.png')
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Scan.objects.exists())
+
+    def test_rejects_truncated_image(self):
+        response = self.upload_scan(image_bytes(format='PNG')[:16], name='scan.png')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Scan.objects.exists())
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=100)
+    def test_rejects_too_many_pixels(self):
+        response = self.upload_scan(image_bytes(size=(20, 20)))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Scan.objects.exists())
+
+    def admin_add_scan(self, upload):
+        admin = make_user('admin', role='admin', is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        return self.client.post('/admin/api/scan/add/', {
+            'user': self.user.pk,
+            'image': upload,
+            'status': 'pending',
+            'result_status': 'inconclusive',
+        })
+
+    def test_admin_uploads_are_not_checked_by_the_handler(self):
+        response = self.admin_add_scan(SimpleUploadedFile('scan.jpg', image_bytes()))
+        self.assertRedirects(response, '/admin/api/scan/', fetch_redirect_response=False)
+        self.assertEqual(Scan.objects.get().user, self.user)
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=16)
+    def test_admin_form_reports_its_own_validation_error(self):
+        response = self.admin_add_scan(SimpleUploadedFile('notes.txt', b'plain text'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['adminform'].form.errors['image'])
+        self.assertFalse(Scan.objects.exists())
+
+def noisy_png(size=(64, 64)):
+    """A PNG that doesn't compress, so it spans several parts"""
+    buffer = io.BytesIO()
+    Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class ChunkedUploadTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.session_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.session_dir, ignore_errors=True)
+        session_settings = override_settings(UPLOAD_SESSION_DIR=self.session_dir, UPLOAD_CHUNK_SIZE=256)
+        session_settings.enable()
+        self.addCleanup(session_settings.disable)
+        self.user = make_user('patient')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def start(self, content, **data):
+        response = self.client.post('/api/uploads/', {
+            'purpose': 'scan',
+            'filename': 'scan.png',
+            'total_size': len(content),
+            'sha256': hashlib.sha256(content).hexdigest(),
+            **data,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def put_part(self, session_id, number, content):
+        return self.client.put(
+            f'/api/uploads/{session_id}/parts/{number}/', content, content_type='application/octet-stream'
+        )
+
+    def put_all(self, session_id, content):
+        for number, start in enumerate(range(0, len(content), 256), start=1):
+            self.put_part(session_id, number, content[start:start + 256])
+
+    def test_parts_are_assembled_into_a_scan(self):
+        content = noisy_png()
+        session = self.start(content)
+        parts = [content[i:i + 256] for i in range(0, len(content), 256)]
+        self.assertEqual(session['total_parts'], len(parts))
+        self.assertGreater(len(parts), 1)
+
+        # Parts may arrive in any order
+        for number, part in reversed(list(enumerate(parts, start=1))):
+            self.assertEqual(self.put_part(session['id'], number, part).status_code, 200)
+
+        response = self.client.post(f"/api/uploads/{session['id']}/complete/")
+        self.assertEqual(response.status_code, 201)
+        scan = Scan.objects.get(pk=response.data['id'])
+        with scan.image.open('rb') as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(UploadSession.objects.get(pk=session['id']).status, 'complete')
+
+    def test_incomplete_upload_lists_missing_parts(self):
+        content = noisy_png()
+        session = self.start(content)
+        self.put_part(session['id'], 1, content[:256])
+        response = self.client.post(f"/api/uploads/{session['id']}/complete/")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['missing_parts'], list(range(2, session['total_parts'] + 1)))
+
+    def test_checksum_mismatch_fails_the_session(self):
+        content = image_bytes(size=(16, 16), format='PNG')
+        session = self.start(content, sha256='0' * 64)
+        self.put_all(session['id'], content)
+        response = self.client.post(f"/api/uploads/{session['id']}/complete/")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get(pk=session['id']).status, 'failed')
+        self.assertFalse(Scan.objects.exists())
+
+    def test_first_part_of_the_wrong_type_is_refused(self):
+        content = b'%PDF-1.4' + b'\0' * 500
+        session = self.start(content)
+        response = self.put_part(session['id'], 1, content[:256])
+        self.assertEqual(response.status_code, 415)
+
+    def test_xray_for_a_deleted_appointment_fails_cleanly(self):
+        assistant = make_user('assistant', role='assistant')
+        appointment = Appointment.objects.create(user=self.user, date_time='2026-01-05T10:00:00Z')
+        content = noisy_png(size=(8, 8))
+        session = self.start(content, purpose='xray', metadata={
+            'appointment': appointment.pk, 'patient': self.user.pk, 'assistant': assistant.pk
+        })
+        self.put_all(session['id'], content)
+        appointment.delete()
+
+        response = self.client.post(f"/api/uploads/{session['id']}/complete/")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(XRayImage.objects.exists())
+        self.assertEqual(UploadSession.objects.get(pk=session['id']).status, 'failed')
+
+    def test_completing_twice_is_a_conflict(self):
+        content = noisy_png(size=(8, 8))
+        session = self.start(content)
+        self.put_all(session['id'], content)
+        self.assertEqual(self.client.post(f"/api/uploads/{session['id']}/complete/").status_code, 201)
+        response = self.client.post(f"/api/uploads/{session['id']}/complete/")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Scan.objects.count(), 1)
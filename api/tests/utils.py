@@ -0,0 +1,33 @@
+import io
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from PIL import Image
+
+User = get_user_model()
+
+
+def make_user(username, role='patient', **kwargs):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com', password='pass12345', role=role, **kwargs
+    )
+
+
+def image_bytes(format='JPEG', size=(16, 16), color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format=format)
+    return buffer.getvalue()
+
+
+class TemporaryMediaMixin:
+    """Point MEDIA_ROOT at a fresh directory for each test"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
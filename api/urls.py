@@ -5,8 +5,10 @@ from .views import (
     UserViewSet, UserProfileViewSet, ScanViewSet, AppointmentViewSet,
     PaymentViewSet, NotificationViewSet, ConsultationViewSet,
     DoctorViewSet, AssistantViewSet, predict_scan, XRayImageViewSet,
-    CreatorViewSet, predict_view, proxy_image, upgrade_subscription
+    CreatorViewSet, UploadSessionViewSet, DicomInstanceViewSet, predict_view, proxy_image, upgrade_subscription,
+    database_pool_stats
 )
+from .media import MediaView
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
@@ -20,6 +22,8 @@ router.register(r'doctors', DoctorViewSet)
 router.register(r'assistants', AssistantViewSet, basename='assistant')
 router.register(r'xrayimage', XRayImageViewSet, basename='xrayimage')
 router.register(r'creators', CreatorViewSet, basename='creator')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
+router.register(r'dicom', DicomInstanceViewSet, basename='dicom')
 
 urlpatterns = [
     path('users/upgrade_subscription/', upgrade_subscription, name='upgrade-subscription'),
@@ -30,4 +34,6 @@ urlpatterns = [
     path('predict/', predict_view, name='predict'),
     path('xray-analyze/', predict_scan, name='xray-analyze'),  # Alternative endpoint for clarity
     path('proxy-image/', proxy_image, name='proxy-image'),  # New endpoint for proxying images
+    path('db-pool-stats/', database_pool_stats, name='db-pool-stats'),
+    path('media/<path:path>', MediaView.as_view(), name='media'),
 ] 
\ No newline at end of file
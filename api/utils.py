@@ -1,9 +1,9 @@
 import os
 import uuid
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 from django.conf import settings
+from django.core.files.storage import default_storage
 from rest_framework.exceptions import ValidationError
+from .validators import validate_upload, InvalidUpload, PROFILE_PICTURE_TYPES, PDF_TYPES
 
 def generate_unique_filename(original_filename):
     ext = original_filename.split('.')[-1]
@@ -15,14 +15,9 @@ def save_uploaded_file(file, subdirectory):
         # Generate unique filename
         filename = generate_unique_filename(file.name)
         
-        # Create the full path
-        file_path = os.path.join(settings.MEDIA_ROOT, subdirectory, filename)
-        
-        # Save the file
-        default_storage.save(file_path, ContentFile(file.read()))
-        
-        # Return the relative path
-        return os.path.join(subdirectory, filename)
+        # Save the file; the storage copies it chunk by chunk, so large
+        # uploads are never read into memory in one piece
+        return default_storage.save(os.path.join(subdirectory, filename), file)
     except Exception as e:
         raise ValidationError(f"Error saving file: {str(e)}")
 
@@ -34,22 +29,15 @@ def delete_file(file_path):
         raise ValidationError(f"Error deleting file: {str(e)}")
 
 def validate_image_file(file):
-    # Check file size (max 5MB)
-    max_size = 5 * 1024 * 1024
-    if file.size > max_size:
-        raise ValidationError("File size should not exceed 5MB")
-    
-    # Check file type
-    allowed_types = ['image/jpeg', 'image/png', 'image/gif']
-    if file.content_type not in allowed_types:
-        raise ValidationError("Only JPEG, PNG, and GIF images are allowed")
+    # Type and dimensions come from the file header, not the client's Content-Type
+    try:
+        validate_upload(file, PROFILE_PICTURE_TYPES, settings.PROFILE_PICTURE_MAX_SIZE)
+    except InvalidUpload as e:
+        raise ValidationError(str(e.detail))
 
 def validate_pdf_file(file):
-    # Check file size (max 10MB)
-    max_size = 10 * 1024 * 1024
-    if file.size > max_size:
-        raise ValidationError("File size should not exceed 10MB")
-    
-    # Check file type
-    if file.content_type != 'application/pdf':
-        raise ValidationError("Only PDF files are allowed") 
\ No newline at end of file
+    # Check file size (max 10MB) and the %PDF- signature
+    try:
+        validate_upload(file, PDF_TYPES, 10 * 1024 * 1024)
+    except InvalidUpload as e:
+        raise ValidationError(str(e.detail))
@@ -0,0 +1,253 @@
+from collections import namedtuple
+import os
+import struct
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+# Everything needed to recognise a file and read its dimensions, except JPEG
+# where the frame header is found by seeking from segment to segment
+SNIFF_BYTES = 2048
+
+# Segments skipped while looking for a JPEG frame header before giving up
+JPEG_MAX_SEGMENTS = 64
+
+PROFILE_PICTURE_TYPES = ('jpeg', 'png', 'gif')
+IMAGE_TYPES = ('jpeg', 'png', 'gif', 'webp')
+ML_IMAGE_TYPES = ('jpeg', 'png')
+DICOM_TYPES = ('dicom',)
+PDF_TYPES = ('pdf',)
+
+CONTENT_TYPES = {
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+    'pdf': 'application/pdf',
+    'dicom': 'application/dicom',
+}
+
+EXTENSIONS = {
+    'jpeg': '.jpg',
+    'png': '.png',
+    'gif': '.gif',
+    'webp': '.webp',
+    'pdf': '.pdf',
+    'dicom': '.dcm',
+}
+
+UploadInfo = namedtuple('UploadInfo', ['type', 'content_type', 'width', 'height'])
+
+
+class InvalidUpload(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Invalid file upload'
+    default_code = 'invalid_upload'
+
+
+class UploadTooLarge(InvalidUpload):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Uploaded file is too large'
+    default_code = 'upload_too_large'
+
+
+class UnsupportedUpload(InvalidUpload):
+    status_code = status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    default_detail = 'Unsupported file type'
+    default_code = 'unsupported_upload'
+
+
+def detect_type(head):
+    """Identify a file from its leading bytes, or None if unrecognised"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head.startswith(b'%PDF-'):
+        return 'pdf'
+    if head[128:132] == b'DICM':
+        return 'dicom'
+    return None
+
+
+def describe_types(types):
+    names = [name.upper() for name in types]
+    return names[0] if len(names) == 1 else f"{', '.join(names[:-1])} and {names[-1]}"
+
+
+def format_size(size):
+    return f"{size // (1024 * 1024)}MB" if size >= 1024 * 1024 else f"{size // 1024}KB"
+
+
+def _jpeg_dimensions(file):
+    """Walk the JPEG segments to the first SOF marker, seeking over the rest"""
+    file.seek(2)
+    for _ in range(JPEG_MAX_SEGMENTS):
+        marker = file.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF:
+            return None
+        code, length = marker[1], struct.unpack('>H', marker[2:])[0]
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            frame = file.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack('>HH', frame[1:])
+            return width, height
+        file.seek(length - 2, 1)
+    return None
+
+
+def _webp_dimensions(head):
+    chunk = head[12:16]
+    if chunk == b'VP8 ' and len(head) >= 30:
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(head) >= 25:
+        bits = int.from_bytes(head[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X' and len(head) >= 30:
+        return int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1
+    return None
+
+
+def image_dimensions(file_type, head, file):
+    """(width, height) from the image header, or None if it can't be read"""
+    if file_type == 'png' and len(head) >= 24 and head[12:16] == b'IHDR':
+        return struct.unpack('>II', head[16:24])
+    if file_type == 'gif' and len(head) >= 10:
+        return struct.unpack('<HH', head[6:10])
+    if file_type == 'webp':
+        return _webp_dimensions(head)
+    if file_type == 'jpeg':
+        return _jpeg_dimensions(file)
+    return None
+
+
+def inspect_upload(file):
+    """
+    Identify an uploaded file and read its image dimensions from the header,
+    touching only the first few KB. The file position is restored.
+    """
+    position = file.tell()
+    try:
+        file.seek(0)
+        head = file.read(SNIFF_BYTES)
+        file_type = detect_type(head)
+        dimensions = None
+        if file_type in IMAGE_TYPES:
+            dimensions = image_dimensions(file_type, head, file)
+    finally:
+        file.seek(position)
+    width, height = dimensions or (None, None)
+    return UploadInfo(file_type, CONTENT_TYPES.get(file_type), width, height)
+
+
+def validate_upload(file, types=IMAGE_TYPES, max_size=None):
+    """
+    Check an uploaded file's size, its real type (by magic bytes, not the
+    client's Content-Type) and, for images, that the header is readable and
+    the pixel count is sane. The file's content_type is corrected to the
+    detected type, as is the extension of its name (which decides the stored
+    name and the type it's served with). Returns the UploadInfo; raises
+    InvalidUpload.
+    """
+    max_size = max_size or settings.IMAGE_UPLOAD_MAX_SIZE
+    if file.size > max_size:
+        raise UploadTooLarge(f"File size should not exceed {format_size(max_size)}")
+
+    info = inspect_upload(file)
+    if info.type not in types:
+        raise UnsupportedUpload(f"Only {describe_types(types)} files are allowed")
+    if info.type in IMAGE_TYPES:
+        if not info.width or not info.height:
+            raise InvalidUpload("The image is corrupt or truncated")
+        if info.width * info.height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            raise InvalidUpload(f"Image dimensions {info.width}x{info.height} are too large")
+
+    if hasattr(file, 'content_type'):
+        file.content_type = info.content_type
+    root, extension = os.path.splitext(file.name or 'upload')
+    if extension.lower() not in (EXTENSIONS[info.type], '.jpeg'):
+        file.name = root + EXTENSIONS[info.type]
+    return info
+
+
+class ValidatingUploadHandler(FileUploadHandler):
+    """
+    Runs ahead of Django's memory/temporary file handlers. For views that set
+    limits with UploadLimitMixin, each file's type is checked from its first
+    chunk and the upload is aborted as soon as a file grows past the size
+    limit, so a rejected file is never buffered. The errors are DRF
+    exceptions, so every other request (the admin, plain Django views)
+    passes through untouched and is validated by its own form or view.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.limits = getattr(self.request, 'upload_limits', None)
+        if self.limits:
+            self.types, self.max_size = self.limits
+        self.head = b''
+        self.received = 0
+        self.checked = False
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.limits:
+            return raw_data
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            raise UploadTooLarge(f"File size should not exceed {format_size(self.max_size)}")
+        if not self.checked:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                self.check_type()
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.limits and not self.checked:
+            self.check_type()
+        return None
+
+    def check_type(self):
+        self.checked = True
+        if detect_type(self.head) not in self.types:
+            raise UnsupportedUpload(f"Only {describe_types(self.types)} files are allowed")
+
+
+class UploadLimitMixin:
+    """
+    Set the types and file size the upload handler accepts for a view.
+    The limit is looked up from settings on each request.
+    """
+    upload_types = IMAGE_TYPES
+    upload_max_size_setting = 'IMAGE_UPLOAD_MAX_SIZE'
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_limits = (self.upload_types, getattr(settings, self.upload_max_size_setting))
+        return super().initialize_request(request, *args, **kwargs)
+
+
+class UploadedFileField(serializers.FileField):
+    """
+    FileField validated from the file header by validate_upload, in place of
+    ImageField which decodes the whole image with Pillow.
+    """
+
+    def __init__(self, types=IMAGE_TYPES, max_size_setting='IMAGE_UPLOAD_MAX_SIZE', **kwargs):
+        self.types = types
+        self.max_size_setting = max_size_setting
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        file = super().to_internal_value(data)
+        try:
+            validate_upload(file, self.types, getattr(settings, self.max_size_setting))
+        except InvalidUpload as e:
+            raise serializers.ValidationError(str(e.detail))
+        return file
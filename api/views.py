@@ -6,12 +6,12 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from django.db import transaction
+from django.db import IntegrityError, transaction
 import logging
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.exceptions import PermissionDenied, APIException
 from django.contrib.auth.models import Group
-from django.db.models import Q
+from django.db.models import Q, Case, When, Value, IntegerField, Count
 from django.utils import timezone
 from rest_framework import filters
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -19,16 +19,24 @@ import os
 import requests
 from django.conf import settings
 from datetime import datetime, timedelta
+from io import BytesIO
+from django.core.files import File
 from .models import (
     UserProfile, 
     Scan, 
     Appointment, 
     Payment, 
     Notification, 
+    NotificationArchive,
+    ArchivedNotifications,
     Consultation,
     Doctor,
+    DoctorReview,
     XRayImage,
-    Creator
+    Creator,
+    UploadSession,
+    DicomInstance,
+    normalize_languages
 )
 from .serializers import (
     UserRegistrationSerializer,
@@ -39,21 +47,50 @@ from .serializers import (
     PaymentSerializer,
     ConsultationSerializer,
     DoctorSerializer,
+    DoctorReviewSerializer,
     NotificationSerializer,
     AdminPaymentSerializer,
     AdminConsultationSerializer,
     XRayImageSerializer,
-    CreatorSerializer
+    CreatorSerializer,
+    UploadSessionSerializer,
+    DicomInstanceSerializer
 )
-from .filters import ScanFilter, AppointmentFilter, PaymentFilter
+from .filters import ScanFilter, AppointmentFilter, PaymentFilter, DoctorSearchFilter
+from .db_pool import pool_stats
 import pytz
 import uuid
 import json
 from rest_framework.views import APIView
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.exceptions import NotFound
-from django.utils.dateparse import parse_datetime
+from .pagination import StandardResultsSetPagination
+from rest_framework.exceptions import NotFound, ParseError
+from django.utils.dateparse import parse_datetime, parse_date
 from .ml_service import ml_service
+from .cache import (
+    get_specialty_counts,
+    get_doctor_suggestions,
+    directory_cache_key,
+    get_cached_directory,
+    etag_matches,
+    invalidate_doctor_directory
+)
+from .images import derivative_urls, delete_derivatives
+from .media import signed_media_url
+from .image_proxy import proxy_image_response, UpstreamError
+from .dicom import ingest_dicom, InvalidDicomError, DuplicateDicomError
+from .validators import (
+    validate_upload,
+    detect_type,
+    describe_types,
+    UploadLimitMixin,
+    InvalidUpload,
+    IMAGE_TYPES,
+    PROFILE_PICTURE_TYPES,
+    ML_IMAGE_TYPES,
+    DICOM_TYPES,
+    SNIFF_BYTES
+)
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -63,12 +100,14 @@ class AppointmentConflictException(APIException):
     default_detail = 'Appointment time slot is already taken'
     default_code = 'appointment_conflict'
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(UploadLimitMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['role', 'subscription_type']
     search_fields = ['username', 'email', 'first_name', 'last_name']
+    upload_types = PROFILE_PICTURE_TYPES
+    upload_max_size_setting = 'PROFILE_PICTURE_MAX_SIZE'
     
     def get_permissions(self):
         if self.action in ['register', 'create']:
@@ -126,8 +165,9 @@ class UserViewSet(viewsets.ModelViewSet):
             # Add the full profile picture URL if it exists
             if profile.profile_picture:
                 request_host = request.get_host()
-                profile_picture_url = request.build_absolute_uri(profile.profile_picture.url)
+                profile_picture_url = signed_media_url(profile.profile_picture, request)
                 profile_data['profile_picture_url'] = profile_picture_url
+                profile_data['profile_picture_thumbnails'] = derivative_urls(profile.profile_picture, request)
             
             return Response({
                 'user': user_serializer.data,
@@ -138,24 +178,13 @@ class UserViewSet(viewsets.ModelViewSet):
             # Handle profile picture upload
             profile_picture = request.FILES.get('profile_picture')
             if profile_picture:
-                # Validate file size (max 5MB)
-                if profile_picture.size > 5 * 1024 * 1024:
-                    return Response(
-                        {'error': 'Profile picture must be less than 5MB'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                # Validate file type
-                allowed_types = ['image/jpeg', 'image/png', 'image/gif']
-                if profile_picture.content_type not in allowed_types:
-                    return Response(
-                        {'error': 'Invalid file type. Allowed types: JPEG, PNG, GIF'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
+                # Validate size, type and dimensions from the file header
+                validate_upload(profile_picture, PROFILE_PICTURE_TYPES, settings.PROFILE_PICTURE_MAX_SIZE)
 
                 # Delete old profile picture if it exists
                 if profile.profile_picture:
                     try:
+                        delete_derivatives(profile.profile_picture.name)
                         profile.profile_picture.delete()
                     except Exception as e:
                         print(f"Error deleting old profile picture: {e}")
@@ -188,8 +217,9 @@ class UserViewSet(viewsets.ModelViewSet):
             updated_profile = UserProfileSerializer(profile).data
             if profile.profile_picture:
                 request_host = request.get_host()
-                profile_picture_url = request.build_absolute_uri(profile.profile_picture.url)
+                profile_picture_url = signed_media_url(profile.profile_picture, request)
                 updated_profile['profile_picture_url'] = profile_picture_url
+                updated_profile['profile_picture_thumbnails'] = derivative_urls(profile.profile_picture, request)
             
             # Return updated data
             response = Response({
@@ -206,6 +236,8 @@ class UserViewSet(viewsets.ModelViewSet):
             
             return response
 
+        except InvalidUpload as e:
+            return Response({'error': str(e.detail)}, status=e.status_code)
         except Exception as e:
             return Response(
                 {'error': str(e)},
@@ -237,8 +269,9 @@ class UserViewSet(viewsets.ModelViewSet):
                 # Add the full profile picture URL if it exists
                 if profile.profile_picture:
                     request_host = request.get_host()
-                    profile_picture_url = request.build_absolute_uri(profile.profile_picture.url)
+                    profile_picture_url = signed_media_url(profile.profile_picture, request)
                     profile_data['profile_picture_url'] = profile_picture_url
+                    profile_data['profile_picture_thumbnails'] = derivative_urls(profile.profile_picture, request)
                 
                 return Response({
                     'user': user_serializer.data,
@@ -248,24 +281,13 @@ class UserViewSet(viewsets.ModelViewSet):
             # Handle profile picture upload
             profile_picture = request.FILES.get('profile_picture')
             if profile_picture:
-                # Validate file size (max 5MB)
-                if profile_picture.size > 5 * 1024 * 1024:
-                    return Response(
-                        {'error': 'Profile picture must be less than 5MB'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                # Validate file type
-                allowed_types = ['image/jpeg', 'image/png', 'image/gif']
-                if profile_picture.content_type not in allowed_types:
-                    return Response(
-                        {'error': 'Invalid file type. Allowed types: JPEG, PNG, GIF'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
+                # Validate size, type and dimensions from the file header
+                validate_upload(profile_picture, PROFILE_PICTURE_TYPES, settings.PROFILE_PICTURE_MAX_SIZE)
 
                 # Delete old profile picture if it exists
                 if profile.profile_picture:
                     try:
+                        delete_derivatives(profile.profile_picture.name)
                         profile.profile_picture.delete()
                     except Exception as e:
                         print(f"Error deleting old profile picture: {e}")
@@ -299,8 +321,9 @@ class UserViewSet(viewsets.ModelViewSet):
             updated_profile = UserProfileSerializer(profile).data
             if profile.profile_picture:
                 request_host = request.get_host()
-                profile_picture_url = request.build_absolute_uri(profile.profile_picture.url)
+                profile_picture_url = signed_media_url(profile.profile_picture, request)
                 updated_profile['profile_picture_url'] = profile_picture_url
+                updated_profile['profile_picture_thumbnails'] = derivative_urls(profile.profile_picture, request)
             
             # Return updated data
             response = Response({
@@ -317,6 +340,8 @@ class UserViewSet(viewsets.ModelViewSet):
             
             return response
 
+        except InvalidUpload as e:
+            return Response({'error': str(e.detail)}, status=e.status_code)
         except Exception as e:
             return Response(
                 {'error': str(e)},
@@ -353,10 +378,12 @@ class UserViewSet(viewsets.ModelViewSet):
         logger.warning(f"Registration failed: {serializer.errors}")
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class UserProfileViewSet(viewsets.ModelViewSet):
+class UserProfileViewSet(UploadLimitMixin, viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
     permission_classes = [IsAuthenticated]
+    upload_types = PROFILE_PICTURE_TYPES
+    upload_max_size_setting = 'PROFILE_PICTURE_MAX_SIZE'
 
     def get_queryset(self):
         # Admin and staff users can see all profiles
@@ -604,14 +631,58 @@ class ConsultationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=True, methods=['post'])
+    def review(self, request, pk=None):
+        """Rate the doctor after a completed consultation"""
+        consultation = self.get_object()
+        
+        if consultation.patient_id != request.user.id:
+            return Response(
+                {'error': 'Only the patient can review this consultation'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        if consultation.status != 'completed':
+            return Response(
+                {'error': 'Only completed consultations can be reviewed'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if DoctorReview.objects.filter(consultation=consultation).exists():
+            return Response(
+                {'error': 'This consultation has already been reviewed'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        serializer = DoctorReviewSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            with transaction.atomic():
+                review = serializer.save(
+                    consultation=consultation,
+                    patient=consultation.patient,
+                    doctor=consultation.doctor
+                )
+                Doctor.record_review(consultation.doctor_id, review.rating)
+                transaction.on_commit(invalidate_doctor_directory)
+        except IntegrityError:
+            # A concurrent request reviewed it after the check above
+            return Response(
+                {'error': 'This consultation has already been reviewed'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def upcoming_queryset(self):
+        """Pending consultations, oldest first (also checked by check_query_plans)"""
+        return self.get_queryset().filter(status='pending').order_by('created_at')
+
     @action(detail=False, methods=['get'])
     def upcoming(self, request):
         """Get upcoming consultations"""
         try:
-            now = timezone.now()
-            upcoming = self.get_queryset().filter(
-                status='pending'
-            ).order_by('created_at')
+            upcoming = self.upcoming_queryset()
             
             serializer = self.get_serializer(upcoming, many=True)
             return Response(serializer.data)
@@ -714,7 +785,7 @@ class ConsultationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class ScanViewSet(viewsets.ModelViewSet):
+class ScanViewSet(UploadLimitMixin, viewsets.ModelViewSet):
     queryset = Scan.objects.all()
     serializer_class = ScanSerializer
     permission_classes = [IsAuthenticated]
@@ -746,27 +817,17 @@ class ScanViewSet(viewsets.ModelViewSet):
                 'error': 'This scan does not require consultation'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get available doctors (users with doctor role)
-        available_doctors = User.objects.filter(role='doctor')
+        specialties = scan.get_relevant_specialties()
+        doctor_data = get_doctor_suggestions(
+            specialties,
+            settings.DOCTOR_SUGGESTION_LIMIT,
+            lambda: self.rank_doctors(specialties, settings.DOCTOR_SUGGESTION_LIMIT)
+        )
         
         # Get the next 7 days of possible appointments
         today = timezone.now().date()
         available_dates = [(today + timedelta(days=i)).isoformat() for i in range(1, 8)]
         
-        # Format doctor data with more details
-        doctor_data = []
-        for doctor in available_doctors:
-            # Get total consultations count for each doctor
-            consultation_count = Consultation.objects.filter(doctor=doctor).count()
-            
-            doctor_data.append({
-                'id': doctor.id,
-                'name': f"Dr. {doctor.get_full_name()}",
-                'specialization': getattr(doctor, 'specialization', 'General'),
-                'experience': consultation_count,  # Use consultation count as a measure of experience
-                'profile_picture': doctor.profile.profile_picture.url if doctor.profile.profile_picture else None,
-            })
-        
         return Response({
             'scan_id': scan.id,
             'doctors': doctor_data,
@@ -774,6 +835,45 @@ class ScanViewSet(viewsets.ModelViewSet):
             'message': 'Please select a doctor and preferred date for your consultation'
         })
 
+    def rank_doctors(self, specialties, limit):
+        """
+        Rank active doctors in a single query: those accepting new patients
+        first, then relevant specialty, lightest open consultation load,
+        rating and experience.
+        """
+        doctors = Doctor.objects.filter(user__is_active=True).select_related('user').annotate(
+            specialty_match=Case(
+                When(specialty__in=specialties, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField()
+            ),
+            active_consultations=Count(
+                'user__doctor_consultations',
+                filter=Q(user__doctor_consultations__status__in=['pending', 'accepted'])
+            )
+        ).order_by(
+            '-is_accepting_new_patients', '-specialty_match', 'active_consultations',
+            '-rating', '-years_of_experience', 'id'
+        )[:limit]
+        
+        return [
+            {
+                # create-consultation expects the doctor's user ID
+                'id': doctor.user_id,
+                'doctor_id': doctor.id,
+                'name': f"Dr. {doctor.user.get_full_name()}",
+                'specialty': doctor.specialty,
+                'specialization': doctor.get_specialty_display(),
+                'relevant_specialty': bool(doctor.specialty_match),
+                'experience': doctor.years_of_experience,
+                'rating': float(doctor.rating),
+                'active_consultations': doctor.active_consultations,
+                'is_accepting_new_patients': doctor.is_accepting_new_patients,
+                'profile_picture': signed_media_url(doctor.profile_picture, self.request),
+            }
+            for doctor in doctors
+        ]
+
     @action(detail=True, methods=['post'], url_path='create-consultation')
     def create_consultation(self, request, pk=None):
         """
@@ -911,17 +1011,20 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             notification_type='appointment'
         )
 
+    def upcoming_queryset(self):
+        """The user's next five active appointments (also checked by check_query_plans)"""
+        return self.get_queryset().filter(
+            date_time__gt=timezone.now(),
+            status__in=['pending', 'confirmed']
+        ).order_by('date_time')[:5]
+
     @action(detail=False, methods=['get'], url_path='check-upcoming')
     def check_upcoming(self, request):
         """
         Check for upcoming appointments for the current user
         """
         try:
-            now = timezone.now()
-            upcoming = self.get_queryset().filter(
-                date_time__gt=now,
-                status__in=['pending', 'confirmed']
-            ).order_by('date_time')[:5]
+            upcoming = self.upcoming_queryset()
             
             serializer = self.get_serializer(upcoming, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -1189,6 +1292,19 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         if 'date_time' in serializer.validated_data and serializer.validated_data['date_time'] != instance.date_time:
             self.create_notification(updated_appointment, 'rescheduled')
 
+    def taken_slots_queryset(self, date):
+        """
+        Every user's active appointments on a date (also checked by
+        check_query_plans). A range rather than date_time__date so the
+        (status, date_time) index bounds both columns.
+        """
+        day_start = timezone.make_aware(datetime.combine(date, datetime.min.time()))
+        return Appointment.objects.filter(
+            date_time__gte=day_start,
+            date_time__lt=day_start + timedelta(days=1),
+            status__in=['pending', 'confirmed']  # Only consider active appointments
+        )
+
     @action(detail=False, methods=['get'], url_path='taken-slots', url_name='taken-slots')
     def taken_slots(self, request):
         """
@@ -1208,11 +1324,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             # Parse the date string to date object (without timezone)
             date_obj = datetime.strptime(date, '%Y-%m-%d').date()
             
-            # Get all appointments for the specified date using naive datetimes
-            appointments = Appointment.objects.filter(
-                date_time__date=date_obj,
-                status__in=['pending', 'confirmed']  # Only consider active appointments
-            )
+            appointments = self.taken_slots_queryset(date_obj)
             
             # Extract the time slots in both formats for frontend compatibility
             taken_slots = []
@@ -1438,24 +1550,116 @@ class NotificationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    def unread_queryset(self):
+        """The user's unread notifications (also checked by check_query_plans)"""
+        return self.get_queryset().filter(is_read=False)
+
+    def get_unread_count(self):
+        return self.unread_queryset().count()
+    
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
-        notifications = self.get_queryset()
-        notifications.update(is_read=True)
-        return Response({'status': 'success'})
+        self.unread_queryset().update(is_read=True)
+        return Response({'status': 'success', 'unread_count': 0})
+    
+    @action(detail=False, methods=['post'], url_path='bulk-read')
+    def bulk_mark_read(self, request):
+        """
+        Mark several notifications as read in a single UPDATE.
+        Accepts either an explicit list of `ids`, or a filter made of
+        `notification_type`, `before` and/or `after` (ISO date or datetime).
+        """
+        notifications = self.unread_queryset()
+        
+        ids = request.data.get('ids')
+        notification_type = request.data.get('notification_type')
+        before = request.data.get('before')
+        after = request.data.get('after')
+        
+        if ids is None and not any([notification_type, before, after]):
+            return Response(
+                {'error': 'Provide either ids or at least one of notification_type, before, after'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if ids is not None:
+            if not isinstance(ids, list):
+                return Response(
+                    {'error': 'ids must be a list of notification IDs'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            try:
+                ids = [int(notification_id) for notification_id in ids]
+            except (TypeError, ValueError):
+                return Response(
+                    {'error': 'ids must be a list of notification IDs'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            notifications = notifications.filter(pk__in=ids)
+        
+        if notification_type:
+            if notification_type not in dict(Notification.NOTIFICATION_TYPES):
+                return Response(
+                    {'error': f"Invalid notification_type. Must be one of: {', '.join(dict(Notification.NOTIFICATION_TYPES).keys())}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            notifications = notifications.filter(notification_type=notification_type)
+        
+        for param, lookup in (('before', 'created_at__lt'), ('after', 'created_at__gte')):
+            value = request.data.get(param)
+            if not value:
+                continue
+            parsed = parse_datetime(str(value))
+            if parsed is None:
+                parsed_date = parse_date(str(value))
+                if parsed_date is None:
+                    return Response(
+                        {'error': f'Invalid {param} value. Use an ISO date or datetime'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                parsed = datetime.combine(parsed_date, datetime.min.time())
+            if timezone.is_naive(parsed):
+                parsed = timezone.make_aware(parsed)
+            notifications = notifications.filter(**{lookup: parsed})
+        
+        updated = notifications.update(is_read=True)
+        return Response({
+            'status': 'success',
+            'updated': updated,
+            'unread_count': self.get_unread_count()
+        })
+    
+    @action(detail=False, methods=['get'], pagination_class=StandardResultsSetPagination)
+    def archived(self, request):
+        """
+        Get the current user's archived notifications, newest first, a page
+        at a time. Optional query parameters: period (YYYY-MM), page, page_size
+        """
+        archives = NotificationArchive.objects.filter(user=request.user).order_by('-period', '-id')
+
+        period = request.query_params.get('period')
+        if period:
+            try:
+                period_date = datetime.strptime(period, '%Y-%m').date()
+            except ValueError:
+                return Response(
+                    {'error': 'Invalid period format. Use YYYY-MM'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            archives = archives.filter(period=period_date)
+
+        page = self.paginate_queryset(ArchivedNotifications(archives))
+        return self.get_paginated_response(page)
     
     @action(detail=True, methods=['post'], url_path='read')
     def mark_read(self, request, pk=None):
-        try:
-            notification = self.get_queryset().get(pk=pk)
-            notification.is_read = True
-            notification.save()
-            return Response({'status': 'success'})
-        except Notification.DoesNotExist:
+        updated = self.get_queryset().filter(pk=pk).update(is_read=True)
+        if not updated:
             return Response(
                 {'error': 'Notification not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        return Response({'status': 'success', 'unread_count': self.get_unread_count()})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -1468,6 +1672,7 @@ def predict_scan(request):
                 {'error': 'No file provided. Please provide a file with either "file" or "image" field name.'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        validate_upload(file, ML_IMAGE_TYPES)
         
         # Use our ML service to analyze the X-ray
         result = ml_service.analyze_xray(file)
@@ -1516,6 +1721,8 @@ def predict_scan(request):
                 status=result.get('status_code', status.HTTP_500_INTERNAL_SERVER_ERROR)
             )
                 
+    except InvalidUpload as e:
+        return Response({'error': str(e.detail)}, status=e.status_code)
     except Exception as e:
         logger.error(f"Prediction error: {str(e)}")
         return Response(
@@ -1524,29 +1731,23 @@ def predict_scan(request):
         )
 
 def predict_view(request):
-    if request.method == 'POST' and request.FILES.get('xray'):
+    try:
+        uploaded_file = request.FILES.get('xray') if request.method == 'POST' else None
+    except InvalidUpload as e:
+        return render(request, 'error.html', {'error': str(e.detail)})
+
+    if uploaded_file:
         try:
-            # Get uploaded file
-            uploaded_file = request.FILES['xray']
-            
             # Print file details for debugging
             print(f"File name: {uploaded_file.name}")
             print(f"File size: {uploaded_file.size} bytes")
-            print(f"Content type: {uploaded_file.content_type}")
-            
-            # Ensure the content type is one of the accepted types
-            if uploaded_file.content_type not in ["image/jpeg", "image/png", "image/jpg"]:
-                # Default to image/jpeg if the browser doesn't provide the correct content type
-                if uploaded_file.name.lower().endswith(('.jpg', '.jpeg')):
-                    content_type = "image/jpeg"
-                elif uploaded_file.name.lower().endswith('.png'):
-                    content_type = "image/png"
-                else:
-                    return render(request, 'error.html', {
-                        'error': f"Unsupported file type: {uploaded_file.content_type}. Only JPEG, JPG, and PNG are supported."
-                    })
-            else:
-                content_type = uploaded_file.content_type
+            
+            # Check the real type from the file header; this also corrects
+            # the content type the browser sent before it's forwarded
+            try:
+                validate_upload(uploaded_file, ML_IMAGE_TYPES)
+            except InvalidUpload as e:
+                return render(request, 'error.html', {'error': str(e.detail)})
             
             # Use our ML service to analyze the X-ray
             result = ml_service.analyze_xray(uploaded_file)
@@ -1625,25 +1826,56 @@ def create_consultation(request, appointment_id):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-class DoctorViewSet(viewsets.ModelViewSet):
+class DoctorViewSet(UploadLimitMixin, viewsets.ModelViewSet):
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, DoctorSearchFilter]
     filterset_fields = ['specialty', 'gender', 'is_accepting_new_patients']
-    search_fields = ['user__first_name', 'user__last_name', 'specialty', 'bio', 'education', 'languages']
+    upload_types = PROFILE_PICTURE_TYPES
+    upload_max_size_setting = 'PROFILE_PICTURE_MAX_SIZE'
     
     def get_queryset(self):
+        queryset = Doctor.objects.select_related('user', 'user__profile')
+        
         # Return all doctors for admin users
         if self.request.user.is_staff or self.request.user.role == 'admin':
-            return Doctor.objects.all()
+            return queryset
         
         # Return only active doctors for other users
-        return Doctor.objects.filter(user__is_active=True)
+        return queryset.filter(user__is_active=True)
+    
+    def cached_directory_response(self, request, view_name, build):
+        """
+        Serve a directory listing from the cache, keyed by its filter parameters,
+        answering conditional requests with 304 when the client copy is current.
+        """
+        scope = 'staff' if (request.user.is_staff or request.user.role == 'admin') else 'public'
+        key = directory_cache_key(view_name, scope, request.query_params)
+        entry = get_cached_directory(key, build)
+        
+        if etag_matches(entry['etag'], request.META.get('HTTP_IF_NONE_MATCH')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(entry['data'])
+        response['ETag'] = entry['etag']
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    def list(self, request, *args, **kwargs):
+        return self.cached_directory_response(
+            request, 'list',
+            lambda: list(super(DoctorViewSet, self).list(request, *args, **kwargs).data)
+        )
     
     @action(detail=False, methods=['get'])
     def available(self, request):
         """Get all available doctors for consultation"""
+        return self.cached_directory_response(
+            request, 'available', lambda: self.get_available_doctors(request)
+        )
+    
+    def get_available_doctors(self, request):
         doctors = self.get_queryset().filter(user__is_active=True)
         
         # Add filtering by specialty
@@ -1661,10 +1893,17 @@ class DoctorViewSet(viewsets.ModelViewSet):
         if gender:
             doctors = doctors.filter(gender=gender)
             
-        # Add filtering by language
-        language = request.query_params.get('language', None)
-        if language:
-            doctors = doctors.filter(languages__icontains=language)
+        # Add filtering by one or more languages, e.g. ?language=english,french
+        # Doctors speaking any of them match unless language_match=all
+        languages = []
+        for value in request.query_params.getlist('language'):
+            languages.extend(normalize_languages(value))
+        if languages:
+            if request.query_params.get('language_match') == 'all':
+                for language in languages:
+                    doctors = doctors.filter(spoken_languages__language=language)
+            else:
+                doctors = doctors.filter(spoken_languages__language__in=languages).distinct()
             
         # Add filtering for accepting new patients
         accepting_patients = request.query_params.get('accepting_new_patients', None)
@@ -1673,21 +1912,12 @@ class DoctorViewSet(viewsets.ModelViewSet):
             doctors = doctors.filter(is_accepting_new_patients=is_accepting)
         
         serializer = self.get_serializer(doctors, many=True)
-        return Response(serializer.data)
+        return list(serializer.data)
     
     @action(detail=False, methods=['get'])
     def specialties(self, request):
         """Get list of all specialties with count of doctors"""
-        specialties = {}
-        for choice in Doctor.SPECIALTY_CHOICES:
-            specialty_code = choice[0]
-            specialty_name = choice[1]
-            count = Doctor.objects.filter(specialty=specialty_code, user__is_active=True).count()
-            specialties[specialty_code] = {
-                'name': specialty_name,
-                'count': count
-            }
-        return Response(specialties)
+        return Response(get_specialty_counts())
         
     @action(detail=True, methods=['get'])
     def consultations(self, request, pk=None):
@@ -1705,6 +1935,14 @@ class DoctorViewSet(viewsets.ModelViewSet):
         serializer = ConsultationSerializer(consultations, many=True)
         return Response(serializer.data)
         
+    @action(detail=True, methods=['get'])
+    def reviews(self, request, pk=None):
+        """Get patient reviews for a doctor"""
+        doctor = self.get_object()
+        reviews = DoctorReview.objects.filter(doctor=doctor.user).select_related('patient')
+        serializer = DoctorReviewSerializer(reviews, many=True)
+        return Response(serializer.data)
+        
     @action(detail=True, methods=['post'])
     def toggle_accepting_patients(self, request, pk=None):
         """Toggle whether doctor is accepting new patients"""
@@ -1767,7 +2005,7 @@ class AssistantViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 # Add this new viewset after the existing ones
-class XRayImageViewSet(viewsets.ModelViewSet):
+class XRayImageViewSet(UploadLimitMixin, viewsets.ModelViewSet):
     """
     API endpoints for accessing X-ray Images directly
     """
@@ -1778,10 +2016,8 @@ class XRayImageViewSet(viewsets.ModelViewSet):
         user = self.request.user
         # Doctors can see X-rays from their patients
         if getattr(user, 'role', '') == 'doctor':
-            return XRayImage.objects.filter(
-                Q(patient=user) |  # Their own X-rays
-                Q(appointment__doctor=user)  # X-rays from patients they've seen
-            ).order_by('-upload_date')
+            # Their own X-rays and those of patients they've seen
+            return XRayImage.objects.filter(XRayImage.doctor_access(user)).distinct().order_by('-upload_date')
         # Assistants can see X-rays they've uploaded
         elif getattr(user, 'role', '') == 'assistant':
             return XRayImage.objects.filter(
@@ -1863,6 +2099,8 @@ class XRayImageViewSet(viewsets.ModelViewSet):
                 logger.error(f"X-ray serializer validation errors: {serializer.errors}")
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
                 
+        except InvalidUpload as e:
+            return Response({"detail": str(e.detail)}, status=e.status_code)
         except Exception as e:
             logger = logging.getLogger(__name__)
             logger.exception(f"Error creating X-ray image: {str(e)}")
@@ -1871,6 +2109,221 @@ class XRayImageViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class UploadSessionViewSet(viewsets.GenericViewSet):
+    """
+    Resumable chunked uploads for large X-ray and scan images.
+
+    POST   /uploads/                 start a session (filename, total_size, sha256, purpose, metadata)
+    PUT    /uploads/{id}/parts/{n}/  send part n (1-based) as the raw request body
+    GET    /uploads/{id}/            see which parts have arrived
+    POST   /uploads/{id}/complete/   assemble, verify the checksum and create the image
+    DELETE /uploads/{id}/            abandon the upload
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+    purpose_types = {'xray': IMAGE_TYPES, 'scan': IMAGE_TYPES, 'dicom': DICOM_TYPES}
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session = serializer.save(
+            user=request.user,
+            chunk_size=settings.UPLOAD_CHUNK_SIZE,
+            expires_at=timezone.now() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+        )
+        return Response(self.get_serializer(session).data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    def destroy(self, request, pk=None):
+        session = self.get_object()
+        session.discard_parts()
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['put'], url_path=r'parts/(?P<part_number>[0-9]+)')
+    def upload_part(self, request, pk=None, part_number=None):
+        session = self.get_object()
+        if session.status != 'pending':
+            return Response({'error': f'Upload is {session.status}'}, status=status.HTTP_409_CONFLICT)
+        if session.expires_at < timezone.now():
+            return Response({'error': 'Upload session has expired'}, status=status.HTTP_410_GONE)
+
+        number = int(part_number)
+        if not 1 <= number <= session.total_parts:
+            return Response(
+                {'error': f'Part number must be between 1 and {session.total_parts}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Read the raw body in chunks; request.data would parse it into memory
+        try:
+            written = session.write_part(number, request.stream or BytesIO())
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if number == 1:
+            # Refuse a wrong file type now rather than after every part has arrived
+            types = self.purpose_types[session.purpose]
+            with open(session.part_path(1), 'rb') as f:
+                head = f.read(SNIFF_BYTES)
+            if detect_type(head) not in types:
+                os.remove(session.part_path(1))
+                return Response(
+                    {'error': f'Only {describe_types(types)} files are allowed'},
+                    status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+                )
+
+        return Response({
+            'part': number,
+            'size': written,
+            'received_parts': session.received_parts(),
+            'total_parts': session.total_parts
+        })
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        session = self.get_object()
+        if session.status != 'pending':
+            return Response({'error': f'Upload is {session.status}'}, status=status.HTTP_409_CONFLICT)
+        received = set(session.received_parts())
+        missing = [number for number in range(1, session.total_parts + 1) if number not in received]
+        if missing:
+            return Response(
+                {'error': 'Upload is incomplete', 'missing_parts': missing},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Claim the session so a retried request can't assemble it twice
+        claimed = UploadSession.objects.filter(pk=session.pk, status='pending').update(status='assembling')
+        if not claimed:
+            session.refresh_from_db(fields=['status'])
+            return Response({'error': f'Upload is {session.status}'}, status=status.HTTP_409_CONFLICT)
+
+        try:
+            assembled, digest = session.assemble()
+            with assembled:
+                if digest != session.sha256:
+                    session.status = 'failed'
+                    session.save(update_fields=['status'])
+                    session.discard_parts()
+                    return Response(
+                        {'error': 'Checksum mismatch, please upload the file again'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                file = File(assembled, name=session.filename)
+                validate_upload(file, self.purpose_types[session.purpose], settings.UPLOAD_MAX_SIZE)
+                with transaction.atomic():
+                    result = self.create_upload_target(session, file)
+        except InvalidUpload as e:
+            UploadSession.objects.filter(pk=session.pk).update(status='failed')
+            session.discard_parts()
+            return Response({'error': str(e.detail)}, status=e.status_code)
+        except IntegrityError:
+            # A record the metadata points at was deleted after it was checked
+            UploadSession.objects.filter(pk=session.pk).update(status='failed')
+            session.discard_parts()
+            return Response(
+                {'error': 'The appointment, patient or assistant for this upload could not be found'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except (InvalidDicomError, DuplicateDicomError) as e:
+            UploadSession.objects.filter(pk=session.pk).update(status='failed')
+            session.discard_parts()
+            return Response({'error': f'DICOM file rejected: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.exception(f"Error completing upload {session.pk}: {str(e)}")
+            UploadSession.objects.filter(pk=session.pk).update(status='pending')
+            return Response(
+                {'error': f'Error completing upload: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        session.status = 'complete'
+        session.result_id = result.pk
+        session.completed_at = timezone.now()
+        session.save(update_fields=['status', 'result_id', 'completed_at'])
+        session.discard_parts()
+
+        if session.purpose == 'xray':
+            data = XRayImageSerializer(result, context={'request': request}).data
+        elif session.purpose == 'dicom':
+            data = DicomInstanceSerializer(result, context={'request': request}).data
+        else:
+            data = ScanSerializer(result, context={'request': request}).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def create_upload_target(self, session, file):
+        metadata = session.metadata
+        if session.purpose == 'xray':
+            missing = [
+                key for key, model in (('appointment', Appointment), ('patient', User), ('assistant', User))
+                if not model.objects.filter(pk=metadata[key]).exists()
+            ]
+            if missing:
+                raise InvalidUpload(f"The {' and '.join(missing)} for this upload could not be found")
+            return XRayImage.objects.create(
+                appointment_id=metadata['appointment'],
+                patient_id=metadata['patient'],
+                assistant_id=metadata['assistant'],
+                notes=metadata.get('notes'),
+                image=file
+            )
+        if session.purpose == 'dicom':
+            return ingest_dicom(file, session.user)
+        return Scan.objects.create(user=session.user, image=file, notes=metadata.get('notes'))
+
+class DicomInstanceViewSet(UploadLimitMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    DICOM uploads. Only the header is parsed during the request; the preview,
+    the ML rendition and the linked Scan are produced in the background.
+    """
+    serializer_class = DicomInstanceSerializer
+    permission_classes = [IsAuthenticated]
+    upload_types = DICOM_TYPES
+    upload_max_size_setting = 'DICOM_UPLOAD_MAX_SIZE'
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = DicomInstance.objects.all()
+        if not (user.is_staff or getattr(user, 'role', '') == 'admin'):
+            queryset = queryset.filter(uploaded_by=user)
+
+        params = self.request.query_params
+        for field in ('patient_id', 'study_instance_uid', 'series_instance_uid', 'modality', 'status'):
+            if params.get(field):
+                queryset = queryset.filter(**{field: params[field]})
+        for param, lookup in (('study_date_after', 'study_date__gte'), ('study_date_before', 'study_date__lte')):
+            if not params.get(param):
+                continue
+            try:
+                value = parse_date(params[param])
+            except ValueError:
+                value = None
+            if value is None:
+                raise ParseError(f'Invalid {param} value. Use YYYY-MM-DD')
+            queryset = queryset.filter(**{lookup: value})
+        return queryset
+
+    def create(self, request):
+        file = request.FILES.get('file')
+        if not file:
+            return Response({'error': 'No DICOM file provided'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            instance = ingest_dicom(file, request.user)
+        except InvalidDicomError as e:
+            return Response({'error': f'Invalid DICOM file: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+        except DuplicateDicomError as e:
+            return Response(
+                {'error': 'This DICOM image has already been uploaded', 'id': e.instance.id},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(self.get_serializer(instance).data, status=status.HTTP_201_CREATED)
+
 class CreatorViewSet(viewsets.ModelViewSet):
     """
     API endpoints for Creators/Team Members
@@ -1918,10 +2371,6 @@ def proxy_image(request):
     """
     Proxy for securely fetching images from HTTP sources to avoid mixed content errors
     """
-    import requests
-    from django.http import HttpResponse, FileResponse
-    from io import BytesIO
-    import mimetypes
     import urllib.parse
     import logging
     
@@ -1959,38 +2408,29 @@ def proxy_image(request):
                 headers['Authorization'] = auth_header
                 logger.info("Adding authorization header to media fetch request")
         
-        # Fetch the image
-        logger.info(f"Fetching image with headers: {headers}")
-        response = requests.get(url, stream=True, timeout=10, headers=headers)
-        
-        if response.status_code != 200:
-            logger.error(f"Failed to fetch image: {response.status_code}")
-            return Response(
-                {'error': f'Failed to fetch image, status code: {response.status_code}'}, 
-                status=status.HTTP_502_BAD_GATEWAY
-            )
-        
-        # Determine content type
-        content_type = response.headers.get('Content-Type')
-        if not content_type or not content_type.startswith('image/'):
-            # Try to guess from URL if server didn't provide content type
-            content_type, _ = mimetypes.guess_type(url)
-            if not content_type or not content_type.startswith('image/'):
-                content_type = 'image/jpeg'  # Default to JPEG
-        
-        # Create file-like object from image data
-        image_data = BytesIO(response.content)
-        
-        # Return the image with proper content type
-        response = FileResponse(image_data, content_type=content_type)
+        # Stream the image through the on-disk proxy cache. Responses fetched
+        # with the caller's credentials are never stored in the shared cache.
+        response = proxy_image_response(
+            url,
+            headers=headers,
+            if_none_match=request.META.get('HTTP_IF_NONE_MATCH'),
+            cacheable='Authorization' not in headers
+        )
         
         # Add CORS headers to ensure the image can be loaded by the frontend
         response['Access-Control-Allow-Origin'] = '*'
         response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
         response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+        response['Access-Control-Expose-Headers'] = 'ETag'
         
         return response
         
+    except UpstreamError as e:
+        logger.error(f"Failed to fetch image: {e.status_code}")
+        return Response(
+            {'error': str(e)}, 
+            status=status.HTTP_502_BAD_GATEWAY
+        )
     except Exception as e:
         logger.error(f"Error proxying image: {str(e)}")
         return Response(
@@ -2017,3 +2457,17 @@ def upgrade_subscription(request):
         return Response({
             'error': str(e)
         }, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def database_pool_stats(request):
+    """
+    Connection pool metrics (checkouts, waits, timeouts) of the worker
+    process that serves the request
+    """
+    if not (request.user.is_staff or request.user.role == 'admin'):
+        return Response(
+            {'error': 'Only administrators can view database metrics'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    return Response({'pid': os.getpid(), 'pools': pool_stats()})
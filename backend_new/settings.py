@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from datetime import timedelta
 import dj_database_url
 from dotenv import load_dotenv
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'rest_framework_simplejwt',
@@ -64,6 +66,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ReplicaPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -93,13 +96,45 @@ WSGI_APPLICATION = 'backend_new.wsgi.application'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
 # Default to SQLite
+SQLITE_PATH = Path(os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'))
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': SQLITE_PATH,
     }
 }
 
+# SQLite tuning for single-node deployments, applied to every new connection.
+# WAL lets readers carry on while a worker writes and only fsyncs at
+# checkpoints (synchronous=NORMAL). Transactions take the write lock up front
+# (IMMEDIATE) so a second writer waits out SQLITE_BUSY_TIMEOUT seconds instead
+# of failing with "database is locked" when it tries to upgrade a read lock.
+SQLITE_TUNING = os.environ.get('SQLITE_TUNING', 'True') == 'True'
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', '20'))
+# Switching to WAL is recorded in the database file itself and adds -wal/-shm
+# files beside it, so it is off by default for the db.sqlite3 committed in the
+# checkout; deployments point SQLITE_PATH outside it (or set SQLITE_WAL=True)
+SQLITE_WAL = os.environ.get(
+    'SQLITE_WAL', str(not SQLITE_PATH.resolve().is_relative_to(BASE_DIR.resolve()))
+) == 'True'
+# Bytes of the database file memory-mapped for reads (default 256MB)
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+# Page cache per connection in KB (default 64MB)
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', '65536'))
+
+if SQLITE_TUNING:
+    DATABASES['default']['OPTIONS'] = {
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': SQLITE_BUSY_TIMEOUT,
+        'init_command': ';'.join([
+            # synchronous=NORMAL is only crash-safe with WAL
+            *(['PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL'] if SQLITE_WAL else []),
+            f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}',
+            f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}',
+            'PRAGMA temp_store=MEMORY',
+        ]),
+    }
+
 # Use DATABASE_URL environment variable if available (for Railway deployment)
 if os.environ.get('DATABASE_URL'):
     DATABASES['default'] = dj_database_url.config(
@@ -110,6 +145,95 @@ if os.environ.get('DATABASE_URL'):
     )
     print("Using DATABASE_URL from environment")
 
+# Read replicas, as a comma-separated list of database URLs. Reads are routed
+# to a replica unless the request has written to the primary, and fall back to the
+# primary when a replica is unreachable or lagging (see api/db_router.py)
+DATABASE_REPLICAS = []
+for index, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), start=1):
+    alias = f'replica_{index}'
+    DATABASES[alias] = dj_database_url.parse(
+        url.strip(),
+        conn_max_age=600,
+        conn_health_checks=True,
+        ssl_require=False,
+    )
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['api.db_router.PrimaryReplicaRouter']
+# Seconds of replication lag after which a replica stops receiving reads
+DATABASE_REPLICA_MAX_LAG = float(os.environ.get('DATABASE_REPLICA_MAX_LAG', '5'))
+# How often each process re-checks a replica's lag and availability
+DATABASE_REPLICA_CHECK_INTERVAL = float(os.environ.get('DATABASE_REPLICA_CHECK_INTERVAL', '10'))
+# How long a user's reads stay on the primary after they write (a cache entry)
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DATABASE_REPLICA_PIN_SECONDS', '15'))
+
+# Connection pooling for PostgreSQL (psycopg 3). Each process keeps its own
+# pool, so workers x DATABASE_POOL_MAX_SIZE must stay below the server's
+# max_connections. Connections are checked before checkout when
+# CONN_HEALTH_CHECKS is on; metrics are served at /api/db-pool-stats/
+DATABASE_POOL = os.environ.get('DATABASE_POOL', 'True') == 'True'
+DATABASE_POOL_MIN_SIZE = int(os.environ.get('DATABASE_POOL_MIN_SIZE', '1'))
+DATABASE_POOL_MAX_SIZE = int(os.environ.get('DATABASE_POOL_MAX_SIZE', '4'))
+# Seconds a checkout waits for a free connection before failing
+DATABASE_POOL_TIMEOUT = float(os.environ.get('DATABASE_POOL_TIMEOUT', '10'))
+# Set when connecting through a transaction-mode pooler such as PgBouncer
+DATABASE_TRANSACTION_POOLER = os.environ.get('DATABASE_TRANSACTION_POOLER', 'False') == 'True'
+# psycopg prepares statements it runs repeatedly on the server connection; a
+# transaction-mode pooler (PgBouncer before 1.21, or without
+# max_prepared_statements) can't follow them, so they default to off behind one
+DATABASE_PREPARED_STATEMENTS = os.environ.get(
+    'DATABASE_PREPARED_STATEMENTS', str(not DATABASE_TRANSACTION_POOLER)
+) == 'True'
+
+for alias, config in DATABASES.items():
+    if config['ENGINE'] != 'django.db.backends.postgresql':
+        continue
+    if DATABASE_POOL:
+        # Pooled connections are returned after each request instead of
+        # being kept open by CONN_MAX_AGE
+        config['CONN_MAX_AGE'] = 0
+        config.setdefault('OPTIONS', {})['pool'] = {
+            'name': alias,
+            'min_size': DATABASE_POOL_MIN_SIZE,
+            'max_size': DATABASE_POOL_MAX_SIZE,
+            'timeout': DATABASE_POOL_TIMEOUT,
+            'max_idle': 300,
+            'max_lifetime': 1800,
+        }
+    if DATABASE_TRANSACTION_POOLER:
+        # The pooler may hand each transaction to a different server
+        # connection, so named cursors held across transactions break
+        config['DISABLE_SERVER_SIDE_CURSORS'] = True
+    if not DATABASE_PREPARED_STATEMENTS:
+        config.setdefault('OPTIONS', {})['prepare_threshold'] = None
+
+
+# Cache
+# Uses Redis when REDIS_URL is set so invalidations reach every worker,
+# otherwise falls back to a per-process in-memory cache
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# How long cached doctor directory data lives before it is rebuilt, in seconds
+DOCTOR_DIRECTORY_CACHE_TTL = int(os.environ.get('DOCTOR_DIRECTORY_CACHE_TTL', 300))
+
+# Number of ranked doctors suggested for a scan consultation, and how long
+# each specialty's suggestions are cached, in seconds
+DOCTOR_SUGGESTION_LIMIT = int(os.environ.get('DOCTOR_SUGGESTION_LIMIT', 5))
+DOCTOR_SUGGESTION_CACHE_TTL = int(os.environ.get('DOCTOR_SUGGESTION_CACHE_TTL', 60))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -169,6 +293,58 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are stored content-addressed (named by their SHA-256) so identical
+# files are kept once; thumbnails are rendered under fixed names next to them
+STORAGES = {
+    'default': {'BACKEND': 'api.storage.ContentAddressedStorage'},
+    'derivatives': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# How /api/media/ hands files over once access is checked: 'django' streams
+# them from the app, 'nginx' uses X-Accel-Redirect to an internal location
+# aliased to MEDIA_ROOT, 'sendfile' sets X-Sendfile (Apache, lighttpd)
+MEDIA_DELIVERY = os.environ.get('MEDIA_DELIVERY', 'django')
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', 7 * 24 * 3600))
+# collect_media_garbage: where --quarantine moves orphaned files, and how old
+# a file must be before it is considered (its row may not be committed yet)
+MEDIA_QUARANTINE_DIR = os.environ.get('MEDIA_QUARANTINE_DIR', os.path.join(BASE_DIR, 'media_quarantine'))
+MEDIA_GC_MIN_AGE_HOURS = float(os.environ.get('MEDIA_GC_MIN_AGE_HOURS', 24))
+# maintain_db: where --archive writes purged rows, and the checkpoint that
+# lets an interrupted run be resumed
+DB_PURGE_ARCHIVE_DIR = os.environ.get('DB_PURGE_ARCHIVE_DIR', os.path.join(BASE_DIR, 'purge_archive'))
+DB_PURGE_STATE_FILE = os.environ.get('DB_PURGE_STATE_FILE', os.path.join(BASE_DIR, 'maintain_db_state.json'))
+# Resumable uploads: parts are staged on disk until the upload is completed
+UPLOAD_SESSION_DIR = os.environ.get('UPLOAD_SESSION_DIR', os.path.join(BASE_DIR, 'upload_sessions'))
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024))
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 500 * 1024 * 1024))
+UPLOAD_SESSION_TTL_HOURS = int(os.environ.get('UPLOAD_SESSION_TTL_HOURS', 24))
+
+# Uploads are checked by magic bytes as they stream in; ValidatingUploadHandler
+# aborts a file once it passes the size limit of the DRF view it was sent to.
+# Views without UploadLimitMixin (the admin) validate uploads themselves
+FILE_UPLOAD_HANDLERS = [
+    'api.validators.ValidatingUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+IMAGE_UPLOAD_MAX_SIZE = int(os.environ.get('IMAGE_UPLOAD_MAX_SIZE', 20 * 1024 * 1024))
+PROFILE_PICTURE_MAX_SIZE = int(os.environ.get('PROFILE_PICTURE_MAX_SIZE', 5 * 1024 * 1024))
+DICOM_UPLOAD_MAX_SIZE = int(os.environ.get('DICOM_UPLOAD_MAX_SIZE', 200 * 1024 * 1024))
+# Width x height above which an image is refused (decompression bombs)
+IMAGE_UPLOAD_MAX_PIXELS = int(os.environ.get('IMAGE_UPLOAD_MAX_PIXELS', 50_000_000))
+# Strip metadata from and losslessly recompress JPEG/PNG uploads on the workers
+IMAGE_OPTIMIZE_UPLOADS = os.environ.get('IMAGE_OPTIMIZE_UPLOADS', 'True') == 'True'
+
+# DICOM renditions: JPEG preview for the UI, 8-bit PNG for the ML service
+DICOM_PREVIEW_SIZE = int(os.environ.get('DICOM_PREVIEW_SIZE', 512))
+DICOM_RENDITION_SIZE = int(os.environ.get('DICOM_RENDITION_SIZE', 1024))
+
+# Signed media URLs (?exp=&sig=) grant access without an Authorization header
+MEDIA_URL_SIGNING_KEY = os.environ.get('MEDIA_URL_SIGNING_KEY', SECRET_KEY)
+MEDIA_URL_TTL = int(os.environ.get('MEDIA_URL_TTL', 3600))
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -238,6 +414,39 @@ REST_FRAMEWORK = {
 ML_SERVICE_URL = os.environ.get('ML_SERVICE_URL', 'http://localhost:8001')
 ML_API_URL = os.environ.get('ML_API_URL', 'https://sage-production.up.railway.app')
 
+# Notification retention: read notifications older than this are moved
+# into compressed NotificationArchive rows
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 90))
+
+# Image proxy: fetched images are kept in a size-capped on-disk LRU cache
+IMAGE_PROXY_CACHE_DIR = os.environ.get(
+    'IMAGE_PROXY_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'image_proxy_cache')
+)
+IMAGE_PROXY_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_PROXY_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+IMAGE_PROXY_MAX_IMAGE_BYTES = int(os.environ.get('IMAGE_PROXY_MAX_IMAGE_BYTES', 20 * 1024 * 1024))
+# Seconds between scans of the cache directory when a process's running size
+# total stays under the cap; other processes' writes are only seen by a scan
+IMAGE_PROXY_EVICT_INTERVAL = int(os.environ.get('IMAGE_PROXY_EVICT_INTERVAL', 300))
+# Freshness used when the upstream sends no Cache-Control/Expires
+IMAGE_PROXY_DEFAULT_TTL = int(os.environ.get('IMAGE_PROXY_DEFAULT_TTL', 3600))
+# Upstream fetches share a keep-alive pool; each host gets at most
+# IMAGE_PROXY_MAX_CONNECTIONS_PER_HOST concurrent fetches and callers queue
+# up to IMAGE_PROXY_QUEUE_TIMEOUT seconds for a free slot. The pool, the caps
+# and the coalescing of concurrent misses are per process
+IMAGE_PROXY_MAX_CONNECTIONS_PER_HOST = int(os.environ.get('IMAGE_PROXY_MAX_CONNECTIONS_PER_HOST', 4))
+IMAGE_PROXY_POOL_HOSTS = int(os.environ.get('IMAGE_PROXY_POOL_HOSTS', 16))
+IMAGE_PROXY_CONNECT_TIMEOUT = 3
+IMAGE_PROXY_TIMEOUT = 10
+IMAGE_PROXY_QUEUE_TIMEOUT = 5
+
+# Celery broker; image optimization, thumbnails and DICOM processing run on the workers
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+# Run tasks inline in the request that queued them, for local development only
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', 'False') == 'True'
+
+# Bounding boxes (px) of the thumbnails rendered for profile pictures
+PROFILE_THUMBNAIL_SIZES = {'small': 64, 'medium': 256, 'large': 512}
+
 # JWT settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -17,8 +17,6 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.http import HttpResponse
-from django.conf import settings
-from django.conf.urls.static import static
 
 # Simple health check view
 def health_check(request):
@@ -30,6 +28,4 @@ urlpatterns = [
     path('health/', health_check, name='health_check'),  # Add health check URL
 ]
 
-# Serve media files in development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Media is only served by api.media.MediaView, which checks access